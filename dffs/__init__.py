@@ -1 +1,9 @@
-from .utils import join_pipelines, get_git_root, get_dir_path
+# Imported on first access, so that entry points that don't need them (e.g. `dffs.client`) start quickly
+LAZY = ('join_pipelines', 'get_git_root', 'get_dir_path')
+
+
+def __getattr__(name):
+    if name in LAZY:
+        from . import utils
+        return getattr(utils, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
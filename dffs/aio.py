@@ -0,0 +1,302 @@
+"""``asyncio`` counterpart of :func:`dffs.utils.join_pipelines`, for running many comparisons in one event loop.
+
+Pipelines and comparators are started with :func:`asyncio.create_subprocess_exec` (or ``_shell``), and waited on (and
+their outputs and stderr relayed) by the event loop, so concurrent comparisons don't each need threads. Pipelines'
+outputs reach the comparator through anonymous pipes, passed as ``/dev/fd/<n>`` paths (so, unlike the named pipes
+``dffs.utils`` uses, nothing blocks the loop on ``open``).
+
+Example::
+
+    async def main(pairs):
+        returncodes = await gather(
+            (join_pipelines(['diff'], ['jq -S .'], ['jq -S .'], inputs=(a, b), out=BytesIO()) for a, b in pairs),
+            jobs=32,
+        )
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import shlex
+import sys
+from asyncio.subprocess import PIPE, STDOUT
+from os import fspath, PathLike
+from typing import Awaitable, BinaryIO, Callable, Iterable, TypeVar
+
+from dffs.base import err
+from dffs.pipeline import direct_args
+from dffs.transforms import Stage, describe, is_py_stage
+from dffs.utils import CHUNK_SIZE, DEFAULT_SPOOL_SIZE, Comparator, ComparatorError, Input, OutputGate, _failed_procs, _log_failures
+
+T = TypeVar('T')
+
+
+class Process:
+    """A pipeline process started by :func:`spawn`; like a :class:`~subprocess.Popen`, it has ``args`` and a
+    ``returncode`` (once :meth:`wait`-ed for), and saves its stderr in ``stderr_output``."""
+
+    def __init__(self, args: Stage, proc: asyncio.subprocess.Process, tasks: list[asyncio.Task]):
+        self.args = args
+        self.proc = proc
+        self.tasks = tasks
+        self.stderr_output = b''
+
+    @property
+    def returncode(self) -> int | None:
+        return self.proc.returncode
+
+    async def wait(self) -> int:
+        returncode = await self.proc.wait()
+        for task in self.tasks:
+            output = await task
+            if output:
+                self.stderr_output = output
+        return returncode
+
+    def terminate(self) -> None:
+        """Stop the process if it's still running (e.g. once an early-stopping comparator is done with its output)."""
+        if self.proc.returncode is None:
+            try:
+                self.proc.terminate()
+            except ProcessLookupError:
+                pass
+
+    def kill(self) -> None:
+        if self.proc.returncode is None:
+            try:
+                self.proc.kill()
+            except ProcessLookupError:
+                pass
+        for task in self.tasks:
+            task.cancel()
+
+
+async def _feed(stdin: asyncio.StreamWriter, data: bytes) -> None:
+    try:
+        stdin.write(data)
+        await stdin.drain()
+        stdin.close()
+    except (BrokenPipeError, ConnectionResetError):
+        # The first command exited without reading all of its input
+        pass
+
+
+async def spawn(
+    cmds: list[Stage],
+    out: int,
+    stdin: bytes | BinaryIO | None = None,
+    both: bool = False,
+    shell: bool = True,
+    executable: str | None = None,
+    direct: bool = True,
+    **kwargs,
+) -> list[Process]:
+    """Start ``cmds`` as a pipeline (like ``cmd1 | cmd2 | …``), writing to file descriptor ``out`` (which is closed
+    in this process once the last command has started); see :func:`dffs.pipeline.spawn`. Python stages aren't
+    supported."""
+    procs = []
+    prev: int | None = None  # Read end of the previous command's stdout
+    try:
+        for idx, cmd in enumerate(cmds):
+            if is_py_stage(cmd):
+                raise ValueError(f"Python stages aren't supported by dffs.aio (use dffs.utils.join_pipelines): {describe(cmd)}")
+            is_last = idx + 1 == len(cmds)
+            feed = prev is None and isinstance(stdin, bytes)
+            if prev is not None:
+                proc_stdin, prev = prev, None
+            else:
+                proc_stdin = PIPE if feed else stdin
+            if is_last:
+                stdout, out = out, None
+            else:
+                read_end, stdout = os.pipe()
+            try:
+                popen_kwargs = dict(stdin=proc_stdin, stdout=stdout, stderr=STDOUT if both else PIPE, **kwargs)
+                args = None
+                if not shell:
+                    args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+                elif direct and isinstance(cmd, str):
+                    resolved = direct_args(cmd, kwargs['env'].get('PATH') if kwargs.get('env') else None)
+                    if resolved:
+                        popen_kwargs['executable'], args = resolved
+                if args is not None:
+                    proc = await asyncio.create_subprocess_exec(*args, **popen_kwargs)
+                else:
+                    proc = await asyncio.create_subprocess_shell(
+                        cmd if isinstance(cmd, str) else shlex.join(cmd),
+                        executable=executable,
+                        **popen_kwargs,
+                    )
+            finally:
+                # The child has its own copies of its stdin and stdout
+                os.close(stdout)
+                if isinstance(proc_stdin, int) and proc_stdin != PIPE:
+                    os.close(proc_stdin)
+                elif proc_stdin is not None and proc_stdin != PIPE:
+                    proc_stdin.close()
+                if not is_last:
+                    prev = read_end
+            tasks = []
+            if feed:
+                tasks.append(asyncio.ensure_future(_feed(proc.stdin, stdin)))
+            if not both:
+                tasks.append(asyncio.ensure_future(proc.stderr.read()))
+            procs.append(Process(cmd, proc, tasks))
+    except BaseException:
+        for fd in (prev, out):
+            if fd is not None:
+                os.close(fd)
+        for proc in procs:
+            proc.kill()
+        raise
+    return procs
+
+
+async def join_pipelines(
+    base_cmd: list[str] | Comparator,
+    cmds1: list[Stage] | PathLike,
+    cmds2: list[Stage] | PathLike,
+    verbose: bool = False,
+    executable: str | None = None,
+    both: bool = False,
+    pipefail: bool = False,
+    shell: bool = True,
+    out: BinaryIO | None = None,
+    spool_size: int = DEFAULT_SPOOL_SIZE,
+    inputs: tuple[Input, Input] = (None, None),
+    log: Callable[[str], None] | None = None,
+    **kwargs,
+) -> int:
+    """Run two pipelines, and compare their outputs with ``base_cmd``; see :func:`dffs.utils.join_pipelines`.
+
+    Exit codes, output suppression (when a pipeline fails), failure logging, and early-stopping comparators' handling
+    are the same. Pipeline stages must be commands (not Python stages), and caching and timings aren't supported.
+    In-process comparators run in a thread (via :func:`asyncio.to_thread`).
+
+    Args:
+        base_cmd: Command taking two positional args (paths to the pipelines' outputs), or an in-process ``Comparator``
+        cmds1: First sequence of commands to pipe together, or a path (``PathLike``) to an already-computed output
+        cmds2: Second sequence of commands to pipe together, or a path (``PathLike``) to an already-computed output
+        verbose: Whether to log commands being executed
+        executable: Shell to run commands that need one with; defaults to ``/bin/sh``
+        both: Merge stderr into stdout in pipeline commands (like shell `2>&1`)
+        pipefail: Check all processes for errors (like bash's `set -o pipefail`), not just each pipeline's last
+        shell: Run commands via ``executable`` (else ``str`` commands are split with ``shlex``)
+        out: Binary stream to write ``base_cmd``'s output to; defaults to ``sys.stdout.buffer``
+        spool_size: Bytes of ``base_cmd`` output to buffer in memory (before spilling to a temporary file) while the
+            pipelines are still running
+        inputs: Data (or a file) to feed to each pipeline's first command, or a callable returning it, or ``None`` to
+            leave its stdin inherited
+        log: Function to print verbose and error messages with; defaults to printing to stderr
+        **kwargs: Additional arguments passed to ``asyncio.create_subprocess_*``
+
+    Returns:
+        Exit code: ``base_cmd``'s, unless a pipeline failed, in which case the first failed command's
+    """
+    if log is None:
+        log = err
+    if out is None:
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+
+    in_process = callable(base_cmd)
+    stops_early = getattr(base_cmd, 'stops_early', False)
+    paths: list[str | int] = []  # Comparator inputs: paths, or read ends of pipelines' outputs
+    pipeline_groups = []  # List of (cmds, procs) tuples
+    try:
+        for cmds, stdin in zip((cmds1, cmds2), inputs):
+            if isinstance(cmds, PathLike):
+                paths.append(fspath(cmds))
+                continue
+            if verbose:
+                log(f"Running pipeline: {' | '.join(map(describe, cmds))}")
+            if callable(stdin):
+                stdin = stdin()
+            fd_r, fd_w = os.pipe()
+            paths.append(fd_r)
+            procs = await spawn(cmds, fd_w, stdin=stdin, both=both, shell=shell, executable=executable, **kwargs)
+            pipeline_groups.append((cmds, procs))
+
+        all_pipeline_procs = [ p for _, procs in pipeline_groups for p in procs ]
+        gate = OutputGate(out, spool_size=spool_size)
+
+        async def wait_pipelines():
+            await asyncio.gather(*( p.wait() for p in all_pipeline_procs ))
+            gate.resolve(not _failed_procs(pipeline_groups, pipefail, stopped=stops_early))
+
+        error = None  # Raised by an in-process comparator (see `ComparatorError`)
+        waiter = asyncio.ensure_future(wait_pipelines())
+        try:
+            if in_process:
+                ins = [ open(path, 'rb') for path in paths ]
+                paths = []
+                try:
+                    returncode = await asyncio.to_thread(base_cmd, *ins, gate)
+                except ComparatorError as e:
+                    error = e
+                    returncode = e.returncode
+                    stops_early = True
+                finally:
+                    for f in ins:
+                        f.close()
+            else:
+                fds = [ path for path in paths if isinstance(path, int) ]
+                proc = await asyncio.create_subprocess_exec(
+                    *base_cmd,
+                    *( f'/dev/fd/{path}' if isinstance(path, int) else path for path in paths ),
+                    stdout=PIPE,
+                    pass_fds=fds,
+                )
+                for fd in fds:
+                    os.close(fd)
+                paths = []
+                try:
+                    while chunk := await proc.stdout.read(CHUNK_SIZE):
+                        gate.write(chunk)
+                    returncode = await proc.wait()
+                except BaseException:
+                    if proc.returncode is None:
+                        proc.kill()
+                    raise
+            if stops_early:
+                for p in all_pipeline_procs:
+                    p.terminate()
+            await waiter
+        except BaseException:
+            waiter.cancel()
+            raise
+    except BaseException:
+        for path in paths:
+            if isinstance(path, int):
+                os.close(path)
+        for _, procs in pipeline_groups:
+            for p in procs:
+                p.kill()
+        raise
+
+    failed = _failed_procs(pipeline_groups, pipefail, stopped=stops_early)
+    _log_failures(failed, log)
+    if error:
+        log(str(error))
+        return error.returncode
+    # If any pipeline failed, base_cmd output was suppressed; return the first error code
+    if failed:
+        return failed[0][1].returncode
+    return returncode
+
+
+async def gather(aws: Iterable[Awaitable[T]], jobs: int | None = None) -> list[T]:
+    """Await ``aws`` (e.g. :func:`join_pipelines` calls), at most ``jobs`` at a time (default: one per CPU), and
+    return their results in order.
+
+    Bounding concurrency bounds the processes and file descriptors in use at once; coroutines aren't started until a
+    slot is free.
+    """
+    semaphore = asyncio.Semaphore(jobs or os.cpu_count() or 1)
+
+    async def run(aw: Awaitable[T]) -> T:
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*( run(aw) for aw in aws ))
@@ -0,0 +1,75 @@
+"""Small process, logging, and parsing helpers, used on every CLI invocation.
+
+These cover the few ``utz`` helpers ``dffs`` needs; importing ``utz`` imports most of its optional dependencies (e.g.
+IPython), which took longer than the rest of a typical comparison.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from functools import partial
+from os.path import join
+from subprocess import check_output
+from typing import Iterator
+
+SIZE_RGX = re.compile(r'(?P<base>[\d.]+)(?P<suffix>[kmgb])(?P<binary>i?)', flags=re.IGNORECASE)
+# Size suffixes' multipliers: decimal (``K``, ``M``, ``G``/``B``), or binary with an ``i`` (``Ki``, ``Mi``, ``Gi``)
+DECIMAL = {'k': 10 ** 3, 'm': 10 ** 6, 'g': 10 ** 9, 'b': 10 ** 9}
+BINARY = {'k': 2 ** 10, 'm': 2 ** 20, 'g': 2 ** 30}
+
+
+# Print to stderr
+err = partial(print, file=sys.stderr)
+
+
+@contextmanager
+def named_pipes(n: int = 1) -> Iterator[list[str]]:
+    """Paths to ``n`` named pipes, in a temporary directory that's removed on exit."""
+    dirname = tempfile.mkdtemp()
+    try:
+        paths = [ join(dirname, f'named_pipe{idx}') for idx in range(n) ]
+        for path in paths:
+            os.mkfifo(path)
+        yield paths
+    finally:
+        shutil.rmtree(dirname)
+
+
+def line(*cmd: str) -> str:
+    """Run ``cmd``, and return its (single line of) output."""
+    lines = check_output(cmd, text=True).splitlines()
+    if len(lines) != 1:
+        raise ValueError(f"Expected 1 line of output from `{' '.join(cmd)}`, found {len(lines)}")
+    return lines[0]
+
+
+def parse_size(value: str | int) -> int:
+    """Parse a size like ``500M`` (decimal: 500·10⁶), ``1Gi`` (binary: 2³⁰), or ``1024``."""
+    if isinstance(value, int):
+        return value
+    m = SIZE_RGX.fullmatch(value)
+    if m:
+        orders = BINARY if m['binary'] else DECIMAL
+        suffix = m['suffix'].lower()
+        if suffix not in orders:
+            raise ValueError(f'Failed to parse size "{value}"')
+        return int(float(m['base']) * orders[suffix])
+    try:
+        return int(float(value))
+    except ValueError:
+        raise ValueError(f'Failed to parse size "{value}"')
+
+
+def fmt_size(size: int) -> str:
+    """Format a byte count in human-readable (binary) units."""
+    if size < 1024:
+        return f'{size}B'
+    for unit in ('KiB', 'MiB', 'GiB'):
+        size /= 1024
+        if size < 1024 or unit == 'GiB':
+            return f'{size:.1f}{unit}'
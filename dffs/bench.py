@@ -0,0 +1,325 @@
+"""Benchmarks of ``join_pipelines`` and the CLIs over synthetic inputs, with JSON baselines and regression checks.
+
+Each scenario runs in a fresh Python process (so imports and interpreter startup are included, as they are for real
+CLI invocations), which reports how long the comparison took, how many processes it spawned, and the peak RSS of any
+process in its tree; the parent measures wall time.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from os.path import abspath, dirname, exists, join
+from typing import Iterable
+
+from dffs.base import parse_size
+
+# Line-length distributions of generated inputs: ``(mean, sigma)`` of a log-normal distribution of lengths (a sigma
+# of 0 gives fixed-length lines)
+DISTRIBUTIONS = {
+    'short': (16, 0),
+    'lognormal': (80, 1),
+    'long': (512, 0),
+}
+# Comparisons benchmarked: the three CLIs, and ``join_pipelines`` called directly (without CLI overhead)
+CLIS = ('diff-x', 'comm-x', 'git-diff-x', 'join_pipelines')
+DEFAULT_SIZES = ('1K', '1M', '16M')
+DEFAULT_STAGES = (1, 4)
+DEFAULT_PATHS = (1, 16)
+# One in this many lines differs between a generated pair of inputs
+MUTATE_EVERY = 100
+# Printable bytes that generated lines are made of
+ALPHABET = b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_'
+# Default fractional increase (of wall time, peak RSS, or process count) reported as a regression
+DEFAULT_THRESHOLD = 0.1
+# Wall-time increases smaller than this (in seconds) are treated as noise
+MIN_WALL_DELTA = 0.01
+# Metrics compared against baselines
+GATED_METRICS = ('wall_s', 'max_rss_kb', 'procs')
+# Stage run by `spawn_latency`: it does (next to) no work, so its time is that of starting it and waiting for it
+SPAWN_STAGE = 'cat'
+
+
+def generate(path: str, size: int, dist: str, seed: int = 0) -> tuple[str, str]:
+    """Write a pair of inputs of about ``size`` bytes each, with line lengths drawn from ``DISTRIBUTIONS[dist]``; the
+    second differs from the first in one of every ``MUTATE_EVERY`` lines. Existing files are reused.
+
+    Returns:
+        Paths of both inputs (``<path>.1`` and ``<path>.2``)
+    """
+    path1, path2 = f'{path}.1', f'{path}.2'
+    if exists(path1) and exists(path2):
+        return path1, path2
+    mean, sigma = DISTRIBUTIONS[dist]
+    rng = random.Random(seed)
+    table = bytes(ALPHABET[b % len(ALPHABET)] for b in range(256))
+    lines1, lines2 = [], []
+    total = 0
+    while total < size:
+        length = max(1, round(rng.lognormvariate(0, sigma) * mean)) if sigma else mean
+        line = rng.randbytes(length).translate(table)
+        lines1.append(line)
+        lines2.append(line[::-1] if len(lines1) % MUTATE_EVERY == 0 else line)
+        total += length + 1
+    for lines, out in ((lines1, path1), (lines2, path2)):
+        with open(f'{out}.tmp', 'wb') as f:
+            f.write(b'\n'.join(lines) + b'\n')
+        os.replace(f'{out}.tmp', out)
+    return path1, path2
+
+
+@dataclass
+class Scenario:
+    """One benchmark: comparing a pair of generated inputs with ``cli``, through ``stages`` pipeline stages.
+
+    Args:
+        cli: One of ``CLIS``
+        size: Bytes per input (per path, for ``git-diff-x``)
+        dist: Line-length distribution (a key of ``DISTRIBUTIONS``)
+        stages: Number of pipeline stages (``cat``s, for ``comm-x`` ending in ``sort``)
+        shell: Run stages via the shell (else ``--no-shell``)
+        paths: Number of files compared (``git-diff-x`` only)
+    """
+    cli: str
+    size: str
+    dist: str
+    stages: int
+    shell: bool = True
+    paths: int = 1
+
+    @property
+    def name(self) -> str:
+        paths = f'/paths={self.paths}' if self.cli == 'git-diff-x' else ''
+        return f"{self.cli}/{self.size}/{self.dist}/stages={self.stages}/{'shell' if self.shell else 'no-shell'}{paths}"
+
+    @property
+    def cmds(self) -> list[str]:
+        if self.cli == 'comm-x':
+            return [ *['cat'] * (self.stages - 1), 'sort' ]
+        return ['cat'] * self.stages
+
+
+def scenarios(
+    clis: Iterable[str] = CLIS,
+    sizes: Iterable[str] = DEFAULT_SIZES,
+    dists: Iterable[str] = tuple(DISTRIBUTIONS),
+    stages: Iterable[int] = DEFAULT_STAGES,
+    shells: Iterable[bool] = (True, False),
+    paths: Iterable[int] = DEFAULT_PATHS,
+) -> list[Scenario]:
+    """Cross product of benchmark parameters; ``git-diff-x`` scenarios vary the path count (with lognormal lines and
+    one stage, via the shell), the others vary line lengths, stage count, and shell use."""
+    result = []
+    for cli in clis:
+        for size in sizes:
+            if cli == 'git-diff-x':
+                result.extend(Scenario(cli, size, 'lognormal', 1, True, n) for n in paths)
+                continue
+            for dist in dists:
+                for n in stages:
+                    for shell in shells:
+                        result.append(Scenario(cli, size, dist, n, shell))
+    return result
+
+
+def _git_repo(data_dir: str, scenario: Scenario) -> str:
+    """A Git repo whose worktree differs from HEAD in ``scenario.paths`` generated files."""
+    repo = join(data_dir, f'repo-{scenario.size}-{scenario.paths}')
+    if exists(join(repo, '.git')):
+        return repo
+    os.makedirs(repo, exist_ok=True)
+
+    def git(*args: str) -> None:
+        subprocess.run(['git', '-c', 'user.name=dffs', '-c', 'user.email=dffs@localhost', *args], cwd=repo, check=True, capture_output=True)
+
+    git('init', '-q')
+    pairs = [
+        generate(join(data_dir, f'{scenario.dist}-{scenario.size}-{idx}'), parse_size(scenario.size), scenario.dist, seed=idx)
+        for idx in range(scenario.paths)
+    ]
+    for idx, (path1, _) in enumerate(pairs):
+        os.link(path1, join(repo, f'file{idx}.txt'))
+    git('add', '.')
+    git('commit', '-qm', 'Benchmark inputs')
+    for idx, (_, path2) in enumerate(pairs):
+        os.remove(join(repo, f'file{idx}.txt'))
+        os.link(path2, join(repo, f'file{idx}.txt'))
+    return repo
+
+
+def _peak_rss_kb() -> int:
+    """Peak RSS (KiB) of this process, or of any (reaped) child, whichever is larger.
+
+    On Linux, a process's ``ru_maxrss`` includes its parent's RSS at ``fork`` (it survives ``exec``), so this process's
+    own peak is read from ``/proc`` instead; children's values are inflated the same way, but only up to this process's
+    size (which is counted anyway)."""
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    try:
+        with open('/proc/self/status') as f:
+            own = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak = max(own, children)
+    # macOS reports ``ru_maxrss`` in bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def child() -> None:
+    """Entry point of a scenario's process: run the comparison described by ``argv[1]`` (JSON), counting spawned
+    processes, and write ``{"run_s", "procs", "max_rss_kb", "returncode"}`` to ``argv[2]``."""
+    spec = json.loads(sys.argv[1])
+    procs = 0
+
+    def hook(event: str, _args) -> None:
+        nonlocal procs
+        if event in ('subprocess.Popen', 'os.posix_spawn', 'os.fork'):
+            procs += 1
+
+    sys.addaudithook(hook)
+    argv, cmds, paths, shell = spec['argv'], spec['cmds'], spec['paths'], spec['shell']
+    start = time.perf_counter()
+    if spec['cli'] == 'join_pipelines':
+        from dffs.utils import join_pipelines, path_pipeline
+        cmds1, input1 = path_pipeline(cmds, paths[0])
+        cmds2, input2 = path_pipeline(cmds, paths[1])
+        with open(os.devnull, 'wb') as out:
+            returncode = join_pipelines(['diff'], cmds1, cmds2, shell=shell, out=out, inputs=(input1, input2))
+    else:
+        from importlib import import_module
+        module = import_module({'diff-x': 'dffs.diff_x', 'comm-x': 'dffs.comm_x', 'git-diff-x': 'dffs.git_diff_x'}[spec['cli']])
+        try:
+            module.main.main(args=argv, prog_name=spec['cli'], standalone_mode=False)
+            returncode = 0
+        except SystemExit as e:
+            returncode = e.code or 0
+    run_s = time.perf_counter() - start
+    with open(sys.argv[2], 'w') as f:
+        json.dump(dict(run_s=run_s, procs=procs, max_rss_kb=_peak_rss_kb(), returncode=returncode), f)
+
+
+def run_scenario(scenario: Scenario, data_dir: str, repeat: int = 3) -> dict:
+    """Run ``scenario`` ``repeat`` times, returning median times, throughput, and the max peak RSS and process count."""
+    size = parse_size(scenario.size)
+    cwd = None
+    if scenario.cli == 'git-diff-x':
+        cwd = _git_repo(data_dir, scenario)
+        paths = [ f'file{idx}.txt' for idx in range(scenario.paths) ]
+        argv = [ '-a', *([] if scenario.shell else ['-S']), *scenario.cmds, '-' ]
+        total = 2 * size * scenario.paths
+    else:
+        paths = list(generate(join(data_dir, f'{scenario.dist}-{scenario.size}'), size, scenario.dist))
+        argv = [ *([] if scenario.shell else ['-S']), *scenario.cmds, *paths ]
+        total = 2 * size
+    spec = json.dumps(dict(cli=scenario.cli, argv=argv, cmds=scenario.cmds, paths=paths, shell=scenario.shell))
+    # Make this ``dffs`` importable from the scenario's process (e.g. from a source checkout, in another directory)
+    pythonpath = os.pathsep.join(filter(None, [ dirname(dirname(abspath(__file__))), os.environ.get('PYTHONPATH') ]))
+    result_path = join(data_dir, 'result.json')
+    walls, runs, rss, procs = [], [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-c', 'from dffs.bench import child; child()', spec, result_path],
+            cwd=cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            env={ **os.environ, 'PYTHONPATH': pythonpath },
+        )
+        walls.append(time.perf_counter() - start)
+        if proc.returncode:
+            raise RuntimeError(f"Benchmark {scenario.name} failed (exit {proc.returncode}):\n{proc.stderr.decode(errors='replace')}")
+        with open(result_path) as f:
+            result = json.load(f)
+        runs.append(result['run_s'])
+        procs.append(result['procs'])
+        rss.append(result['max_rss_kb'])
+    wall = statistics.median(walls)
+    return dict(
+        wall_s=round(wall, 4),
+        run_s=round(statistics.median(runs), 4),
+        throughput_mbps=round(total / wall / 1e6, 3),
+        max_rss_kb=max(rss),
+        procs=max(procs),
+    )
+
+
+def metadata() -> dict:
+    try:
+        from dffs._version import __version__ as version
+    except ImportError:
+        version = None
+    return dict(
+        dffs=version,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        date=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    )
+
+
+def run(scenarios: list[Scenario], data_dir: str, repeat: int = 3, pattern: str | None = None, log=None) -> dict:
+    """Run ``scenarios`` (those whose names match the glob ``pattern``, if given), returning a baseline document."""
+    os.makedirs(data_dir, exist_ok=True)
+    results = {}
+    for scenario in scenarios:
+        if pattern and not fnmatch(scenario.name, pattern):
+            continue
+        result = run_scenario(scenario, data_dir, repeat=repeat)
+        results[scenario.name] = dict(**asdict(scenario), **result)
+        if log:
+            log(f"{scenario.name}: {result['wall_s']:.3f}s, {result['throughput_mbps']}MB/s, {result['max_rss_kb']}KiB, {result['procs']} procs")
+    return dict(meta=metadata(), results=results)
+
+
+def compare(
+    baseline: dict,
+    current: dict,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_wall_delta: float = MIN_WALL_DELTA,
+) -> list[tuple[str, str, float, float]]:
+    """Regressions of ``current`` vs. ``baseline`` results: ``(scenario, metric, baseline, current)`` for each gated
+    metric that grew by more than ``threshold`` (as a fraction; wall-time increases below ``min_wall_delta`` seconds
+    are ignored). Scenarios missing from either side are skipped."""
+    regressions = []
+    for name, cur in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for metric in GATED_METRICS:
+            old, new = base.get(metric), cur.get(metric)
+            if old is None or new is None:
+                continue
+            if metric == 'wall_s' and new - old < min_wall_delta:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def spawn_latency(shells: Iterable[str], stages: int = 4, repeat: int = 20) -> dict[str, float]:
+    """Median seconds per stage to run a pipeline of ``stages`` ``cat``s over empty input, with stages run directly
+    (``direct``), and via each of ``shells``."""
+    from dffs.pipeline import spawn
+
+    modes = { 'direct': dict(direct=True), **{ shell: dict(direct=False, executable=shell) for shell in shells } }
+    results = {}
+    for mode, kwargs in modes.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            procs = spawn([SPAWN_STAGE] * stages, open(os.devnull, 'wb'), stdin=b'', **kwargs)
+            for proc in procs:
+                proc.wait()
+            times.append((time.perf_counter() - start) / stages)
+        results[mode] = statistics.median(times)
+    return results
@@ -0,0 +1,387 @@
+"""Read Git objects through long-lived ``git cat-file`` processes."""
+
+from __future__ import annotations
+
+import os
+import posixpath
+from dataclasses import dataclass
+from subprocess import Popen, PIPE, check_output
+from threading import Lock, Thread
+from typing import BinaryIO, Callable, Sequence
+
+# Mode of submodule ("gitlink") entries, whose contents can't be read as blobs
+GITLINK_MODE = '160000'
+# Max bytes of a blob copied from `git cat-file` at a time
+CHUNK_SIZE = 64 * 1024
+
+
+@dataclass(frozen=True)
+class Blob:
+    """A Git blob's object ID and size (in bytes, if known)."""
+    sha: str
+    size: int | None = None
+
+
+@dataclass(frozen=True)
+class Change:
+    """A file that differs between two trees (or a tree and the index or worktree), per ``git diff-* --raw``.
+
+    ``old``/``new`` are ``None`` on the side where the file doesn't exist. ``worktree`` means the new side's contents
+    differ from the index, and must be read from the worktree (``new`` is ``None`` in that case too).
+    """
+    path: str
+    status: str
+    old: Blob | None
+    new: Blob | None
+    worktree: bool = False
+
+
+def is_null_sha(sha: str) -> bool:
+    return not sha.strip('0')
+
+
+def changed_files(
+    ref1: str,
+    ref2: str | None = None,
+    staged: bool = False,
+    pathspecs: Sequence[str] = (),
+) -> list[Change]:
+    """List files changed from ``ref1`` to ``ref2`` (or to the index if ``staged``, else the worktree).
+
+    Uses one ``git diff-tree``/``git diff-index`` call, whose cost scales with the number of changed files (and, for
+    the worktree, an index stat check), and which returns both sides' blob SHAs. Paths are relative to the repository
+    root. Submodules are skipped, and renames are reported as a deletion plus an addition.
+    """
+    if ref2:
+        cmd = ['git', 'diff-tree', '-r', '-z', '--raw', '--no-renames', ref1, ref2]
+    else:
+        cmd = ['git', 'diff-index', '-z', '--raw', '--no-renames', *(['--cached'] if staged else []), ref1]
+    out = check_output([*cmd, '--', *pathspecs]).decode()
+    fields = out.split('\0')
+    changes = []
+    for meta, path in zip(fields[0::2], fields[1::2]):
+        mode1, mode2, sha1, sha2, status = meta.lstrip(':').split(' ')
+        if GITLINK_MODE in (mode1, mode2):
+            continue
+        old = None if is_null_sha(sha1) else Blob(sha1)
+        new = None if is_null_sha(sha2) else Blob(sha2)
+        worktree = new is None and status != 'D'
+        changes.append(Change(path=path, status=status, old=old, new=new, worktree=worktree))
+    return changes
+
+
+@dataclass(frozen=True)
+class Commit:
+    """A commit changing a file, per ``git log --raw``: its SHA and log header fields, and the file's blob before and
+    after it (``None`` on a side where the file doesn't exist)."""
+    sha: str
+    author: str
+    date: str
+    subject: str
+    old: Blob | None
+    new: Blob | None
+
+
+def file_history(
+    path: str,
+    revs: Sequence[str] = ('HEAD',),
+    max_count: int | None = None,
+    first_parent: bool = False,
+) -> list[Commit]:
+    """List the commits (newest first) in ``revs`` that change the file at ``path`` (relative to the current directory).
+
+    Uses one ``git log --raw`` call, which also returns the file's blob SHAs before and after each commit (so no
+    per-commit ``git show``/``rev-parse`` is needed). Merges are compared to their first parent (and with
+    ``first_parent``, only first parents are followed, so the commits form one line of history); renames aren't
+    followed.
+    """
+    cmd = [
+        'git', 'log', '--raw', '--no-renames', '--no-abbrev', '--diff-merges=first-parent',
+        '--format=%x00%H%x1f%an <%ae>%x1f%ad%x1f%s',
+        *([f'--max-count={max_count}'] if max_count is not None else []),
+        *(['--first-parent'] if first_parent else []),
+        *revs, '--', path,
+    ]
+    out = check_output(cmd).decode()
+    commits = []
+    for entry in out.split('\0')[1:]:
+        header, *lines = entry.split('\n')
+        sha, author, date, subject = header.split('\x1f')
+        raws = [ line for line in lines if line.startswith(':') ]
+        if len(raws) > 1:
+            raise ValueError(f"{path} matches more than one file (in {sha})")
+        if not raws:
+            continue
+        meta = raws[0].split('\t', 1)[0]
+        mode1, mode2, sha1, sha2, _ = meta.lstrip(':').split(' ')
+        if GITLINK_MODE in (mode1, mode2):
+            continue
+        commits.append(Commit(
+            sha=sha,
+            author=author,
+            date=date,
+            subject=subject,
+            old=None if is_null_sha(sha1) else Blob(sha1),
+            new=None if is_null_sha(sha2) else Blob(sha2),
+        ))
+    return commits
+
+
+class BlobReader:
+    """Resolve refs and read blobs via long-lived ``git cat-file --batch`` (and one ``--batch-check``) processes.
+
+    Processes are started lazily, and shared by all lookups, so a reader can be used from multiple threads. Header
+    lookups (:meth:`resolve`, :meth:`info`) are serialized through one ``--batch-check`` process; resolved refs are
+    memoized, so each ref is only looked up once per reader. Each blob read checks out an idle ``--batch`` process
+    (starting one if none is idle) for as long as it takes to copy the blob, so streams of different blobs don't
+    wait on each other (e.g. both sides of a comparison, consumed concurrently).
+
+    Paths are interpreted relative to the current directory (as ``<commit>:./<path>``), so no up-front lookup of the
+    repository root or prefix is needed.
+
+    Args:
+        keep: Keep idle processes running on :meth:`close` (which then only stops busy ones, and forgets memoized refs,
+            which may since have moved), for reuse by later invocations in this process (see :func:`blob_reader`);
+            their stderr is piped (and reported when they fail), rather than holding an invocation's stderr open
+    """
+
+    def __init__(self, keep: bool = False):
+        self.keep = keep
+        self.lock = Lock()
+        self.batch_check: Popen | None = None
+        self.batches: list[Popen] = []  # Every `--batch` process started (and not yet closed)
+        self.idle: list[Popen] = []  # `--batch` processes not currently copying a blob
+        self.commits: dict[str, str | None] = {}
+
+    def _start(self, mode: str) -> Popen:
+        return Popen(['git', 'cat-file', f'--{mode}'], stdin=PIPE, stdout=PIPE, stderr=PIPE if self.keep else None)
+
+    @staticmethod
+    def _query(proc: Popen, spec: str) -> list[str] | None:
+        """Send ``spec`` to a ``cat-file`` process, return its parsed header (``None`` for missing objects)."""
+        if '\n' in spec:
+            raise ValueError(f"Invalid object spec: {spec!r}")
+        proc.stdin.write(f'{spec}\n'.encode())
+        proc.stdin.flush()
+        header = proc.stdout.readline()
+        if not header:
+            # `git cat-file` exits on fatal errors (e.g. a path outside the repository); its stderr explains why
+            proc.wait()
+            reason = proc.stderr.read().decode().strip() if proc.stderr else None
+            raise ValueError(f"`git cat-file` failed to look up {spec!r}" + (f": {reason}" if reason else ''))
+        fields = header.decode().split()
+        if fields[-1] in ('missing', 'ambiguous'):
+            return None
+        return fields
+
+    def _check(self, spec: str) -> list[str] | None:
+        """Look up an object's header via the ``--batch-check`` process (the caller must hold :attr:`lock`)."""
+        if self.batch_check is None or self.batch_check.poll() is not None:
+            self.batch_check = self._start('batch-check')
+        return self._query(self.batch_check, spec)
+
+    def resolve(self, ref: str) -> str | None:
+        """Resolve ``ref`` to a commit SHA (memoized), or ``None`` if it doesn't name a commit."""
+        with self.lock:
+            if ref not in self.commits:
+                fields = self._check(f'{ref}^{{commit}}')
+                self.commits[ref] = fields[0] if fields else None
+            return self.commits[ref]
+
+    def _spec(self, ref: str | None, path: str) -> str:
+        path = posixpath.normpath(path)
+        if ref is None:
+            # Index (stage 0)
+            return f':0:./{path}'
+        commit = self.resolve(ref)
+        if commit is None:
+            raise ValueError(f"Invalid ref: {ref}")
+        return f'{commit}:./{path}'
+
+    def info(self, ref: str | None, path: str) -> Blob | None:
+        """Look up the blob at ``path`` (relative to the current directory) in ``ref`` (or the index, if ``None``).
+
+        Returns:
+            The blob's SHA and size, or ``None`` if ``path`` doesn't exist there (or isn't a blob)
+        """
+        spec = self._spec(ref, path)
+        with self.lock:
+            fields = self._check(spec)
+        if not fields or fields[1] != 'blob':
+            return None
+        return Blob(sha=fields[0], size=int(fields[2]))
+
+    def _open(self, blob: Blob | str) -> tuple[Popen, int]:
+        """Check out a ``--batch`` process, and request a blob from it.
+
+        Returns:
+            The process (whose stdout is positioned at the blob's contents), and the blob's size
+        """
+        sha = blob.sha if isinstance(blob, Blob) else blob
+        with self.lock:
+            proc = None
+            while self.idle and proc is None:
+                proc = self.idle.pop()
+                if proc.poll() is not None:
+                    if proc in self.batches:
+                        self.batches.remove(proc)
+                    proc = None
+            if proc is None:
+                proc = self._start('batch')
+                self.batches.append(proc)
+        try:
+            fields = self._query(proc, sha)
+        except BaseException:
+            self._discard(proc)
+            raise
+        if not fields:
+            self._release(proc)
+            raise ValueError(f"Missing object: {sha}")
+        return proc, int(fields[2])
+
+    def _copy(self, proc: Popen, size: int, write: Callable[[bytes], object]) -> None:
+        """Pass a blob's contents (``size`` bytes, from ``proc``) to ``write`` in chunks of at most ``CHUNK_SIZE``,
+        then return ``proc`` to the idle pool (or, if copying fails partway, stop it)."""
+        try:
+            remaining = size
+            while remaining:
+                chunk = proc.stdout.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("`git cat-file` exited before writing a whole blob")
+                write(chunk)
+                remaining -= len(chunk)
+            proc.stdout.read(1)  # Trailing newline
+        except BaseException:
+            # The process is partway through the blob, so it can't serve another request
+            self._discard(proc)
+            raise
+        self._release(proc)
+
+    def _release(self, proc: Popen) -> None:
+        with self.lock:
+            # Unless :meth:`close` stopped it meanwhile
+            if proc in self.batches:
+                self.idle.append(proc)
+
+    def _discard(self, proc: Popen) -> None:
+        with self.lock:
+            if proc in self.batches:
+                self.batches.remove(proc)
+        proc.kill()
+        self._wait(proc)
+
+    @staticmethod
+    def _wait(proc: Popen) -> None:
+        proc.wait()
+        for pipe in (proc.stdin, proc.stdout, proc.stderr):
+            if pipe:
+                pipe.close()
+
+    def read(self, blob: Blob | str) -> bytes:
+        """Read the contents of a blob (given as a :class:`Blob` or SHA) into memory; see :meth:`stream` to pipe them
+        instead."""
+        proc, size = self._open(blob)
+        data = bytearray()
+        self._copy(proc, size, data.extend)
+        return bytes(data)
+
+    def stream(self, blob: Blob | str, done: Callable[[int], None] | None = None) -> BinaryIO:
+        """Open a blob's contents (given as a :class:`Blob` or SHA) for reading, e.g. as a pipeline's stdin.
+
+        Returns the read end of a pipe, which a background thread copies the blob into from ``git cat-file``, a chunk
+        at a time (so, unlike :meth:`read`, the blob is never held in memory whole). If the reader stops early (closes
+        the pipe), the copy stops too. Missing objects raise here, rather than in the background.
+
+        Args:
+            done: Called (from the background thread) with the number of bytes copied, once copying stops
+        """
+        proc, size = self._open(blob)
+        fd_r, fd_w = os.pipe()
+
+        def copy():
+            copied = 0
+
+            def write(chunk: bytes) -> None:
+                nonlocal copied
+                out.write(chunk)
+                copied += len(chunk)
+
+            out = open(fd_w, 'wb')
+            try:
+                self._copy(proc, size, write)
+                out.flush()
+            except (BrokenPipeError, ValueError):
+                # The reader exited early (or `git cat-file` did, in which case the reader sees a truncated blob)
+                pass
+            finally:
+                # Before the reader sees EOF (so e.g. a timing span is complete once the pipeline reading it exits)
+                if done:
+                    done(copied)
+                try:
+                    out.close()
+                except BrokenPipeError:
+                    pass
+
+        Thread(target=copy, daemon=True).start()
+        return open(fd_r, 'rb')
+
+    def close(self) -> None:
+        """Stop this reader's processes (or, if it's kept, just the busy ones, and forget memoized refs)."""
+        with self.lock:
+            # Processes still copying a blob (to a stream that was abandoned) wouldn't exit on EOF
+            busy = [ proc for proc in self.batches if proc not in self.idle ]
+            if self.keep:
+                procs = busy
+                self.batches = list(self.idle)
+                self.commits = {}
+            else:
+                procs = [ *self.batches, *([self.batch_check] if self.batch_check else []) ]
+                self.batches, self.idle, self.batch_check = [], [], None
+        for proc in procs:
+            if proc in busy:
+                proc.kill()
+            proc.stdin.close()
+            self._wait(proc)
+
+    def shutdown(self) -> None:
+        """Stop all of this reader's processes, even if it's kept."""
+        self.keep = False
+        self.close()
+
+    def __enter__(self) -> BlobReader:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# Whether `blob_reader` keeps a reader (see `keep_readers`), and the one it kept: with the directory and Git environment
+# (which determine how its processes resolve paths and find the repository) it was started in
+_keeping = False
+_kept: tuple[tuple, BlobReader] | None = None
+
+
+def keep_readers() -> None:
+    """Have :func:`blob_reader` keep its reader, with its ``git cat-file`` processes, for later invocations in this
+    process (e.g. a :mod:`dffs.daemon` worker's)."""
+    global _keeping
+    _keeping = True
+
+
+def blob_reader() -> BlobReader:
+    """A :class:`BlobReader` for one invocation (closed when it's done): a new one, or, after :func:`keep_readers`,
+    the one kept by an earlier invocation (if it ran in the same directory and Git environment)."""
+    global _kept
+    if not _keeping:
+        return BlobReader()
+    context = (os.getcwd(), sorted( (k, v) for k, v in os.environ.items() if k.startswith('GIT_') ))
+    if _kept and _kept[0] == context:
+        reader = _kept[1]
+        # Refs may have moved since the last invocation
+        reader.commits.clear()
+        return reader
+    if _kept:
+        _kept[1].shutdown()
+    reader = BlobReader(keep=True)
+    _kept = (context, reader)
+    return reader
@@ -0,0 +1,334 @@
+"""On-disk, content-addressed cache of transformed pipeline outputs."""
+
+from __future__ import annotations
+
+import atexit
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from os import environ as env
+from os.path import exists, expanduser, join, realpath
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO
+
+from dffs.base import parse_size
+from dffs.pipeline import DEFAULT_SHELL
+
+# Default total size of cached pipeline outputs; least-recently-used entries are evicted beyond this
+DEFAULT_CACHE_SIZE = 2**30
+# Default total size of cached comparison results
+DEFAULT_RESULT_CACHE_SIZE = 2**28
+# gzip level for cached comparison outputs
+RESULT_COMPRESS_LEVEL = 6
+# Units accepted by ``$DFFS_CACHE_TTL`` (in seconds)
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Caches with hit/miss counts not yet written to their ``stats.json`` (see :func:`flush_stats`)
+_unflushed: set[Cache] = set()
+
+
+def cache_dir() -> str:
+    """Root directory for dffs caches: ``$DFFS_CACHE_DIR``, else ``$XDG_CACHE_HOME/dffs`` (``~/.cache/dffs``)."""
+    if 'DFFS_CACHE_DIR' in env:
+        return env['DFFS_CACHE_DIR']
+    xdg = env.get('XDG_CACHE_HOME') or expanduser('~/.cache')
+    return join(xdg, 'dffs')
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_identity(path: str, content_hash: bool = False) -> str:
+    """Identify a worktree file's contents, by ``(path, inode, size, mtime)`` or (with ``content_hash``) SHA-256."""
+    if content_hash:
+        return f'sha256:{file_digest(path)}'
+    st = os.stat(path)
+    return f'file:{realpath(path)}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}'
+
+
+# Identifies an empty input (e.g. a file that doesn't exist at one of the commits being compared)
+EMPTY_IDENTITY = 'empty'
+
+
+def blob_identity(sha: str) -> str:
+    """Identify a Git blob's contents by its object ID."""
+    return f'blob:{sha}'
+
+
+def parse_duration(value: str | int | float) -> float:
+    """Parse a duration in seconds, optionally with an ``s``/``m``/``h``/``d``/``w`` unit suffix (e.g. ``7d``)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    value = value.strip()
+    if value and value[-1].lower() in DURATION_UNITS:
+        return float(value[:-1]) * DURATION_UNITS[value[-1].lower()]
+    return float(value)
+
+
+class Cache:
+    """On-disk store of files, under a subdirectory (:attr:`name`) of :func:`cache_dir`, with LRU eviction beyond
+    ``max_size`` bytes, and (optionally) expiry of entries unused for ``max_age`` seconds.
+
+    Reading an entry bumps its mtime, which eviction uses as the "last used" time. Hit/miss counts are counted in
+    memory, and added to ``stats.json`` (persisted across runs) by :meth:`flush` (e.g. at exit, via
+    :func:`flush_stats`). The total size of entries is scanned once (by the first :meth:`put`), then tracked, so
+    eviction only rescans entries when the budget is exceeded. Subclasses define keys and entry formats.
+
+    Args:
+        root: Root cache directory; defaults to :func:`cache_dir`
+        max_size: Size budget; defaults to ``$<size_env>``, else :attr:`default_size`
+        max_age: Seconds after its last use that an entry expires; defaults to ``$DFFS_CACHE_TTL`` (e.g. ``7d``), else
+            entries don't expire
+    """
+    name: str
+    size_env: str
+    default_size: int
+
+    def __init__(self, root: str | None = None, max_size: int | None = None, max_age: float | None = None):
+        self.root = join(root or cache_dir(), self.name)
+        if max_size is None:
+            max_size = parse_size(env.get(self.size_env, self.default_size))
+        self.max_size = max_size
+        if max_age is None and env.get('DFFS_CACHE_TTL'):
+            max_age = parse_duration(env['DFFS_CACHE_TTL'])
+        self.max_age = max_age
+        self.counts = {'hits': 0, 'misses': 0}
+        # Total size of entries, as of the last `prune` plus later `put`s (`None` until the first `prune`)
+        self.size: int | None = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key: str) -> Path:
+        return Path(self.root, key[:2], key)
+
+    @property
+    def stats_path(self) -> str:
+        return join(self.root, 'stats.json')
+
+    @contextmanager
+    def _stats(self):
+        """Lock, load, and (on exit) save the persisted hit/miss counters."""
+        with open(f'{self.stats_path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.stats_path) as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {}
+            stats.setdefault('hits', 0)
+            stats.setdefault('misses', 0)
+            yield stats
+            with NamedTemporaryFile('w', dir=self.root, delete=False) as f:
+                json.dump(stats, f)
+            os.replace(f.name, self.stats_path)
+
+    def _expired(self, st: os.stat_result) -> bool:
+        return self.max_age is not None and time.time() - st.st_mtime > self.max_age
+
+    def get(self, key: str) -> Path | None:
+        """Return the path to the cached entry for ``key`` (marking it recently used), or ``None`` on a miss."""
+        path = self.path(key)
+        try:
+            hit = not self._expired(path.stat())
+            if hit:
+                os.utime(path)
+        except FileNotFoundError:
+            hit = False
+        self.counts['hits' if hit else 'misses'] += 1
+        _unflushed.add(self)
+        return path if hit else None
+
+    def flush(self) -> None:
+        """Add the hit/miss counts since the last flush to ``stats.json``."""
+        _unflushed.discard(self)
+        if not any(self.counts.values()):
+            return
+        with self._stats() as stats:
+            for name, count in self.counts.items():
+                stats[name] += count
+        self.counts = dict.fromkeys(self.counts, 0)
+
+    def tmp(self):
+        """Open a temporary file to write an entry into, before :meth:`put`-ing it."""
+        return NamedTemporaryFile('wb', dir=self.root, prefix='.tmp-', delete=False)
+
+    def put(self, key: str, tmp_path: str) -> Path:
+        """Move a completed entry (written via :meth:`tmp`) into the cache under ``key``, then evict if needed (or, on
+        this cache's first ``put``, to scan its total size and evict expired entries)."""
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        size = os.stat(tmp_path).st_size
+        try:
+            size -= path.stat().st_size
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+        if self.size is None or self.size + size > self.max_size:
+            self.prune()
+        else:
+            self.size += size
+        return path
+
+    def entries(self) -> list[tuple[str, os.stat_result]]:
+        return [
+            (entry.path, entry.stat())
+            for subdir in os.scandir(self.root)
+            if subdir.is_dir()
+            for entry in os.scandir(subdir.path)
+            if entry.is_file()
+        ]
+
+    def stats(self) -> dict:
+        """Entry count, total size, budget, and lifetime hit/miss counts (including this process's, unflushed)."""
+        flush_stats()
+        entries = self.entries()
+        with self._stats() as stats:
+            counts = dict(stats)
+        return dict(
+            root=self.root,
+            entries=len(entries),
+            size=sum(st.st_size for _, st in entries),
+            max_size=self.max_size,
+            **counts,
+        )
+
+    def prune(self, max_size: int | None = None) -> tuple[int, int]:
+        """Evict expired entries, then least-recently-used ones until the total size is at most ``max_size`` (default:
+        the budget).
+
+        Returns:
+            Number of entries and bytes removed
+        """
+        if max_size is None:
+            max_size = self.max_size
+        entries = sorted(self.entries(), key=lambda e: e[1].st_mtime)
+        size = sum(st.st_size for _, st in entries)
+        removed, removed_size = 0, 0
+        for path, st in entries:
+            if size <= max_size and not self._expired(st):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= st.st_size
+            removed += 1
+            removed_size += st.st_size
+        self.size = size
+        return removed, removed_size
+
+    def clear(self) -> None:
+        """Remove all entries and statistics."""
+        if exists(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.root, exist_ok=True)
+        self.counts = dict.fromkeys(self.counts, 0)
+        self.size = 0
+
+
+@atexit.register
+def flush_stats() -> None:
+    """Write all caches' pending hit/miss counts to their ``stats.json`` (at exit, or after each daemon invocation)."""
+    for cache in list(_unflushed):
+        try:
+            cache.flush()
+        except OSError:
+            pass
+
+
+class PipelineCache(Cache):
+    """Content-addressed store of pipeline outputs.
+
+    Entries are keyed (see :meth:`key`) by an input identity (e.g. :func:`file_identity`, :func:`blob_identity`)
+    plus the exact pipeline commands and shell they were run with.
+    """
+    name = 'pipelines'
+    size_env = 'DFFS_CACHE_SIZE'
+    default_size = DEFAULT_CACHE_SIZE
+
+    @staticmethod
+    def key(
+        input_id: str,
+        cmds: list[str] | list[list[str]],
+        executable: str | None = None,
+        shell: bool = True,
+    ) -> str:
+        """Cache key for running ``cmds`` (with ``shell``/``executable``) over the input identified by ``input_id``."""
+        if executable is None:
+            executable = DEFAULT_SHELL
+        spec = json.dumps([input_id, cmds, executable if shell else None, shell])
+        return hashlib.sha256(spec.encode()).hexdigest()
+
+    @classmethod
+    def file_key(
+        cls,
+        path: str,
+        cmds: list[str] | list[list[str]],
+        content_hash: bool = False,
+        executable: str | None = None,
+        shell: bool = True,
+    ) -> str | None:
+        """Cache key for running ``cmds`` over the worktree file ``path`` (``None`` if it isn't a readable file)."""
+        try:
+            input_id = file_identity(path, content_hash=content_hash)
+        except OSError:
+            return None
+        return cls.key(input_id, cmds, executable=executable, shell=shell)
+
+
+class ResultCache(Cache):
+    """Store of comparison results: a comparator's exit code and (gzipped) output, for a pair of pipeline runs.
+
+    Entries are keyed (see :meth:`key`) by both sides' :class:`PipelineCache` keys (which identify each input and its
+    pipeline) plus the comparator (command and arguments, or in-process comparator settings). A hit is replayed
+    (see :meth:`replay`) without running any pipelines or comparator.
+    """
+    name = 'results'
+    size_env = 'DFFS_RESULT_CACHE_SIZE'
+    default_size = DEFAULT_RESULT_CACHE_SIZE
+
+    @staticmethod
+    def key(side_keys: tuple[str, str], comparator: list[str] | object) -> str:
+        """Cache key for comparing two pipelines' outputs (identified by ``side_keys``) with ``comparator``: a
+        command, or an in-process comparator (identified by its ``repr``, which for dataclasses lists its settings)."""
+        spec = json.dumps([*side_keys, comparator if isinstance(comparator, list) else repr(comparator)])
+        return hashlib.sha256(spec.encode()).hexdigest()
+
+    def recorder(self):
+        """Open a temporary (gzip) file to record a comparator's output into, before :meth:`put`-ing it."""
+        tmp = self.tmp()
+        return tmp, gzip.GzipFile(fileobj=tmp, mode='wb', compresslevel=RESULT_COMPRESS_LEVEL, mtime=0)
+
+    def put(self, key: str, tmp_path: str, returncode: int) -> Path:
+        """Store a recorded output (see :meth:`recorder`), prefixed by the ``returncode`` it was produced with."""
+        with self.tmp() as f, open(tmp_path, 'rb') as output:
+            f.write(b'%d\n' % returncode)
+            shutil.copyfileobj(output, f)
+        os.remove(tmp_path)
+        return super().put(key, f.name)
+
+    @staticmethod
+    def replay(path: Path, out: BinaryIO) -> int:
+        """Write a cached result's output to ``out``, and return its exit code."""
+        with open(path, 'rb') as f:
+            returncode = int(f.readline())
+            try:
+                with gzip.GzipFile(fileobj=f, mode='rb') as output:
+                    shutil.copyfileobj(output, out)
+                out.flush()
+            except BrokenPipeError:
+                # Reader (e.g. a pager) exited early
+                pass
+        return returncode
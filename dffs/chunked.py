@@ -0,0 +1,199 @@
+"""Line diff for large inputs with few changes, usable as a :func:`~dffs.utils.join_pipelines` comparator.
+
+Both inputs are split into content-defined chunks (runs of whole lines, cut wherever a line's hash says so, so that cut
+points depend only on nearby content, and realign right after an edit, as in rsync or FastCDC), which are matched by
+digest as they're read. Only the regions between matching chunks are kept in memory and diffed line by line (by a
+:class:`~dffs.engine.DiffEngine`), so memory use is bounded by the size of the changes, rather than of the inputs.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from typing import BinaryIO, Iterable, Iterator
+from zlib import crc32
+
+from dffs.engine import WHITESPACE, Change, DiffEngine, Lines, changes, diff_blocks
+
+# Target average chunk size, in bytes
+AVG_CHUNK_SIZE = 8 * 1024
+# Unchanged lines before each changed region that are included in its line-level diff, so that changes near the
+# region's start can be aligned (and slid to canonical positions) as in a whole-input diff
+SLACK_LINES = 64
+
+# A chunk: a digest of its lines (or, ignoring whitespace, their comparison keys), and the lines
+Chunk = tuple[bytes, list[bytes]]
+
+
+def _digest(lines: list[bytes], ignore_whitespace: bool) -> bytes:
+    if ignore_whitespace:
+        # Keys have no newlines, so joining them with newlines keeps line counts (and boundaries) significant
+        data = b'\n'.join(line.translate(None, WHITESPACE) for line in lines)
+    else:
+        data = b''.join(lines)
+    return blake2b(data, digest_size=16).digest()
+
+
+def chunks(stream: Iterable[bytes], avg_size: int = AVG_CHUNK_SIZE, ignore_whitespace: bool = False) -> Iterator[Chunk]:
+    """Split ``stream``'s lines into content-defined chunks.
+
+    Once a chunk is at least ``avg_size // 4`` bytes, it ends after the first line whose hash (mod ``avg_size``) is less
+    than its length (so, on average, one cut per ``avg_size`` bytes); chunks are also cut at ``8 * avg_size`` bytes.
+    With ``ignore_whitespace``, lines are hashed (and chunks digested) without whitespace, like ``diff -w`` compares
+    them.
+    """
+    min_size, max_size = avg_size // 4, avg_size * 8
+    lines: list[bytes] = []
+    size = 0
+    for line in stream:
+        lines.append(line)
+        size += len(line)
+        key = line.translate(None, WHITESPACE) if ignore_whitespace else line
+        if size >= max_size or (size >= min_size and crc32(key) % avg_size < len(key)):
+            yield _digest(lines, ignore_whitespace), lines
+            lines = []
+            size = 0
+    if lines:
+        yield _digest(lines, ignore_whitespace), lines
+
+
+class _Source:
+    """An input's chunks, with ones read ahead (but not consumed) pushed back in front."""
+
+    def __init__(self, chunks: Iterator[Chunk]):
+        self.chunks = chunks
+        self.pushed: deque[Chunk] = deque()
+
+    def next(self) -> Chunk | None:
+        if self.pushed:
+            return self.pushed.popleft()
+        return next(self.chunks, None)
+
+    def push(self, chunks: list[Chunk]) -> None:
+        self.pushed.extendleft(reversed(chunks))
+
+
+class Retained:
+    """Line IDs of the lines of an input kept for output (changed lines, and their context), by line number.
+
+    Stands in for the input's full ID ``array`` in :meth:`DiffEngine.write <dffs.engine.DiffEngine.write>` (its
+    length is the input's line count).
+    """
+
+    def __init__(self):
+        self.ids: dict[int, int] = {}
+        self.length = 0
+
+    def __getitem__(self, idx: int) -> int:
+        return self.ids[idx]
+
+    def __len__(self) -> int:
+        return self.length
+
+
+@dataclass
+class ChunkedDiff:
+    """Compare two byte streams line by line in-process, diffing only the regions between chunks they have in common.
+
+    Chunks (see :func:`chunks`) are read from both inputs in lockstep; while they match, only line counts (and a few
+    lines of context) are kept. After a mismatch, chunks are buffered until one read from either input matches one
+    buffered from the other; the buffered chunks before the match, with the matching chunk and up to ``SLACK_LINES``
+    preceding lines, are then diffed by ``engine``, and reading resumes from the match.
+
+    Output is written by ``engine`` (in its format, with line numbers relative to the whole inputs), so it's a valid
+    ``diff`` (applying it as a patch yields the second input), usually the same as ``engine``'s over the whole inputs;
+    but it may not be minimal: matched chunks aren't re-aligned, so some changes (e.g. moved or repeated text) can be
+    reported as larger hunks than a whole-input diff would. Returns 1 if the inputs differ, else 0.
+
+    Args:
+        engine: Line diff (algorithm, output format, and options) for changed regions
+        avg_size: Target average chunk size, in bytes
+    """
+    engine: DiffEngine = field(default_factory=DiffEngine)
+    avg_size: int = AVG_CHUNK_SIZE
+
+    def __call__(self, in1: BinaryIO, in2: BinaryIO, out: BinaryIO) -> int:
+        engine = self.engine
+        context = engine.context or 0
+        sources = [ _Source(chunks(stream, self.avg_size, engine.ignore_whitespace)) for stream in (in1, in2) ]
+        lines = Lines(engine.ignore_whitespace)
+        retained = (Retained(), Retained())
+        diffs: list[Change] = []
+        starts = [0, 0]  # Line number, in each input, of the first line not yet matched or diffed
+        floors = [0, 0]  # End of the last change, in each input (the next region's diff can't reach back past it)
+        captures = [0, 0]  # Line number, in each input, up to which matched lines are retained (as trailing context)
+        # Matched lines (pairs, one from each input) since the last changed region: its successor's leading context
+        prefix: deque[tuple[bytes, bytes]] = deque(maxlen=SLACK_LINES + context)
+        pending: tuple[list[Chunk], list[Chunk]] = ([], [])  # Chunks read since the inputs last matched
+        index: tuple[dict[bytes, int], dict[bytes, int]] = ({}, {})  # Digest → position of its first pending chunk
+
+        while True:
+            chunk1, chunk2 = sources[0].next(), sources[1].next()
+            if chunk1 and chunk2 and chunk1[0] == chunk2[0] and not pending[0] and not pending[1]:
+                for side, chunk_lines in enumerate((chunk1[1], chunk2[1])):
+                    start = starts[side]
+                    for k in range(start, min(captures[side], start + len(chunk_lines))):
+                        retained[side].ids[k] = lines.intern(chunk_lines[k - start])
+                    starts[side] += len(chunk_lines)
+                prefix.extend(zip(chunk1[1], chunk2[1]))
+                continue
+
+            match = None  # Positions (in `pending`) of a pair of matching chunks
+            for side, chunk in enumerate((chunk1, chunk2)):
+                if chunk is None:
+                    continue
+                pos = len(pending[side])
+                pending[side].append(chunk)
+                index[side].setdefault(chunk[0], pos)
+                other = index[1 - side].get(chunk[0])
+                if other is not None:
+                    found = (pos, other) if side == 0 else (other, pos)
+                    if match is None or sum(found) < sum(match):
+                        match = found
+            if match is None and (chunk1 or chunk2):
+                continue
+            if match is None and not pending[0] and not pending[1]:
+                break
+
+            # Diff the changed region: pending chunks up to the match (or, at the end of both inputs, all of them)
+            ends = match or (len(pending[0]), len(pending[1]))
+            regions = [ [ line for _, chunk_lines in pending[side][:ends[side]] for line in chunk_lines ] for side in (0, 1) ]
+            suffixes = [ pending[side][ends[side]][1] if match else [] for side in (0, 1) ]
+            tails = [ pending[side][ends[side]:] for side in (0, 1) ]
+            # Leading context: matched lines since the last change, the last `SLACK_LINES` of which are diffed
+            retain = min(len(prefix), starts[0] - floors[0], starts[1] - floors[1])
+            pairs = list(prefix)[len(prefix) - retain:]
+            slack = min(retain, SLACK_LINES)
+            for side in (0, 1):
+                retained_ids = retained[side].ids
+                for k, pair in enumerate(pairs[:retain - slack], starts[side] - retain):
+                    retained_ids[k] = lines.intern(pair[side])
+            windows = [ [ pair[side] for pair in pairs[retain - slack:] ] + regions[side] + suffixes[side] for side in (0, 1) ]
+            offsets = [ starts[side] - slack for side in (0, 1) ]
+            (ids1, keys1), (ids2, keys2) = lines.read(windows[0]), lines.read(windows[1])
+            for side, ids in enumerate((ids1, ids2)):
+                retained[side].ids.update(zip(range(offsets[side], offsets[side] + len(ids)), ids))
+            off1, off2 = offsets
+            region_diffs = changes(diff_blocks(keys1, keys2, engine.algorithm), keys1, keys2)
+            diffs.extend( (i1 + off1, i2 + off1, j1 + off2, j2 + off2) for i1, i2, j1, j2 in region_diffs )
+            if region_diffs:
+                floors = [diffs[-1][1], diffs[-1][3]]
+            for side in (0, 1):
+                starts[side] += len(regions[side])
+                captures[side] = offsets[side] + len(windows[side]) + context
+                pending[side].clear()
+                index[side].clear()
+            prefix.clear()
+            if match is None:
+                break
+            # Resume reading from the matching chunks
+            for source, tail in zip(sources, tails):
+                source.push(tail)
+
+        if not diffs:
+            return 0
+        for side in (0, 1):
+            retained[side].length = starts[side]
+        engine.write(out, lines.lines, retained[0], retained[1], diffs)
+        return 1
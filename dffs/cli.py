@@ -2,6 +2,7 @@ import click
 from click import option, argument
 
 from dffs._version import __version__
+from dffs.base import parse_size
 
 
 def print_version(ctx, param, value):
@@ -12,10 +13,27 @@ def print_version(ctx, param, value):
     ctx.exit()
 
 
+def parse_size_opt(ctx, param, value):
+    """Parse an optional size (e.g. ``500M``, ``1Gi``; see :func:`~dffs.base.parse_size`)."""
+    if value is None:
+        return None
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e), ctx=ctx, param=param)
+
+
 version_opt = option('-V', '--version', is_flag=True, callback=print_version, expose_value=False, is_eager=True, help='Show version and exit')
 pipefail_opt = option('-P', '--pipefail', is_flag=True, help="Check all pipeline commands for errors (like bash's `set -o pipefail`); default only checks last command")
-shell_exec_opt = option('-s', '--shell-executable', help='Shell to use for executing commands; defaults to $SHELL')
+shell_exec_opt = option('-s', '--shell-executable', envvar='DFFS_SHELL', help='Shell to run pipeline commands that need one with (e.g. for pipes, redirects, or globs; other commands are run directly); defaults to `/bin/sh`')
 no_shell_opt = option('-S', '--no-shell', is_flag=True, help="Don't pass `shell=True` to Python `subprocess`es")
 verbose_opt = option('-v', '--verbose', is_flag=True, help="Log intermediate commands to stderr")
 exec_cmd_opt = option('-x', '--exec-cmd', 'exec_cmds', multiple=True, help='Command(s) to execute before invoking `comm`; alternate syntax to passing commands as positional arguments')
+cache_opt = option('--cache/--no-cache', envvar='DFFS_CACHE', help='Cache pipeline outputs (under `$DFFS_CACHE_DIR`, default `~/.cache/dffs`), keyed by input identity and pipeline; see `dffs cache`')
+result_cache_opt = option('--result-cache/--no-result-cache', envvar='DFFS_RESULT_CACHE', help="Cache comparison results (exit code and compressed output), keyed by both inputs' identities, the pipeline, and the comparator's arguments; a hit is replayed without running anything. Worktree files are identified by content hash (implying `--cache-hash`), so results are shared across checkouts")
+cache_hash_opt = option('--cache-hash', is_flag=True, envvar='DFFS_CACHE_HASH', help='Identify cached worktree files by content hash, instead of path/inode/size/mtime (implied by `--result-cache`)')
+skip_identical_opt = option('--skip-identical', is_flag=True, envvar='DFFS_SKIP_IDENTICAL', help="Also skip pipelines when both inputs' contents are identical (not just the same path or blob); assumes the pipeline's output depends only on its input's contents (unlike e.g. `wc -l <path>`, which prints the path)")
+timings_opt = option('--timings', 'timings_fmt', flag_value='table', help="After comparing, print a table of each pipeline stage's (and the comparator's) wall time, CPU time, and peak RSS, and the bytes and lines each pipeline produced, to stderr")
+timings_json_opt = option('--timings-json', 'timings_fmt', flag_value='json', help='Like `--timings`, but print a JSON object (one line per comparison)')
+trace_opt = option('--trace', 'trace_path', metavar='FILE', help='Write a Chrome trace-event JSON of the run to FILE (viewable in Perfetto or `chrome://tracing`): a span per comparison, cache lookup, blob read, comparator, and pipeline stage, on a track per worker')
 args = argument('args', metavar='[exec_cmd...] <path1> <path2>', nargs=-1)
@@ -0,0 +1,147 @@
+"""Entry points for ``diff-x``, ``comm-x``, ``git-diff-x``, and ``git-log-x``: hand each invocation to a ``dffs serve``
+daemon (see :mod:`dffs.daemon`) for the current repository, if one is running, else run it in this process.
+
+Only the standard library modules needed to find and talk to a daemon are imported before that's decided.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+from hashlib import sha256
+from os.path import dirname, exists, join, realpath
+
+# Length prefix of a request's JSON body
+HEADER = struct.Struct('>Q')
+# Set to `0` to run in-process even if a daemon is running
+DAEMON_ENV = 'DFFS_DAEMON'
+# A Git repository elsewhere than the cwd's enclosing `.git` (e.g. via these) is never handed to a daemon
+GIT_ENVS = ('GIT_DIR', 'GIT_WORK_TREE')
+# Signals a client relays to the worker running its invocation
+RELAYED_SIGNALS = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP)
+
+
+def runtime_dir() -> str:
+    """Directory holding daemons' sockets: ``$XDG_RUNTIME_DIR/dffs``, else ``$TMPDIR/dffs-<uid>``."""
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return join(os.environ['XDG_RUNTIME_DIR'], 'dffs')
+    return join(os.environ.get('TMPDIR') or '/tmp', f'dffs-{os.getuid()}')
+
+
+def find_root(path: str) -> str | None:
+    """Working tree root enclosing ``path``: its nearest ancestor containing a ``.git`` (without spawning ``git``)."""
+    path = realpath(path)
+    while True:
+        if exists(join(path, '.git')):
+            return path
+        parent = dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def socket_path(root: str | None) -> str:
+    """Socket of the daemon serving invocations from within ``root`` (or outside any repository, if ``None``)."""
+    name = sha256(root.encode()).hexdigest()[:16] if root else 'default'
+    return join(runtime_dir(), f'{name}.sock')
+
+
+def connect(path: str) -> socket.socket | None:
+    """Connect to the daemon listening at ``path``, if there is one (and its directory belongs to this user)."""
+    try:
+        if os.stat(dirname(path)).st_uid != os.getuid():
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except OSError:
+        return None
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def send(sock: socket.socket, msg: dict, fds: tuple[int, ...] = ()) -> None:
+    """Send a request (length-prefixed JSON), passing ``fds`` along with it."""
+    body = json.dumps(msg).encode()
+    header = HEADER.pack(len(body))
+    if fds:
+        socket.send_fds(sock, [header], fds)
+    else:
+        sock.sendall(header)
+    sock.sendall(body)
+
+
+def forward(prog: str, argv: list[str]) -> int | None:
+    """Run ``prog argv`` in a daemon, if one is serving the current repository, and return its exit code.
+
+    The daemon's worker process gets this process's stdin, stdout, and stderr (so output isn't copied, and TTY
+    detection works as usual), cwd, and environment; signals received while waiting are relayed to it.
+
+    Returns:
+        The invocation's exit code, or ``None`` if no daemon took it (in which case it should be run in-process)
+    """
+    if os.environ.get(DAEMON_ENV) == '0' or any(name in os.environ for name in GIT_ENVS):
+        return None
+    from dffs._version import __version__
+
+    cwd = os.getcwd()
+    root = find_root(cwd)
+    sock = connect(socket_path(root))
+    if sock is None:
+        return None
+    with sock:
+        try:
+            send(
+                sock,
+                dict(prog=prog, argv=argv, cwd=cwd, env=dict(os.environ), root=root, version=__version__),
+                fds=(0, 1, 2),
+            )
+            replies = sock.makefile('rb')
+            started = json.loads(replies.readline() or 'null')
+        except (OSError, ValueError):
+            return None
+        if not started or 'pid' not in started:
+            # Daemon declined (e.g. it's serving a different version of dffs)
+            return None
+        pid = started['pid']
+        for sig in RELAYED_SIGNALS:
+            signal.signal(sig, lambda signum, frame: os.kill(pid, signum))
+        try:
+            done = json.loads(replies.readline() or 'null')
+        except (OSError, ValueError):
+            done = None
+    if not done:
+        print(f"dffs daemon worker {pid} exited without reporting a status", file=sys.stderr)
+        return 1
+    return done['exit']
+
+
+def run(prog: str, module: str) -> None:
+    """Run CLI ``prog`` (defined in ``module``) on this process's args, in a daemon if possible, then exit."""
+    returncode = forward(prog, sys.argv[1:])
+    if returncode is not None:
+        raise SystemExit(returncode)
+    from importlib import import_module
+    import_module(module).main()
+
+
+def diff_x() -> None:
+    run('diff-x', 'dffs.diff_x')
+
+
+def comm_x() -> None:
+    run('comm-x', 'dffs.comm_x')
+
+
+def git_diff_x() -> None:
+    run('git-diff-x', 'dffs.git_diff_x')
+
+
+def git_log_x() -> None:
+    run('git-log-x', 'dffs.git_log_x')
@@ -0,0 +1,78 @@
+"""Byte-wise comparison that stops at the first difference, usable as a :func:`~dffs.utils.join_pipelines`
+comparator (like ``cmp``)."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import BinaryIO, ClassVar
+
+# Max bytes read from each input at a time
+READ_SIZE = 64 * 1024
+
+
+def _mismatch(a: bytes, b: bytes) -> int:
+    """Index of the first byte at which equal-length ``a`` and ``b`` differ (they must differ)."""
+    lo, hi = 0, len(a)
+    # Narrow down by halves (comparing slices in C), then scan the remainder
+    while hi - lo > 64:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return next(i for i in range(lo, hi) if a[i] != b[i])
+
+
+@dataclass
+class Cmp:
+    """Compare two byte streams, stopping at (and reporting) the first difference, like ``cmp``.
+
+    Output is one line, in ``cmp``'s format: ``<label1> <label2> differ: byte <n>, line <n>``, or, if one input is a
+    prefix of the other, ``EOF on <label> after byte <n>, line <n>``. Returns 1 if the inputs differ, else 0.
+
+    The rest of both inputs is left unread: comparators with ``stops_early`` set have their pipelines terminated (see
+    :func:`~dffs.utils.join_pipelines`) as soon as they return, rather than run to completion.
+
+    Args:
+        labels: Names of the inputs, for the output line
+    """
+    labels: tuple[str, str] = ('a', 'b')
+
+    stops_early: ClassVar[bool] = True
+
+    def __call__(self, in1: BinaryIO, in2: BinaryIO, out: BinaryIO) -> int:
+        offset = 0  # Bytes compared (and equal) so far
+        lines = 0  # Newlines among them
+        last = b''  # The last byte compared
+        buf1 = buf2 = b''
+        while True:
+            if not buf1:
+                buf1 = in1.read1(READ_SIZE)
+            if not buf2:
+                buf2 = in2.read1(READ_SIZE)
+            if not buf1 or not buf2:
+                break
+            n = min(len(buf1), len(buf2))
+            a, b = buf1[:n], buf2[:n]
+            if a != b:
+                idx = _mismatch(a, b)
+                label1, label2 = self.labels
+                line = lines + a.count(b'\n', 0, idx) + 1
+                out.write(f'{label1} {label2} differ: byte {offset + idx + 1}, line {line}\n'.encode())
+                return 1
+            offset += n
+            lines += a.count(b'\n')
+            last = a[-1:]
+            buf1, buf2 = buf1[n:], buf2[n:]
+        if not buf1 and not buf2:
+            return 0
+        # One input ended first (like ``cmp``, report whether it ended mid-line)
+        shorter = self.labels[0] if not buf1 else self.labels[1]
+        if not offset:
+            msg = f'EOF on {shorter} which is empty'
+        elif last == b'\n':
+            msg = f'EOF on {shorter} after byte {offset}, line {lines}'
+        else:
+            msg = f'EOF on {shorter} after byte {offset}, in line {lines + 1}'
+        out.write(f'{msg}\n'.encode())
+        return 1
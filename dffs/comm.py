@@ -0,0 +1,285 @@
+"""In-process ``comm``s, usable as :func:`~dffs.utils.join_pipelines` comparators."""
+
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from tempfile import SpooledTemporaryFile
+from threading import Thread
+from typing import BinaryIO, Iterable
+
+from dffs.sort import ExternalSort
+from dffs.utils import DEFAULT_SPOOL_SIZE
+
+# Bytes of output buffered before each write
+OUTPUT_CHUNK_SIZE = 64 * 1024
+# Bytes of each distinct line's digest, by which :class:`LineCounts` identifies it
+DIGEST_SIZE = 16
+# Initial size of :class:`LineCounts`' table (a power of 2, doubled as needed)
+MIN_SLOTS = 1024
+
+
+class LineCounts:
+    """Multiset of lines, indexed by digest, with the lines themselves spooled (in memory, then on disk).
+
+    Each distinct line gets an entry, found by a ``DIGEST_SIZE``-byte BLAKE2b digest of its comparison key: digests,
+    and per-entry spool offsets and counts, are held in compact ``array``s, indexed by an open-addressing table (also
+    an ``array``) of entry IDs. A digest match is verified against the entry's spooled line, and lines whose digest
+    matches a different line's are indexed separately (by value). The spool is otherwise only read sequentially, by
+    :meth:`unmatched`. With ``case_insensitive``, lines are compared (and digested) lowercased.
+    """
+
+    def __init__(self, case_insensitive: bool = False, spool_size: int = DEFAULT_SPOOL_SIZE):
+        self.case_insensitive = case_insensitive
+        self.spool = SpooledTemporaryFile(max_size=spool_size)
+        # Entry ID in each slot (-1 if empty), at a slot derived from its digest (or the next free one after it)
+        self.slots = array('q', [-1]) * MIN_SLOTS
+        self.collisions: dict[bytes, int] = {}
+        # Per entry: digest, spool offset of its first occurrence, number of occurrences, and number matched by
+        # :meth:`take`
+        self.digests = bytearray()
+        self.offsets = array('q')
+        self.counts = array('q')
+        self.matched = array('q')
+        # Number of spooled lines
+        self.total = 0
+
+    def key(self, line: bytes) -> bytes:
+        return line.lower() if self.case_insensitive else line
+
+    def _line_at(self, offset: int) -> bytes:
+        pos = self.spool.tell()
+        self.spool.seek(offset)
+        line = self.spool.readline()
+        self.spool.seek(pos)
+        return line[:-1]
+
+    def _probe(self, key: bytes) -> tuple[bytes, int, int]:
+        """``key``'s digest; the slot holding the entry with that digest, or the free one it would go in; and that
+        entry's ID (-1 if absent)."""
+        digest = blake2b(key, digest_size=DIGEST_SIZE).digest()
+        slots, digests = self.slots, self.digests
+        mask = len(slots) - 1
+        slot = int.from_bytes(digest[:8], 'little') & mask
+        while True:
+            id = slots[slot]
+            if id < 0 or digests[id * DIGEST_SIZE:(id + 1) * DIGEST_SIZE] == digest:
+                return digest, slot, id
+            slot = (slot + 1) & mask
+
+    def _verify(self, key: bytes, id: int) -> int:
+        """The ID of ``key``'s entry, given that of the entry with its digest: that one, if its line matches, else
+        the one ``key`` collided into (-1 if none)."""
+        if self.key(self._line_at(self.offsets[id])) == key:
+            return id
+        return self.collisions.get(key, -1)
+
+    def find(self, line: bytes) -> int | None:
+        """Entry ID of ``line``, if present."""
+        key = self.key(line)
+        id = self._probe(key)[2]
+        if id >= 0:
+            id = self._verify(key, id)
+        return None if id < 0 else id
+
+    def _grow(self) -> None:
+        slots = self.slots = array('q', [-1]) * (2 * len(self.slots))
+        mask = len(slots) - 1
+        digests = self.digests
+        # Entries whose digest collided with another's are indexed by value, not in the table
+        collided = set(self.collisions.values())
+        for id in range(len(self.counts)):
+            if id in collided:
+                continue
+            slot = int.from_bytes(digests[id * DIGEST_SIZE:id * DIGEST_SIZE + 8], 'little') & mask
+            while slots[slot] >= 0:
+                slot = (slot + 1) & mask
+            slots[slot] = id
+
+    def add(self, line: bytes) -> None:
+        """Add a line (without its trailing newline)."""
+        key = self.key(line)
+        digest, slot, id = self._probe(key)
+        collided = False
+        if id >= 0:
+            id = self._verify(key, id)
+            collided = id < 0
+        if id < 0:
+            id = len(self.counts)
+            self.digests += digest
+            self.offsets.append(self.spool.tell())
+            self.counts.append(0)
+            self.matched.append(0)
+            if collided:
+                self.collisions[key] = id
+            else:
+                self.slots[slot] = id
+                # Keep the table at most half full, so probe sequences stay short
+                if 2 * len(self.counts) > len(self.slots):
+                    self._grow()
+        self.counts[id] += 1
+        self.total += 1
+        self.spool.write(line + b'\n')
+
+    def read(self, stream: Iterable[bytes]) -> None:
+        for line in stream:
+            self.add(line[:-1] if line.endswith(b'\n') else line)
+
+    def take(self, line: bytes) -> bool:
+        """Match one (as yet unmatched) occurrence of ``line``, if there is one."""
+        id = self.find(line)
+        if id is None or self.matched[id] == self.counts[id]:
+            return False
+        self.matched[id] += 1
+        return True
+
+    def unmatched(self) -> Iterable[bytes]:
+        """Occurrences not matched by :meth:`take` (the last ones of each line), in order."""
+        remaining = array('q', self.matched)
+        spool, key, probe, verify = self.spool, self.key, self._probe, self._verify
+        spool.seek(0)
+        while line := spool.readline():
+            line = line[:-1]
+            id = probe(key(line))[2]
+            # Lines were verified as they were added, so a digest identifies its line's entry, unless digests collided
+            if self.collisions:
+                id = verify(key(line), id)
+            if remaining[id]:
+                remaining[id] -= 1
+            else:
+                yield line
+
+
+@dataclass
+class Comm:
+    """Base for in-process ``comm`` comparators (see :func:`~dffs.utils.join_pipelines`), writing ``comm``-style
+    columns (or their sizes). Subclasses assign lines to columns in :meth:`columns`.
+
+    Args:
+        exclude_1: Omit column 1 (lines only in the first input)
+        exclude_2: Omit column 2 (lines only in the second input)
+        exclude_3: Omit column 3 (lines in both)
+        case_insensitive: Compare lines case-insensitively
+        counts: Write the number of lines in each (non-omitted) column, tab-separated, instead of the lines
+    """
+    exclude_1: bool = False
+    exclude_2: bool = False
+    exclude_3: bool = False
+    case_insensitive: bool = False
+    counts: bool = False
+
+    def columns(self, in1: BinaryIO, in2: BinaryIO) -> Iterable[tuple[int, bytes]]:
+        """``(column, line)`` pairs (lines without trailing newlines), with columns numbered as in ``comm``'s
+        ``-1``/``-2``/``-3``."""
+        raise NotImplementedError
+
+    def __call__(self, in1: BinaryIO, in2: BinaryIO, out: BinaryIO) -> int:
+        excluded = {1: self.exclude_1, 2: self.exclude_2, 3: self.exclude_3}
+        if self.counts:
+            counts = {1: 0, 2: 0, 3: 0}
+            for col, _ in self.columns(in1, in2):
+                counts[col] += 1
+            out.write(b'\t'.join(b'%d' % counts[col] for col in (1, 2, 3) if not excluded[col]) + b'\n')
+            return 0
+        prefixes = {
+            1: b'',
+            2: b'' if self.exclude_1 else b'\t',
+            3: b'\t' * ((not self.exclude_1) + (not self.exclude_2)),
+        }
+        buf = bytearray()
+        for col, line in self.columns(in1, in2):
+            if excluded[col]:
+                continue
+            buf += prefixes[col] + line + b'\n'
+            if len(buf) >= OUTPUT_CHUNK_SIZE:
+                out.write(bytes(buf))
+                buf.clear()
+        if buf:
+            out.write(bytes(buf))
+        return 0
+
+
+@dataclass
+class HashComm(Comm):
+    """Select or reject lines common to two (unsorted) byte streams in-process.
+
+    The second input is read into a :class:`LineCounts`, then the first is streamed against it, so neither needs
+    sorting. Like ``comm`` on sorted inputs, duplicate lines are matched one for one. Lines only in the first input
+    (column 1) and lines in both (column 3) are written in the first input's order; lines only in the second input
+    (column 2) follow, in its order.
+
+    Args:
+        spool_size: Bytes of the second input held in memory (before spilling to a temporary file)
+    """
+    spool_size: int = DEFAULT_SPOOL_SIZE
+
+    def columns(self, in1: BinaryIO, in2: BinaryIO) -> Iterable[tuple[int, bytes]]:
+        lines = LineCounts(self.case_insensitive, spool_size=self.spool_size)
+        with lines.spool:
+            lines.read(in2)
+            for line in in1:
+                if line.endswith(b'\n'):
+                    line = line[:-1]
+                yield (3 if lines.take(line) else 1), line
+            if self.counts:
+                matched = sum(lines.matched)
+                for _ in range(lines.total - matched):
+                    yield 2, b''
+            elif not self.exclude_2:
+                for line in lines.unmatched():
+                    yield 2, line
+
+
+@dataclass
+class SortedComm(Comm):
+    """Select or reject lines common to two byte streams in-process, sorting each (with :class:`ExternalSort`) first.
+
+    Both inputs are sorted concurrently (each is read in its own thread), then merged like ``comm`` does, comparing
+    lines in byte order (or by lowercased bytes, with ``case_insensitive``). Inputs that are already sorted are passed
+    through without sorting.
+
+    Args:
+        sort: Sort settings (memory budget, worker processes, spill directory); ``case_insensitive`` overrides its own
+    """
+    sort: ExternalSort = field(default_factory=ExternalSort)
+
+    def columns(self, in1: BinaryIO, in2: BinaryIO) -> Iterable[tuple[int, bytes]]:
+        sort = self.sort
+        sort.case_insensitive = self.case_insensitive
+        key = sort.key or (lambda line: line)
+        # Read the second input in the background, so that both pipelines drain concurrently
+        read2 = []
+        thread = Thread(target=lambda: read2.append(sort.read(in2)), daemon=True)
+        thread.start()
+        it1 = iter(sort.read(in1))
+        thread.join()
+        if not read2:
+            raise ValueError("Failed to read second input")
+        it2 = iter(read2[0])
+        line1 = next(it1, None)
+        line2 = next(it2, None)
+        while line1 is not None and line2 is not None:
+            key1, key2 = key(line1), key(line2)
+            if key1 < key2:
+                yield 1, line1
+                line1 = next(it1, None)
+            elif key2 < key1:
+                yield 2, line2
+                line2 = next(it2, None)
+            else:
+                yield 3, line1
+                line1 = next(it1, None)
+                line2 = next(it2, None)
+        while line1 is not None:
+            yield 1, line1
+            line1 = next(it1, None)
+        while line2 is not None:
+            yield 2, line2
+            line2 = next(it2, None)
+
+    def __call__(self, in1: BinaryIO, in2: BinaryIO, out: BinaryIO) -> int:
+        try:
+            return super().__call__(in1, in2, out)
+        finally:
+            self.sort.close()
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import subprocess
+from pathlib import Path
+
 from click import option, command
-from utz import process
 
-from dffs.cli import args, shell_exec_opt, no_shell_opt, verbose_opt, exec_cmd_opt, version_opt
-from dffs.utils import join_pipelines
+from dffs.base import err
+from dffs.cli import args, cache_hash_opt, cache_opt, shell_exec_opt, no_shell_opt, parse_size_opt, timings_json_opt, timings_opt, trace_opt, verbose_opt, exec_cmd_opt, version_opt
+from dffs.utils import join_pipelines, path_pipeline
+
+# Modules only needed by some options (in-process comparators, caches, `--timings`, …) are imported when those are
+# used, to keep startup (paid on every invocation, e.g. from editor hooks and Git aliases) fast
 
 
 @command('comm-x', short_help='comm two files after running them through a pipeline of other commands', no_args_is_help=True)
@@ -12,8 +18,19 @@ from dffs.utils import join_pipelines
 @option('-2', '--exclude-2', is_flag=True, help='Exclude lines only found in the second pipeline')
 @option('-3', '--exclude-3', is_flag=True, help='Exclude lines found in both pipelines')
 @option('-i', '--case-insensitive', is_flag=True, help='Case insensitive comparison')
+@option('-u', '--unsorted', is_flag=True, help="Compare in-process, by hashing the second pipeline's lines (instead of running `comm`), so inputs needn't be sorted; columns 1 and 3 follow the first input's order, then column 2 follows the second's")
+@option('--counts', is_flag=True, help='Print the number of lines in each (non-excluded) column, tab-separated, instead of the lines; implies `-u` (unless `--sort` is passed)')
+@option('--sort', is_flag=True, help="Sort each pipeline's output in-process (in byte order, like `LC_ALL=C sort`), then compare in-process (instead of running `comm`); outputs that are already sorted are passed through")
+@option('--sort-memory', callback=parse_size_opt, envvar='DFFS_SORT_MEMORY', help='With `--sort`: bytes of each output to buffer (e.g. `500M`, `1Gi`) before sorting it in parallel runs, spilled to disk and merged; default 256MiB')
+@option('--sort-jobs', type=int, default=0, help='With `--sort`: processes to sort spilled runs with (default 0: one per CPU)')
+@option('--spill-dir', envvar='DFFS_SPILL_DIR', help='With `--sort`: directory to spill sorted runs to; defaults to the system temp directory')
+@cache_opt
+@cache_hash_opt
 @shell_exec_opt
 @no_shell_opt
+@timings_opt
+@timings_json_opt
+@trace_opt
 @version_opt
 @verbose_opt
 @exec_cmd_opt
@@ -23,8 +40,18 @@ def main(
     exclude_2: bool,
     exclude_3: bool,
     case_insensitive: bool,
+    unsorted: bool,
+    counts: bool,
+    sort: bool,
+    sort_memory: int | None,
+    sort_jobs: int,
+    spill_dir: str | None,
+    cache: bool,
+    cache_hash: bool,
     shell_executable: str | None,
     no_shell: bool,
+    timings_fmt: str | None,
+    trace_path: str | None,
     verbose: bool,
     exec_cmds: tuple[str, ...],
     args: tuple[str, ...],
@@ -35,22 +62,83 @@ def main(
 
     *cmds, path1, path2 = args
     cmds = list(exec_cmds) + cmds
+    if unsorted and sort:
+        raise ValueError("Specify at most one of -u/--unsorted, --sort")
+    flags = dict(
+        exclude_1=exclude_1,
+        exclude_2=exclude_2,
+        exclude_3=exclude_3,
+        case_insensitive=case_insensitive,
+        counts=counts,
+    )
+    if sort:
+        from dffs.comm import SortedComm
+        from dffs.sort import DEFAULT_SORT_MEMORY, ExternalSort
+        sorter = ExternalSort(
+            memory=DEFAULT_SORT_MEMORY if sort_memory is None else sort_memory,
+            jobs=sort_jobs,
+            spill_dir=spill_dir,
+        )
+        base_cmd = SortedComm(sort=sorter, **flags)
+    elif unsorted or counts:
+        from dffs.comm import HashComm
+        base_cmd = HashComm(**flags)
+    else:
+        base_cmd = [
+            'comm',
+            *(['-1'] if exclude_1 else []),
+            *(['-2'] if exclude_2 else []),
+            *(['-3'] if exclude_3 else []),
+            *(['-i'] if case_insensitive else []),
+        ]
+    trace = timings = None
+    if trace_path:
+        from dffs.trace import Trace
+        trace = Trace()
+    if timings_fmt or trace:
+        from dffs.timings import Timings
+        timings = Timings()
     if cmds:
-        first, *rest = cmds
+        cmds1, input1 = path_pipeline(cmds, path1)
+        cmds2, input2 = path_pipeline(cmds, path2)
+        pipeline_cache = None
+        if cache:
+            from dffs.cache import PipelineCache
+            pipeline_cache = PipelineCache()
+        cache_keys = tuple(
+            PipelineCache.file_key(path, side_cmds, content_hash=cache_hash, executable=shell_executable, shell=not no_shell)
+            for path, side_cmds in ((path1, cmds1), (path2, cmds2))
+        ) if cache else (None, None)
         returncode = join_pipelines(
-            base_cmd=[
-                'comm',
-                *(['-1'] if exclude_1 else []),
-                *(['-2'] if exclude_2 else []),
-                *(['-3'] if exclude_3 else []),
-                *(['-i'] if case_insensitive else []),
-            ],
-            cmds1=[ f'{first} {path1}', *rest ],
-            cmds2=[ f'{first} {path2}', *rest ],
+            base_cmd=base_cmd,
+            cmds1=cmds1,
+            cmds2=cmds2,
             verbose=verbose,
             shell=not no_shell,
             executable=shell_executable,
+            cache=pipeline_cache,
+            cache_keys=cache_keys,
+            inputs=(input1, input2),
+            timings=timings,
+        )
+        if timings_fmt:
+            timings.report(timings_fmt, err)
+        if trace:
+            trace.add(timings)
+            trace.write(trace_path)
+        raise SystemExit(returncode)
+    elif callable(base_cmd):
+        returncode = join_pipelines(
+            base_cmd=base_cmd,
+            cmds1=Path(path1),
+            cmds2=Path(path2),
+            timings=timings,
         )
+        if timings_fmt:
+            timings.report(timings_fmt, err)
+        if trace:
+            trace.add(timings)
+            trace.write(trace_path)
         raise SystemExit(returncode)
     else:
-        process.run(['comm', path1, path2])
+        raise SystemExit(subprocess.run(['comm', path1, path2]).returncode)
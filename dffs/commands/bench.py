@@ -0,0 +1,115 @@
+"""Benchmark commands: run scenarios into a JSON baseline, and compare results against one."""
+
+import json
+import os
+import sys
+from tempfile import gettempdir
+from os.path import join
+
+from click import Choice, argument, option
+from dffs.base import err
+from dffs.bench import CLIS, DEFAULT_PATHS, DEFAULT_SIZES, DEFAULT_STAGES, DEFAULT_THRESHOLD, DISTRIBUTIONS, MIN_WALL_DELTA, compare, run, scenarios, spawn_latency
+
+
+def split(value: str) -> list[str]:
+    return [ v for v in value.split(',') if v ]
+
+
+def bench_run(
+    clis: tuple[str, ...],
+    sizes: str,
+    dists: str,
+    stages: str,
+    shell: str,
+    paths: str,
+    pattern: str | None,
+    repeat: int,
+    data_dir: str,
+    output: str | None,
+) -> None:
+    """Run benchmark scenarios (the cross product of the given parameters), writing results as JSON."""
+    shells = {'both': (True, False), 'shell': (True,), 'no-shell': (False,)}[shell]
+    results = run(
+        scenarios(
+            clis=clis or CLIS,
+            sizes=split(sizes),
+            dists=split(dists),
+            stages=[ int(n) for n in split(stages) ],
+            shells=shells,
+            paths=[ int(n) for n in split(paths) ],
+        ),
+        data_dir=data_dir,
+        repeat=repeat,
+        pattern=pattern,
+        log=err,
+    )
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+def bench_compare(baseline: str, current: str, threshold: float, min_wall_delta: float) -> None:
+    """Compare benchmark results to a baseline; exit 1 if any scenario regressed by more than the threshold."""
+    with open(baseline) as f:
+        base = json.load(f)
+    with open(current) as f:
+        cur = json.load(f)
+    regressions = compare(base, cur, threshold=threshold, min_wall_delta=min_wall_delta)
+    common = set(base['results']) & set(cur['results'])
+    print(f"Compared {len(common)} scenarios ({threshold:.0%} threshold)")
+    for name, metric, old, new in regressions:
+        print(f"REGRESSION {name} {metric}: {old} -> {new} ({new / old - 1:+.1%})")
+    if regressions:
+        raise SystemExit(1)
+
+
+def bench_spawn(shells: tuple[str, ...], stages: int, repeat: int) -> None:
+    """Time starting pipeline stages directly vs. via shells (default: `/bin/sh` and `$SHELL`), per stage."""
+    if not shells:
+        shells = tuple(dict.fromkeys(filter(None, ['/bin/sh', os.environ.get('SHELL')])))
+    results = spawn_latency(shells, stages=stages, repeat=repeat)
+    direct = results['direct']
+    for mode, secs in results.items():
+        overhead = f" (+{(secs - direct) * 1000:.2f}ms)" if mode != 'direct' else ''
+        print(f"{mode}: {secs * 1000:.2f}ms/stage{overhead}")
+
+
+def register(cli):
+    """Register command with CLI."""
+    @cli.group(name='bench')
+    def bench_group():
+        """Benchmark `join_pipelines` and the CLIs on synthetic inputs; compare results against a baseline."""
+
+    bench_group.command(name='run')(
+        option('-c', '--cli', 'clis', multiple=True, type=Choice(CLIS), help='Comparison(s) to benchmark (default: all)')(
+        option('-s', '--sizes', default=','.join(DEFAULT_SIZES), help='Comma-separated input sizes (per input, or per path for `git-diff-x`), e.g. `1K,1M,1G`')(
+        option('-d', '--dists', default=','.join(DISTRIBUTIONS), help=f"Comma-separated line-length distributions ({', '.join(DISTRIBUTIONS)})")(
+        option('-n', '--stages', default=','.join(map(str, DEFAULT_STAGES)), help='Comma-separated pipeline stage counts')(
+        option('--shell', type=Choice(['both', 'shell', 'no-shell']), default='both', help='Run stages via the shell, with `--no-shell`, or both')(
+        option('-p', '--paths', default=','.join(map(str, DEFAULT_PATHS)), help='Comma-separated path counts (`git-diff-x`)')(
+        option('-k', '--pattern', help='Only run scenarios whose names match this glob, e.g. `diff-x/1M/*`')(
+        option('-r', '--repeat', type=int, default=3, help='Runs per scenario (median times are reported)')(
+        option('-D', '--data-dir', default=join(gettempdir(), 'dffs-bench'), help='Directory to generate (and reuse) inputs in')(
+        option('-o', '--output', help='Write results to this JSON file (default: stdout)')(
+            bench_run
+        ))))))))))
+    )
+    bench_group.command(name='compare')(
+        argument('baseline')(
+        argument('current')(
+        option('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD, help='Fractional increase in wall time, peak RSS, or process count reported as a regression')(
+        option('-w', '--min-wall-delta', type=float, default=MIN_WALL_DELTA, help='Ignore wall-time increases smaller than this many seconds')(
+            bench_compare
+        ))))
+    )
+    bench_group.command(name='spawn')(
+        option('-s', '--shell', 'shells', multiple=True, help='Shell(s) to compare to running stages directly (default: `/bin/sh`, and `$SHELL`)')(
+        option('-n', '--stages', type=int, default=4, help='Pipeline stages (`cat`s) per run')(
+        option('-r', '--repeat', type=int, default=20, help='Runs per mode (median times are reported)')(
+            bench_spawn
+        )))
+    )
@@ -0,0 +1,60 @@
+"""Cache inspection/maintenance command."""
+
+from click import option, pass_context
+
+from dffs.base import fmt_size
+from dffs.cache import PipelineCache, ResultCache
+from dffs.cli import parse_size_opt
+
+# Caches managed by `dffs cache`, with display names
+CACHES = (('Pipeline outputs', PipelineCache), ('Comparison results', ResultCache))
+
+
+def info() -> None:
+    """Show the location, size, and hit/miss statistics of the pipeline-output and comparison-result caches."""
+    for idx, (name, cls) in enumerate(CACHES):
+        stats = cls().stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = f" ({stats['hits'] / lookups:.1%} hit rate)" if lookups else ''
+        if idx:
+            print()
+        print(f"{name}:")
+        print(f"  Directory: {stats['root']}")
+        print(f"  Entries: {stats['entries']}")
+        print(f"  Size: {fmt_size(stats['size'])} / {fmt_size(stats['max_size'])}")
+        print(f"  Hits: {stats['hits']}, misses: {stats['misses']}{hit_rate}")
+
+
+def prune(max_size: int | None) -> None:
+    """Evict expired cache entries, then least-recently-used ones until each cache fits within its size budget."""
+    removed, removed_size = 0, 0
+    for _, cls in CACHES:
+        n, size = cls().prune(max_size)
+        removed += n
+        removed_size += size
+    print(f"Removed {removed} entries ({fmt_size(removed_size)})")
+
+
+def clear() -> None:
+    """Remove all cache entries and statistics."""
+    for _, cls in CACHES:
+        cls().clear()
+
+
+def register(cli):
+    """Register command with CLI."""
+    @cli.group(name='cache', invoke_without_command=True)
+    @pass_context
+    def cache_group(ctx):
+        """Inspect and prune the pipeline-output and comparison-result caches (see `--cache`, `--result-cache`); shows
+        `info` if no subcommand is given."""
+        if ctx.invoked_subcommand is None:
+            info()
+
+    cache_group.command(name='info')(info)
+    cache_group.command(name='prune')(
+        option('-s', '--max-size', callback=parse_size_opt, help="Size to prune down to (e.g. `500M`, `1Gi`); defaults to each cache's budget (`$DFFS_CACHE_SIZE`, 1GiB; `$DFFS_RESULT_CACHE_SIZE`, 256MiB)")(
+            prune
+        )
+    )
+    cache_group.command(name='clear')(clear)
@@ -0,0 +1,48 @@
+"""Daemon command: serve CLI invocations from the current repository, to skip their startup costs."""
+
+import os
+
+from click import option
+
+from dffs.base import err
+from dffs.client import find_root
+from dffs import daemon
+
+
+def serve(idle_timeout: str, detach: bool, stop: bool, verbose: bool) -> None:
+    """Run `diff-x`, `comm-x`, `git-diff-x`, and `git-log-x` invocations from within the current repository (or,
+    outside a repository, from outside any), in workers forked from this process, which has already imported their
+    modules; exits once idle for `--idle-timeout`."""
+    from dffs.cache import parse_duration
+
+    root = find_root(os.getcwd())
+    if stop:
+        pid = daemon.stop(root)
+        if pid is None:
+            err(f"No dffs daemon is serving {root or 'paths outside repositories'}")
+            raise SystemExit(1)
+        err(f"Stopped dffs daemon {pid}")
+        return
+    listener = daemon.listen(root)
+    if detach and daemon.detach():
+        # Listening already, so clients started from here on are served
+        listener.close()
+        return
+    daemon.serve(
+        root,
+        idle_timeout=parse_duration(idle_timeout),
+        log=err if verbose else None,
+        listener=listener,
+    )
+
+
+def register(cli):
+    """Register command with CLI."""
+    cli.command(name='serve')(
+        option('-i', '--idle-timeout', default=str(daemon.DEFAULT_IDLE_TIMEOUT), envvar='DFFS_DAEMON_IDLE_TIMEOUT', help='Exit after this long without requests (seconds, or e.g. `30m`, `1h`)')(
+        option('-d', '--detach', is_flag=True, help='Serve in the background')(
+        option('--stop', is_flag=True, help='Stop the daemon serving the current repository')(
+        option('-v', '--verbose', is_flag=True, help='Log each request to stderr')(
+            serve
+        ))))
+    )
@@ -3,9 +3,9 @@
 from os import environ
 from pathlib import Path
 
-from click import Choice
-from utz import err
-from utz.cli import arg
+from click import Choice, argument
+
+from dffs.base import err
 
 
 def shell_integration(shell: str | None, cli: str | None = None) -> None:
@@ -103,8 +103,8 @@ def shell_integration(shell: str | None, cli: str | None = None) -> None:
 def register(cli):
     """Register command with CLI."""
     cli.command(name='shell-integration')(
-        arg('shell', type=Choice(['bash', 'zsh', 'fish']), required=False)(
-            arg('cli', type=Choice(['diff-x', 'comm-x', 'git-diff-x']), required=False)(
+        argument('shell', type=Choice(['bash', 'zsh', 'fish']), required=False)(
+            argument('cli', type=Choice(['diff-x', 'comm-x', 'git-diff-x']), required=False)(
                 shell_integration
             )
         )
@@ -0,0 +1,272 @@
+"""Keyed CSV row diffs, usable as :func:`~dffs.utils.join_pipelines` comparators."""
+
+from __future__ import annotations
+
+import csv
+import gc
+import json
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import TextIOWrapper
+from operator import itemgetter
+from os.path import join
+from tempfile import TemporaryDirectory
+from typing import BinaryIO, Callable, Iterable, Iterator
+
+from dffs.engine import CYAN, GREEN, OUTPUT_CHUNK_SIZE, RED, RESET
+from dffs.utils import ComparatorError
+
+# Default memory budget for the second input's rows (beyond which both inputs are partitioned on disk)
+DEFAULT_JOIN_MEMORY = 256 * 1024 * 1024
+# Number of on-disk partitions (by key hash) inputs are split into, when the second doesn't fit in memory
+DEFAULT_PARTITIONS = 64
+# Approximate overhead (beyond their characters) of holding a row, and each of its fields, in memory
+ROW_OVERHEAD = 120
+FIELD_OVERHEAD = 56
+
+Row = list[str]
+Key = tuple[str, ...]
+# A keyed difference: ``('-', key, row1)``, ``('+', key, row2)``, or ``('~', key, [(column, value1, value2), ...])``
+Record = tuple[str, Key, list]
+
+
+class CsvKeyError(ValueError):
+    """An input lacks a key column, or has a duplicate key."""
+
+
+@contextmanager
+def _no_gc() -> Iterator[None]:
+    """Pause cyclic GC, while loading rows into a hash table: rows are lists of strings (which can't form reference
+    cycles), so GC passes over them are pure cost."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _rows(stream: BinaryIO) -> Iterator[Row]:
+    return csv.reader(TextIOWrapper(stream, encoding='utf-8', errors='surrogateescape', newline=''))
+
+
+def _size(row: Row) -> int:
+    return ROW_OVERHEAD + FIELD_OVERHEAD * len(row) + sum(map(len, row))
+
+
+def _key_fn(idxs: list[int]) -> Callable[[Row], Key]:
+    """Function extracting a row's key (the fields at ``idxs``; missing trailing fields are empty)."""
+    get = itemgetter(*idxs) if idxs else (lambda row: ())
+    single = len(idxs) == 1
+
+    def key(row: Row) -> Key:
+        try:
+            value = get(row)
+        except IndexError:
+            return tuple(row[idx] if idx < len(row) else '' for idx in idxs)
+        return (value,) if single else value
+
+    return key
+
+
+def _fmt(value: str) -> str:
+    """Display form of a field: as is, unless it's empty or ambiguous (then JSON-quoted)."""
+    if value and value.strip() == value and not any(c in value for c in ',="\n'):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+class Partitions:
+    """Rows of both inputs, split by key hash into files (so each pair of partitions can be joined in memory)."""
+
+    def __init__(self, n: int, spill_dir: str | None = None):
+        self.tmpdir = TemporaryDirectory(dir=spill_dir, prefix='dffs-csv-')
+        self.paths = [ [ join(self.tmpdir.name, f'{side}-{idx}.csv') for idx in range(n) ] for side in (1, 2) ]
+        self.files = [ [ open(path, 'w', newline='', encoding='utf-8', errors='surrogateescape') for path in paths ] for paths in self.paths ]
+        self.writers = [ [ csv.writer(f, lineterminator='\n') for f in files ] for files in self.files ]
+
+    def add(self, side: int, key: Key, row: Row) -> None:
+        writers = self.writers[side - 1]
+        writers[hash(key) % len(writers)].writerow(row)
+
+    def close(self) -> None:
+        for files in self.files:
+            for f in files:
+                f.close()
+
+    def read(self, side: int, idx: int) -> Iterator[Row]:
+        with open(self.paths[side - 1][idx], newline='', encoding='utf-8', errors='surrogateescape') as f:
+            yield from csv.reader(f)
+
+    def cleanup(self) -> None:
+        self.close()
+        self.tmpdir.cleanup()
+
+
+@dataclass
+class CsvDiff:
+    """Diff two CSVs by primary key, reporting added, removed, and changed rows (with the columns that changed).
+
+    The second input is loaded into a hash table (by key), then the first is streamed against it; neither needs to
+    be sorted. If the second input's rows exceed ``memory``, both inputs are instead partitioned (by key hash) into
+    temporary files, and each pair of partitions is joined in memory.
+
+    Output has one line per differing key: ``- <key>: <row>`` (only in the first input), ``+ <key>: <row>`` (only in
+    the second), or ``~ <key>: <column>: <old> -> <new>, ...``. Removed and changed rows are reported in the first
+    input's order, then added rows in the second's (within each partition, when partitioned). Columns are matched by
+    header name; a header line reports columns only present on one side. Returns 1 if there are differences (like
+    ``diff``), else 0; if an input lacks a key column or has a duplicate key, raises a
+    :class:`~dffs.utils.ComparatorError` (exit code 2).
+
+    Args:
+        key: Column name(s) identifying rows; each key must be unique within each input
+        color: Colorize output
+        memory: Approximate bytes of the second input's rows to hold in memory before partitioning
+        partitions: Number of partitions to split inputs into, when partitioning
+        spill_dir: Directory for partitions; defaults to the system temp directory
+    """
+    key: tuple[str, ...]
+    color: bool = False
+    memory: int = DEFAULT_JOIN_MEMORY
+    partitions: int = DEFAULT_PARTITIONS
+    spill_dir: str | None = None
+
+    def _key_idxs(self, header: Row, side: int) -> list[int]:
+        if not header:
+            return []
+        missing = [ col for col in self.key if col not in header ]
+        if missing:
+            raise CsvKeyError(f"Key column(s) not found in input {side}: {', '.join(missing)} (header: {', '.join(header)})")
+        return [ header.index(col) for col in self.key ]
+
+    def records(self, in1: BinaryIO, in2: BinaryIO) -> tuple[Row, Row, Iterator[Record]]:
+        """Both inputs' headers, and the differences between their rows."""
+        rows1 = _rows(in1)
+        rows2 = _rows(in2)
+        header1 = next(rows1, [])
+        header2 = next(rows2, [])
+        # An empty input (e.g. a file that doesn't exist on one side) has no rows, and no column changes
+        header1 = header1 or header2
+        header2 = header2 or header1
+        idxs1 = self._key_idxs(header1, 1)
+        idxs2 = self._key_idxs(header2, 2)
+        # Columns compared for rows in both inputs: (name, index in first input, index in second)
+        common = [ (col, idx, header2.index(col)) for idx, col in enumerate(header1) if col in header2 and col not in self.key ]
+        # With identical headers, equal rows needn't be compared column by column
+        same_header = header1 == header2
+
+        key1 = _key_fn(idxs1)
+        key2 = _key_fn(idxs2)
+
+        def load(rows: Iterable[Row]) -> dict[Key, Row]:
+            table = {}
+            with _no_gc():
+                for row in rows:
+                    key = key2(row)
+                    if key in table:
+                        raise CsvKeyError(f"Duplicate key in input 2: {self.format_key(key)}")
+                    table[key] = row
+            return table
+
+        def join(rows: Iterable[Row], table: dict[Key, Row]) -> Iterator[Record]:
+            seen = set()
+            for row1 in rows:
+                key = key1(row1)
+                if key in seen:
+                    raise CsvKeyError(f"Duplicate key in input 1: {self.format_key(key)}")
+                seen.add(key)
+                row2 = table.pop(key, None)
+                if row2 is None:
+                    yield '-', key, row1
+                    continue
+                if same_header and row1 == row2:
+                    continue
+                deltas = []
+                for col, idx1, idx2 in common:
+                    value1 = row1[idx1] if idx1 < len(row1) else ''
+                    value2 = row2[idx2] if idx2 < len(row2) else ''
+                    if value1 != value2:
+                        deltas.append((col, value1, value2))
+                if deltas:
+                    yield '~', key, deltas
+            for key, row2 in table.items():
+                yield '+', key, row2
+
+        def generate() -> Iterator[Record]:
+            table = {}
+            size = 0
+            parts = None
+            try:
+                with _no_gc():
+                    for row in rows2:
+                        if parts:
+                            parts.add(2, key2(row), row)
+                            continue
+                        key = key2(row)
+                        if key in table:
+                            raise CsvKeyError(f"Duplicate key in input 2: {self.format_key(key)}")
+                        table[key] = row
+                        size += _size(row)
+                        if size >= self.memory:
+                            parts = Partitions(self.partitions, self.spill_dir)
+                            for table_key, table_row in table.items():
+                                parts.add(2, table_key, table_row)
+                            table = {}
+                if not parts:
+                    yield from join(rows1, table)
+                    return
+                for row in rows1:
+                    parts.add(1, key1(row), row)
+                parts.close()
+                for idx in range(self.partitions):
+                    yield from join(parts.read(1, idx), load(parts.read(2, idx)))
+            finally:
+                if parts:
+                    parts.cleanup()
+
+        return header1, header2, generate()
+
+    def format_key(self, key: Key) -> str:
+        return ','.join(f'{col}={_fmt(value)}' for col, value in zip(self.key, key))
+
+    def lines(self, header1: Row, header2: Row, records: Iterable[Record]) -> Iterator[str]:
+        red, green, cyan, reset = ( c.decode() if self.color else '' for c in (RED, GREEN, CYAN, RESET) )
+        removed = [ col for col in header1 if col not in header2 ]
+        added = [ col for col in header2 if col not in header1 ]
+        if removed or added:
+            cols = [ *(f'{red}-{col}{reset}' for col in removed), *(f'{green}+{col}{reset}' for col in added) ]
+            yield f'{cyan}columns:{reset} {" ".join(cols)}\n'
+
+        def fields(header: Row, row: Row) -> str:
+            return ', '.join(f'{col}={_fmt(value)}' for col, value in zip(header, row) if col not in self.key)
+
+        for op, key, data in records:
+            key_str = self.format_key(key)
+            if op == '-':
+                yield f'{red}- {key_str}: {fields(header1, data)}{reset}\n'
+            elif op == '+':
+                yield f'{green}+ {key_str}: {fields(header2, data)}{reset}\n'
+            else:
+                deltas = ', '.join(f'{col}: {red}{_fmt(value1)}{reset} -> {green}{_fmt(value2)}{reset}' for col, value1, value2 in data)
+                yield f'{cyan}~ {key_str}:{reset} {deltas}\n'
+
+    def __call__(self, in1: BinaryIO, in2: BinaryIO, out: BinaryIO) -> int:
+        returncode = 0
+        buf = bytearray()
+        try:
+            header1, header2, records = self.records(in1, in2)
+            for line in self.lines(header1, header2, records):
+                returncode = 1
+                buf += line.encode(errors='surrogateescape')
+                if len(buf) >= OUTPUT_CHUNK_SIZE:
+                    out.write(bytes(buf))
+                    buf.clear()
+        except CsvKeyError as e:
+            # After any differences found before it
+            if buf:
+                out.write(bytes(buf))
+            raise ComparatorError(f"--csv-key: {e}") from e
+        if buf:
+            out.write(bytes(buf))
+        return returncode
@@ -0,0 +1,368 @@
+"""``dffs serve``: a long-lived process that runs ``diff-x``, ``comm-x``, ``git-diff-x``, and ``git-log-x`` invocations
+for one repository, handed to it over a Unix socket by :mod:`dffs.client`.
+
+The daemon imports every CLI (and comparator, cache, …) module once; each invocation then runs in a worker forked from
+it, which skips Python startup and imports. Workers run one invocation at a time, and are kept for later ones, which
+reuse their ``git cat-file`` processes (see :func:`~dffs.blobs.blob_reader`). Clients find their repository (and so
+their daemon) by looking for a ``.git`` in the cwd and its parents, without spawning ``git``. Workers run in the
+client's cwd and environment, with the client's stdin/stdout/stderr (passed over the socket), so concurrent invocations
+are isolated from each other and from the daemon.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import signal
+import socket
+import sys
+import traceback
+from dataclasses import dataclass
+from importlib import import_module
+from select import select
+from time import monotonic
+from typing import Callable
+
+from dffs.blobs import keep_readers
+from dffs.cache import flush_stats
+from dffs.client import HEADER, runtime_dir, send, socket_path
+from dffs.pipeline import _which
+
+# Module of each CLI a daemon runs
+CLIS = {
+    'diff-x': 'dffs.diff_x',
+    'comm-x': 'dffs.comm_x',
+    'git-diff-x': 'dffs.git_diff_x',
+    'git-log-x': 'dffs.git_log_x',
+}
+# Modules the CLIs import lazily (depending on their options), preloaded so workers needn't
+PRELOAD = (
+    'concurrent.futures',
+    'dffs.cache',
+    'dffs.comm',
+    'dffs.csv_diff',
+    'dffs.engine',
+    'dffs.normalize',
+    'dffs.sort',
+    'dffs.timings',
+    'dffs.trace',
+)
+# Workers kept waiting for requests (with their state, e.g. `git cat-file` processes), after a burst of concurrent ones
+MAX_IDLE_WORKERS = 4
+# Default seconds a daemon waits for a request (after its last request finishes) before exiting
+DEFAULT_IDLE_TIMEOUT = 600
+# Seconds between checks for exited workers and idleness
+POLL_INTERVAL = 1
+# Seconds allowed for a client to send its request
+REQUEST_TIMEOUT = 5
+
+
+def recv_exact(conn: socket.socket, n: int, data: bytes = b'') -> bytes:
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise ValueError(f"Connection closed after {len(data)} of {n} bytes")
+        data += chunk
+    return data
+
+
+def recv(conn: socket.socket, maxfds: int = 3) -> tuple[dict, list[int]]:
+    """Receive a request (sent by :func:`dffs.client.send`), and any file descriptors passed with it."""
+    header, fds, _, _ = socket.recv_fds(conn, HEADER.size, maxfds)
+    try:
+        (size,) = HEADER.unpack(recv_exact(conn, HEADER.size, header))
+        return json.loads(recv_exact(conn, size)), fds
+    except BaseException:
+        for fd in fds:
+            os.close(fd)
+        raise
+
+
+def reply(conn: socket.socket, **msg) -> None:
+    conn.sendall(json.dumps(msg).encode() + b'\n')
+
+
+def listen(root: str | None) -> socket.socket:
+    """Listen on ``root``'s daemon socket, in a directory only this user can access; fails if a daemon is already
+    listening there, and replaces a stale socket left by one that wasn't shut down cleanly."""
+    dirpath = runtime_dir()
+    os.makedirs(dirpath, mode=0o700, exist_ok=True)
+    st = os.stat(dirpath)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{dirpath} must be owned by, and only accessible to, the current user")
+    path = socket_path(root)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(path):
+        try:
+            sock.connect(path)
+        except OSError:
+            os.unlink(path)
+        else:
+            sock.close()
+            raise RuntimeError(f"A dffs daemon is already serving {root or 'paths outside repositories'} ({path})")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen()
+    return sock
+
+
+def run_worker(conn: socket.socket, request: dict) -> int:
+    """Run one invocation in the client's cwd, environment, and stdio (already ``dup2``'d onto fds 0-2)."""
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    # Executables found (on the `$PATH`, relative to the cwd) for an earlier invocation may have moved since
+    _which.cache_clear()
+    prog = request['prog']
+    sys.argv = [prog, *request['argv']]
+    reply(conn, pid=os.getpid())
+    try:
+        import_module(CLIS[prog]).main(args=request['argv'], prog_name=prog)
+        returncode = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            returncode = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except BaseException:
+        traceback.print_exc()
+        returncode = 1
+    # Workers outlive invocations, and exit via `os._exit` (skipping `atexit` handlers)
+    flush_stats()
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (BrokenPipeError, ValueError):
+            pass
+    return returncode
+
+
+def detach_stdio() -> None:
+    """Point fds 0-2 at ``/dev/null`` (so a finished invocation's client sees EOF on its pipes), discarding any output
+    left buffered for them (e.g. by a flush that failed, after the client closed its stdout)."""
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+
+@dataclass
+class Worker:
+    """A worker process, and the daemon's end of the channel it's handed requests over (and reports finishing them
+    on)."""
+    pid: int
+    channel: socket.socket
+
+
+def fork_worker(inherited: list[socket.socket], fds: list[int]) -> Worker:
+    """Fork a worker, which runs requests handed to it (see :func:`handoff`) one at a time, until the daemon closes its
+    channel; state kept by an invocation (e.g. :func:`~dffs.blobs.blob_reader`'s ``git cat-file`` processes) is reused
+    by later ones.
+
+    Args:
+        inherited: Sockets of the daemon's (its listener, other workers' channels, …) for the worker to close
+        fds: File descriptors for the worker to close (e.g. a client's stdio, which it's passed again with its request)
+    """
+    channel, worker_channel = socket.socketpair()
+    pid = os.fork()
+    if pid:
+        worker_channel.close()
+        return Worker(pid=pid, channel=channel)
+    status = 0
+    try:
+        channel.close()
+        for sock in inherited:
+            sock.close()
+        for fd in fds:
+            os.close(fd)
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(sig, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        detach_stdio()
+        keep_readers()
+        while True:
+            try:
+                request, fds = recv(worker_channel, 4)
+            except (OSError, ValueError):
+                # The daemon exited (or retired this worker)
+                break
+            conn_fd, *stdio = fds
+            with socket.socket(fileno=conn_fd) as conn:
+                for target, fd in enumerate(stdio):
+                    os.dup2(fd, target)
+                    os.close(fd)
+                conn.settimeout(None)
+                returncode = run_worker(conn, request)
+                detach_stdio()
+                try:
+                    reply(conn, exit=returncode)
+                except OSError:
+                    pass
+            try:
+                worker_channel.sendall(b'\n')
+            except OSError:
+                break
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def handoff(worker: Worker, conn: socket.socket, request: dict, fds: list[int]) -> None:
+    """Pass a request to an idle worker, with its client's connection and stdio (which the daemon then closes)."""
+    try:
+        send(worker.channel, request, fds=(conn.fileno(), *fds))
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def serve(
+    root: str | None,
+    idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+    log: Callable[[str], None] | None = None,
+    listener: socket.socket | None = None,
+) -> None:
+    """Serve invocations from within ``root`` (or outside any repository, if ``None``) until idle for
+    ``idle_timeout`` seconds, or sent a stop request (or ``SIGTERM``).
+
+    Args:
+        root: Repository root (as found by :func:`~dffs.client.find_root`); requests from other repositories are
+            declined (and run by their clients in-process)
+        idle_timeout: Seconds to wait for a request, once no workers are running, before exiting
+        log: Called with a message about each request
+        listener: Socket to accept requests on; defaults to :func:`listen`'s
+    """
+    from dffs._version import __version__
+
+    for module in (*CLIS.values(), *PRELOAD):
+        import_module(module)
+    sock = listener or listen(root)
+    path = sock.getsockname()
+    bound = os.stat(path).st_ino
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    workers: dict[int, Worker] = {}  # Live workers, by PID
+    idle: list[Worker] = []  # Workers waiting for a request
+    busy: dict[socket.socket, Worker] = {}  # Workers running a request, by channel
+    last = monotonic()
+    try:
+        while True:
+            ready, _, _ = select([sock, *busy], [], [], POLL_INTERVAL)
+            for channel in ready:
+                if channel is sock:
+                    continue
+                worker = busy.pop(channel)
+                last = monotonic()
+                try:
+                    finished = channel.recv(1)
+                except OSError:
+                    finished = b''
+                if finished and len(idle) < MAX_IDLE_WORKERS:
+                    idle.append(worker)
+                else:
+                    # Exited (e.g. killed by a signal relayed from its client), or surplus (it exits once its channel
+                    # closes)
+                    channel.close()
+            while workers:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+                if not pid:
+                    break
+                worker = workers.pop(pid)
+                if worker in idle:
+                    idle.remove(worker)
+                    worker.channel.close()
+            if not busy and monotonic() - last > idle_timeout:
+                if log:
+                    log(f"Idle for {idle_timeout}s, exiting")
+                break
+            if sock not in ready:
+                continue
+            conn, _ = sock.accept()
+            last = monotonic()
+            with conn:
+                conn.settimeout(REQUEST_TIMEOUT)
+                try:
+                    request, fds = recv(conn)
+                except (OSError, ValueError) as e:
+                    if log:
+                        log(f"Bad request: {e}")
+                    continue
+                if request.get('stop'):
+                    if log:
+                        log("Stop requested, exiting")
+                    reply(conn, stopped=os.getpid())
+                    break
+                reason = None
+                if request.get('version') != __version__:
+                    reason = f"version {request.get('version')} (serving {__version__})"
+                elif request.get('root') != root:
+                    reason = f"repository {request.get('root')}"
+                elif request.get('prog') not in CLIS or len(fds) != 3:
+                    reason = f"request for {request.get('prog')}"
+                if reason:
+                    for fd in fds:
+                        os.close(fd)
+                    if log:
+                        log(f"Declined {reason}")
+                    reply(conn, declined=reason)
+                    continue
+                if idle:
+                    worker = idle.pop()
+                else:
+                    worker = fork_worker([sock, conn, *( w.channel for w in workers.values() )], fds)
+                    workers[worker.pid] = worker
+                try:
+                    handoff(worker, conn, request, fds)
+                except OSError as e:
+                    # The client sees its connection close, and runs the invocation in-process
+                    if log:
+                        log(f"Worker {worker.pid} unavailable: {e}")
+                    worker.channel.close()
+                    continue
+                busy[worker.channel] = worker
+                if log:
+                    log(f"{request['prog']} {' '.join(request['argv'])} (in {request['cwd']}): worker {worker.pid}")
+    finally:
+        sock.close()
+        # Idle workers exit, and busy ones once their requests finish
+        for worker in workers.values():
+            worker.channel.close()
+        try:
+            if os.stat(path).st_ino == bound:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def stop(root: str | None) -> int | None:
+    """Ask the daemon serving ``root`` to exit; returns its PID, or ``None`` if none is running."""
+    from dffs.client import connect, send
+
+    sock = connect(socket_path(root))
+    if sock is None:
+        return None
+    with sock:
+        send(sock, dict(stop=True))
+        stopped = json.loads(sock.makefile('rb').readline() or 'null')
+    return stopped and stopped['stopped']
+
+
+def detach() -> bool:
+    """Fork a session leader, with stdio redirected to ``/dev/null``, to serve in the background; returns ``True`` in
+    the original process."""
+    if os.fork():
+        return True
+    os.setsid()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+    return False
+
@@ -1,24 +1,278 @@
 from __future__ import annotations
 
+import os
 import signal
 import subprocess
 import sys
+from functools import partial
+from io import BytesIO
+from os.path import isfile
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import BinaryIO, Callable
 
-from click import option, command
+from click import Choice, option, command
 
-from dffs.cli import args, shell_exec_opt, no_shell_opt, pipefail_opt, verbose_opt, exec_cmd_opt, version_opt
-from dffs.utils import join_pipelines
+from dffs.base import err
+from dffs.cli import args, cache_hash_opt, cache_opt, result_cache_opt, shell_exec_opt, no_shell_opt, pipefail_opt, skip_identical_opt, timings_json_opt, timings_opt, trace_opt, verbose_opt, exec_cmd_opt, version_opt
+from dffs.engine import ALGORITHMS
+from dffs.identity import same_contents
+from dffs.utils import Comparator, aggregate_returncodes, join_pipelines, path_pipeline, run_pipeline
+
+# Modules only needed by some options (caches, comparators, `--timings`, …) are imported when those are used, to keep
+# startup (paid on every invocation, e.g. from editor hooks and Git aliases) fast
 
 color_opt = option('-c', '--color/--no-color', default=None, help='Colorize the output (default: auto, based on TTY)')
 unified_opt = option('-U', '--unified', type=int, help='Number of lines of context to show (passes through to `diff`)')
 ignore_whitespace_opt = option('-w', '--ignore-whitespace', is_flag=True, help="Ignore whitespace differences (pass `-w` to `diff`)")
+csv_key_opt = option('--csv-key', metavar='COL[,COL...]', help="Compare CSVs by primary key column(s), reporting added, removed, and changed rows (and which columns changed), instead of diffing lines; inputs needn't be sorted")
+brief_opt = option('-q', '--brief', is_flag=True, help="Only report whether (and where: byte and line) the outputs first differ, comparing bytes in-process like `cmp`; pipelines are stopped as soon as a difference is found")
+max_hunks_opt = option('-H', '--max-hunks', type=int, metavar='N', help='Stop after N hunks of diff output (uses the in-process `myers` engine, if `-e diff`)')
+against_opt = option('--against', metavar='BASE', help="Diff each positional file (after `-`, if commands precede it) against BASE, whose pipeline runs only once; a summary of which files differ is printed to stderr")
+jobs_opt = option('-j', '--jobs', type=int, default=1, help='With `--against`, diff up to this many files in parallel (0: one per CPU); output is still printed in argument order')
+chunked_opt = option('--chunked', is_flag=True, help="Split both outputs into content-defined chunks (cut by hashes of their lines), and diff (in-process) only the regions between matching chunks; for large outputs with few changes, it bounds memory by the changes' size (uses the `myers` engine, if `-e diff`). Output is a valid diff, but may not be minimal")
+engine_opt = option('-e', '--engine', type=Choice(['diff', *ALGORITHMS]), default='diff', metavar='ENGINE', envvar='DFFS_ENGINE', help="Comparator: `diff` (spawn GNU `diff`; default), or an in-process `myers`, `patience`, or `histogram` diff (which saves a process and two FIFO hops per comparison)")
+
+
+def comparator(
+    engine: str,
+    diff_args: list[str],
+    unified: int | None,
+    ignore_whitespace: bool,
+    color: bool,
+    labels: tuple[str, str],
+    csv_key: str | None = None,
+    brief: bool = False,
+    max_hunks: int | None = None,
+    chunked: bool = False,
+) -> list[str] | Comparator:
+    """``join_pipelines`` comparator: a :class:`Cmp` (if ``brief``), a :class:`CsvDiff` (if ``csv_key`` is set), else
+    for ``engine``, a ``diff`` command (with ``diff_args``), or a :class:`DiffEngine` (also used for ``max_hunks``;
+    wrapped in a :class:`ChunkedDiff` if ``chunked``)."""
+    if chunked and (brief or csv_key):
+        raise ValueError("--chunked diffs lines; it can't be combined with -q/--brief or --csv-key")
+    if brief:
+        if csv_key or ignore_whitespace:
+            raise ValueError("-q/--brief compares bytes; it can't be combined with --csv-key or -w")
+        from dffs.cmp import Cmp
+        return Cmp(labels=labels)
+    if csv_key:
+        from dffs.csv_diff import CsvDiff
+        return CsvDiff(key=tuple(csv_key.split(',')), color=color)
+    if engine == 'diff' and max_hunks is None and not chunked:
+        return ['diff', *diff_args]
+    from dffs.engine import DiffEngine
+    diff_engine = DiffEngine(
+        algorithm='myers' if engine == 'diff' else engine,
+        context=unified,
+        ignore_whitespace=ignore_whitespace,
+        color=color,
+        labels=labels,
+        max_hunks=max_hunks,
+    )
+    if chunked:
+        from dffs.chunked import ChunkedDiff
+        return ChunkedDiff(diff_engine)
+    return diff_engine
+
+
+def diff_against(
+    base: str,
+    paths: list[str],
+    cmds: list[str],
+    make_comparator: Callable[..., list[str] | Comparator],
+    jobs: int = 1,
+    cache: bool = False,
+    cache_hash: bool = False,
+    result_cache: bool = False,
+    skip_identical: bool = False,
+    verbose: bool = False,
+    shell: bool = True,
+    executable: str | None = None,
+    pipefail: bool = False,
+    timings_fmt: str | None = None,
+    trace=None,
+) -> int:
+    """Diff each of ``paths`` against ``base``, after running each through ``cmds``.
+
+    ``base``'s pipeline runs once, into a temporary file (or the pipeline cache, with ``cache``), which each comparison
+    then reads; up to ``jobs`` comparisons run at a time, their outputs printed in ``paths`` order (each preceded, on
+    stderr, by its path, if there are several). A summary of which files differ is then printed to stderr.
+
+    Args:
+        make_comparator: Returns a ``join_pipelines`` comparator, given ``labels`` (see :func:`comparator`)
+
+    Returns:
+        Exit code: the first error (e.g. a failed pipeline), else 1 if any file differs from ``base``, else 0
+    """
+    if cache or result_cache:
+        from dffs.cache import PipelineCache, ResultCache
+    if timings_fmt or trace:
+        from dffs.timings import Timings
+
+    def file_key(path: str, side_cmds: list) -> str | None:
+        if not (cache or result_cache):
+            return None
+        return PipelineCache.file_key(path, side_cmds, content_hash=cache_hash or result_cache, executable=executable, shell=shell)
+
+    pipeline_cache = PipelineCache() if cache else None
+    results = ResultCache() if result_cache else None
+    base_out, base_key, tmp_path = Path(base), None, None
+    if cmds:
+        base_cmds, base_input = path_pipeline(cmds, base)
+        base_key = file_key(base, base_cmds)
+        hit = pipeline_cache.get(base_key) if pipeline_cache and base_key else None
+        if hit:
+            if verbose:
+                err(f"Cache hit: {base}")
+            base_out = hit
+        else:
+            tmp = pipeline_cache.tmp() if pipeline_cache and base_key else NamedTemporaryFile('wb', prefix='dffs-base-', delete=False)
+            tmp_path = tmp.name
+            timings = Timings(label=f'{base} (baseline)') if timings_fmt or trace else None
+            returncode = run_pipeline(
+                base_cmds,
+                tmp,
+                verbose=verbose,
+                shell=shell,
+                executable=executable,
+                pipefail=pipefail,
+                stdin=base_input,
+                log=err,
+                timings=timings,
+            )
+            if timings_fmt:
+                timings.report(timings_fmt, err)
+            if trace:
+                trace.add(timings)
+            if returncode:
+                os.remove(tmp_path)
+                return returncode
+            if pipeline_cache and base_key:
+                base_out, tmp_path = pipeline_cache.put(base_key, tmp_path), None
+            else:
+                base_out = Path(tmp_path)
+
+    def diff_path(path: str, out: BinaryIO | None = None, log: Callable[[str], None] = err) -> int:
+        # Identical inputs (through identical pipelines) can't differ; skip running anything
+        if path == base and isfile(path):
+            shortcut = 'same path'
+        elif skip_identical and same_contents(base, path):
+            shortcut = 'identical contents'
+        else:
+            shortcut = None
+        if shortcut:
+            if verbose:
+                log(f"Skipping pipelines: {shortcut}")
+            return 0
+        base_cmd = make_comparator(labels=(base, path))
+        key = None
+        if cmds:
+            path_cmds, path_input = path_pipeline(cmds, path)
+            key = file_key(path, path_cmds)
+        else:
+            path_cmds, path_input = Path(path), None
+        result_key = ResultCache.key((base_key, key), base_cmd) if results and base_key and key else None
+        timings = Timings(label=path) if timings_fmt or trace else None
+        returncode = join_pipelines(
+            base_cmd=base_cmd,
+            cmds1=base_out,
+            cmds2=path_cmds,
+            verbose=verbose,
+            shell=shell,
+            executable=executable,
+            pipefail=pipefail,
+            out=out,
+            cache=pipeline_cache,
+            cache_keys=(None, key),
+            inputs=(None, path_input),
+            log=log,
+            result_cache=results,
+            result_key=result_key,
+            timings=timings,
+        )
+        if timings_fmt:
+            timings.report(timings_fmt, log)
+        if trace:
+            trace.add(timings)
+        return returncode
+
+    def diff_buffered(path: str) -> tuple[int, bytes, list[str]]:
+        """Diff one path, buffering its output and log messages (for printing in argument order)."""
+        out = BytesIO()
+        logs = []
+        returncode = diff_path(path, out=out, log=logs.append)
+        return returncode, out.getvalue(), logs
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    returncodes = []
+    try:
+        if jobs == 1 or len(paths) == 1:
+            for path in paths:
+                if len(paths) > 1:
+                    err(path)
+                returncode = diff_path(path)
+                # SIGPIPE (-13) is expected when piping to a pager that exits early
+                if returncode < 0 and returncode == -signal.SIGPIPE:
+                    return 0
+                returncodes.append(returncode)
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=jobs) as pool:
+                futures = [ pool.submit(diff_buffered, path) for path in paths ]
+                try:
+                    for path, future in zip(paths, futures):
+                        returncode, output, logs = future.result()
+                        err(path)
+                        for msg in logs:
+                            err(msg)
+                        sys.stdout.buffer.write(output)
+                        sys.stdout.buffer.flush()
+                        returncodes.append(returncode)
+                except BrokenPipeError:
+                    # Pager exited early; skip paths that haven't started yet
+                    for future in futures:
+                        future.cancel()
+                    return 0
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+    if len(paths) > 1:
+        differ = [ path for path, returncode in zip(paths, returncodes) if returncode == 1 ]
+        err(f"{len(differ)} of {len(paths)} files differ from {base}")
+        for path, returncode in zip(paths, returncodes):
+            if returncode == 0:
+                status = 'same'
+            elif returncode == 1:
+                status = 'differs'
+            else:
+                status = f'failed (exit {returncode})'
+            err(f"  {path}: {status}")
+    return aggregate_returncodes(returncodes)
 
 
 @command('diff-x', short_help='Diff two files after running them through a pipeline of other commands', no_args_is_help=True)
+@against_opt
+@brief_opt
+@cache_opt
+@cache_hash_opt
+@chunked_opt
 @color_opt
+@csv_key_opt
+@engine_opt
+@jobs_opt
+@max_hunks_opt
 @pipefail_opt
+@result_cache_opt
 @shell_exec_opt
 @no_shell_opt
+@skip_identical_opt
+@timings_opt
+@timings_json_opt
+@trace_opt
 @unified_opt
 @version_opt
 @verbose_opt
@@ -26,10 +280,23 @@ ignore_whitespace_opt = option('-w', '--ignore-whitespace', is_flag=True, help="
 @exec_cmd_opt
 @args
 def main(
+    against: str | None,
+    brief: bool,
+    cache: bool,
+    cache_hash: bool,
+    chunked: bool,
     color: bool,
+    csv_key: str | None,
+    engine: str,
+    jobs: int,
+    max_hunks: int | None,
     pipefail: bool,
+    result_cache: bool,
     shell_executable: str | None,
     no_shell: bool,
+    skip_identical: bool,
+    timings_fmt: str | None,
+    trace_path: str | None,
     unified: int | None,
     verbose: bool,
     ignore_whitespace: bool,
@@ -37,12 +304,6 @@ def main(
     args: tuple[str, ...],
 ):
     """Diff two files after running them through a pipeline of other commands."""
-    if len(args) < 2:
-        raise ValueError('Must provide at least two files to diff')
-
-    *cmds, path1, path2 = args
-    cmds = list(exec_cmds) + cmds
-
     # Auto-detect color based on TTY if not explicitly set
     use_color = color if color is not None else sys.stdout.isatty()
 
@@ -51,25 +312,114 @@ def main(
         *(['-U', str(unified)] if unified is not None else []),
         *(['--color=always'] if use_color else []),
     ]
+    trace = timings = None
+    if trace_path:
+        from dffs.trace import Trace
+        trace = Trace()
+
+    if against is not None:
+        if '-' in args:
+            idx = args.index('-')
+            cmds, paths = list(args[:idx]), list(args[idx + 1:])
+        else:
+            cmds, paths = [], list(args)
+        if not paths:
+            raise ValueError('Must provide at least one file to diff against BASE')
+        returncode = diff_against(
+            against,
+            paths,
+            list(exec_cmds) + cmds,
+            make_comparator=partial(comparator, engine, diff_args, unified, ignore_whitespace, use_color, csv_key=csv_key, brief=brief, max_hunks=max_hunks, chunked=chunked),
+            jobs=jobs,
+            cache=cache,
+            cache_hash=cache_hash,
+            result_cache=result_cache,
+            skip_identical=skip_identical,
+            verbose=verbose,
+            shell=not no_shell,
+            executable=shell_executable,
+            pipefail=pipefail,
+            timings_fmt=timings_fmt,
+            trace=trace,
+        )
+        if trace:
+            trace.write(trace_path)
+        raise SystemExit(returncode)
+
+    if len(args) < 2:
+        raise ValueError('Must provide at least two files to diff')
+
+    *cmds, path1, path2 = args
+    cmds = list(exec_cmds) + cmds
+
+    base_cmd = comparator(engine, diff_args, unified, ignore_whitespace, use_color, labels=(path1, path2), csv_key=csv_key, brief=brief, max_hunks=max_hunks, chunked=chunked)
+    if timings_fmt or trace:
+        from dffs.timings import Timings
+        timings = Timings()
     if cmds:
-        first, *rest = cmds
+        # Identical inputs (through identical pipelines) can't differ; skip running anything
+        if path1 == path2 and isfile(path1):
+            shortcut = 'same path'
+        elif skip_identical and same_contents(path1, path2):
+            shortcut = 'identical contents'
+        else:
+            shortcut = None
+        if shortcut:
+            if verbose:
+                err(f"Skipping pipelines: {shortcut}")
+            raise SystemExit(0)
+
+        cmds1, input1 = path_pipeline(cmds, path1)
+        cmds2, input2 = path_pipeline(cmds, path2)
+        if cache or result_cache:
+            from dffs.cache import PipelineCache, ResultCache
+        pipeline_cache = PipelineCache() if cache else None
+        cache_keys = tuple(
+            PipelineCache.file_key(path, side_cmds, content_hash=cache_hash or result_cache, executable=shell_executable, shell=not no_shell)
+            for path, side_cmds in ((path1, cmds1), (path2, cmds2))
+        ) if cache or result_cache else (None, None)
+        results = ResultCache() if result_cache and all(cache_keys) else None
         returncode = join_pipelines(
-            base_cmd=['diff', *diff_args],
-            cmds1=[ f'{first} {path1}', *rest ],
-            cmds2=[ f'{first} {path2}', *rest ],
+            base_cmd=base_cmd,
+            cmds1=cmds1,
+            cmds2=cmds2,
             verbose=verbose,
             shell=not no_shell,
             executable=shell_executable,
             pipefail=pipefail,
+            cache=pipeline_cache,
+            cache_keys=cache_keys,
+            inputs=(input1, input2),
+            result_cache=results,
+            result_key=ResultCache.key(cache_keys, base_cmd) if results else None,
+            timings=timings,
         )
+        if timings_fmt:
+            timings.report(timings_fmt, err)
+        if trace:
+            trace.add(timings)
+            trace.write(trace_path)
         # SIGPIPE (-13) is expected when piping to a pager that exits early
         if returncode < 0 and returncode == -signal.SIGPIPE:
             raise SystemExit(0)
         raise SystemExit(returncode)
+    elif not isinstance(base_cmd, list) or timings:
+        # In-process comparators read the files directly; `--timings`/`--trace` also time a `diff` command this way
+        returncode = join_pipelines(
+            base_cmd=base_cmd,
+            cmds1=Path(path1),
+            cmds2=Path(path2),
+            timings=timings,
+        )
+        if timings_fmt:
+            timings.report(timings_fmt, err)
+        if trace:
+            trace.add(timings)
+            trace.write(trace_path)
     else:
-        result = subprocess.run(['diff', *diff_args, path1, path2])
+        result = subprocess.run([*base_cmd, path1, path2])
         returncode = result.returncode
-        # SIGPIPE (-13) is expected when piping to a pager that exits early
-        if returncode < 0 and returncode == -signal.SIGPIPE:
-            raise SystemExit(0)
-        raise SystemExit(returncode)
+    # SIGPIPE (-13) is expected when piping to a pager that exits early
+    if returncode < 0 and returncode == -signal.SIGPIPE:
+        raise SystemExit(0)
+    raise SystemExit(returncode)
@@ -0,0 +1,590 @@
+"""In-process line diff engine, usable as a :func:`~dffs.utils.join_pipelines` comparator instead of GNU ``diff``."""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass
+from math import isqrt
+from threading import Thread
+from typing import BinaryIO, Callable, Iterable
+
+# Algorithms supported by :class:`DiffEngine`
+ALGORITHMS = ('myers', 'patience', 'histogram')
+# Bytes ignored (when comparing lines) by ``ignore_whitespace``, like ``diff -w``
+WHITESPACE = b' \t\n\r\f\v'
+# Histogram diff ignores lines occurring more than this many times (in a region of the first input) as split points
+MAX_CHAIN_LENGTH = 64
+# Myers search depth (edit-script length) beyond which a region is split heuristically, instead of minimally
+MIN_TOO_EXPENSIVE = 4096
+# Bytes of output buffered before each write
+OUTPUT_CHUNK_SIZE = 64 * 1024
+
+# ANSI escapes used by ``diff --color=always`` (with its default palette)
+RESET = b'\x1b[0m'
+BOLD = b'\x1b[1m'
+RED = b'\x1b[31m'
+GREEN = b'\x1b[32m'
+CYAN = b'\x1b[36m'
+NO_NEWLINE = b'\\ No newline at end of file\n'
+
+# A run of ``n`` equal lines, starting at index ``i`` of the first input and ``j`` of the second
+Block = tuple[int, int, int]
+# A replacement of lines ``[i1, i2)`` of the first input with ``[j1, j2)`` of the second
+Change = tuple[int, int, int, int]
+
+
+class Lines:
+    """Interns input lines into integer IDs, so sequences are compared (and stored) as compact ``array``s.
+
+    Each distinct line is stored once (in :attr:`lines`); with ``ignore_whitespace``, lines are also assigned
+    comparison keys that ignore whitespace, so lines differing only in whitespace compare equal while output still
+    shows each input's own lines.
+    """
+
+    def __init__(self, ignore_whitespace: bool = False):
+        self.ignore_whitespace = ignore_whitespace
+        self.ids: dict[bytes, int] = {}
+        self.lines: list[bytes] = []
+        self.keys: dict[bytes, int] = {}
+
+    def intern(self, line: bytes) -> int:
+        """ID of ``line``, adding it to :attr:`lines` if it's new."""
+        id = self.ids.get(line)
+        if id is None:
+            id = self.ids[line] = len(self.lines)
+            self.lines.append(line)
+        return id
+
+    def intern_key(self, key: bytes) -> int:
+        """ID of a whitespace-stripped comparison key."""
+        id = self.keys.get(key)
+        if id is None:
+            id = self.keys[key] = len(self.keys)
+        return id
+
+    def read(self, stream: Iterable[bytes]) -> tuple[array, array]:
+        """Intern each line of ``stream``.
+
+        Returns:
+            Per-line IDs (indexing :attr:`lines`), and comparison keys (the same array, unless ignoring whitespace)
+        """
+        ids = array('i')
+        keys = array('i') if self.ignore_whitespace else ids
+        for line in stream:
+            ids.append(self.intern(line))
+            if self.ignore_whitespace:
+                keys.append(self.intern_key(line.translate(None, WHITESPACE)))
+        return ids, keys
+
+
+def _trim(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int, blocks: list[Block]) -> tuple[int, int, int, int]:
+    """Record a region's common prefix and suffix as blocks; return the remaining (middle) region's bounds."""
+    start = 0
+    while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+        start += 1
+    if start:
+        blocks.append((alo, blo, start))
+    alo += start
+    blo += start
+    end = 0
+    while ahi - end > alo and bhi - end > blo and a[ahi - end - 1] == b[bhi - end - 1]:
+        end += 1
+    if end:
+        blocks.append((ahi - end, bhi - end, end))
+    return alo, ahi - end, blo, bhi - end
+
+
+def _bisect(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int) -> tuple[int, int] | None:
+    """Find a point on a shortest edit path through a region (Myers' "middle snake"), searching from both ends.
+
+    Uses linear space. If the search gets too expensive, the furthest-reaching forward point is returned instead, so
+    the result may not be minimal (like GNU diff's heuristic).
+
+    Returns:
+        Offsets ``(x, y)`` (into the region) to split it at, or ``None`` if it has no lines in common
+    """
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    too_expensive = max(MIN_TOO_EXPENSIVE, isqrt(n + m))
+    offset = max_d
+    size = 2 * max_d + 2
+    v1 = [-1] * size
+    v2 = [-1] * size
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        best = None
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            else:
+                if best is None or x1 + y1 > best[0] + best[1]:
+                    best = (x1, y1)
+                if front:
+                    k2_offset = offset + delta - k1
+                    if 0 <= k2_offset < size and v2[k2_offset] != -1 and x1 >= n - v2[k2_offset]:
+                        return x1, y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = offset + delta - k2
+                if 0 <= k1_offset < size and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return x1, y1
+        if d >= too_expensive and best and 0 < best[0] + best[1] < n + m:
+            return best
+    return None
+
+
+def _has_common(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int) -> bool:
+    return not set(a[alo:ahi]).isdisjoint(b[blo:bhi])
+
+
+def myers(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int, blocks: list[Block]) -> None:
+    """Append the matching blocks of a (near-)minimal diff of ``a[alo:ahi]`` and ``b[blo:bhi]`` to ``blocks``."""
+    regions = [(alo, ahi, blo, bhi)]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = _trim(a, alo, ahi, b, blo, bhi, blocks)
+        if alo == ahi or blo == bhi or not _has_common(a, alo, ahi, b, blo, bhi):
+            continue
+        split = _bisect(a, alo, ahi, b, blo, bhi)
+        if split is None:
+            continue
+        x, y = split
+        regions.append((alo, alo + x, blo, blo + y))
+        regions.append((alo + x, ahi, blo + y, bhi))
+
+
+def _longest_increasing(pairs: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Longest subsequence of ``pairs`` (sorted by first element) whose second elements also increase."""
+    tails: list[int] = []
+    tail_idxs: list[int] = []
+    prev = [-1] * len(pairs)
+    for k, (_, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_idxs.append(k)
+        else:
+            tails[pos] = j
+            tail_idxs[pos] = k
+        prev[k] = tail_idxs[pos - 1] if pos else -1
+    result = []
+    k = tail_idxs[-1] if tail_idxs else -1
+    while k != -1:
+        result.append(pairs[k])
+        k = prev[k]
+    return result[::-1]
+
+
+def patience(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int, blocks: list[Block]) -> None:
+    """Append the matching blocks of a patience diff of ``a[alo:ahi]`` and ``b[blo:bhi]`` to ``blocks``.
+
+    Lines occurring exactly once on each side anchor the diff (via their longest common subsequence); the regions
+    between anchors are diffed recursively, falling back to :func:`myers` where there are no unique lines.
+    """
+    regions = [(alo, ahi, blo, bhi)]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = _trim(a, alo, ahi, b, blo, bhi, blocks)
+        if alo == ahi or blo == bhi:
+            continue
+        # Line → [count in a, index in a, count in b, index in b]
+        counts: dict[int, list[int]] = {}
+        for i in range(alo, ahi):
+            entry = counts.get(a[i])
+            if entry is None:
+                counts[a[i]] = [1, i, 0, -1]
+            else:
+                entry[0] += 1
+        for j in range(blo, bhi):
+            entry = counts.get(b[j])
+            if entry is not None:
+                entry[2] += 1
+                entry[3] = j
+        anchors = _longest_increasing(sorted(
+            (i, j)
+            for a_count, i, b_count, j in counts.values()
+            if a_count == 1 and b_count == 1
+        ))
+        if not anchors:
+            myers(a, alo, ahi, b, blo, bhi, blocks)
+            continue
+        i0, j0 = alo, blo
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            regions.append((i0, i, j0, j))
+            i0, j0 = i + 1, j + 1
+        regions.append((i0, ahi, j0, bhi))
+
+
+def _histogram_split(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int) -> tuple[list[Block], bool]:
+    """Find the longest common run of lines with the fewest occurrences in ``a[alo:ahi]``.
+
+    If the fewest occurrences is 1, every common run of lines unique in ``a[alo:ahi]`` that's consistent with the others
+    (in order on both sides, not overlapping) is returned, so that a region with many scattered changes is split at
+    once, instead of being rescanned after each split.
+
+    Returns:
+        The runs (none unless one contains a line occurring at most ``MAX_CHAIN_LENGTH`` times), and whether the
+        region has any lines in common at all
+    """
+    positions: dict[int, list[int]] = {}
+    for i in range(alo, ahi):
+        positions.setdefault(a[i], []).append(i)
+    best = None
+    best_count = MAX_CHAIN_LENGTH + 1
+    unique: dict[tuple[int, int], int] = {}
+    common = False
+    j = blo
+    while j < bhi:
+        next_j = j + 1
+        occurrences = positions.get(b[j])
+        if occurrences is not None:
+            common = True
+            if len(occurrences) <= best_count:
+                for i in occurrences:
+                    count = len(occurrences)
+                    si, sj = i, j
+                    while si > alo and sj > blo and a[si - 1] == b[sj - 1]:
+                        si -= 1
+                        sj -= 1
+                        count = min(count, len(positions[a[si]]))
+                    ei, ej = i + 1, j + 1
+                    while ei < ahi and ej < bhi and a[ei] == b[ej]:
+                        count = min(count, len(positions[a[ei]]))
+                        ei += 1
+                        ej += 1
+                    if best is None or count < best_count or (count == best_count and ei - si > best[2]):
+                        best = (si, sj, ei - si)
+                        best_count = count
+                    if count == 1:
+                        unique[si, sj] = ei - si
+                    next_j = max(next_j, ej)
+        j = next_j
+    if best is None:
+        return [], common
+    if best_count > 1:
+        return [best], common
+    runs = []
+    end_i = end_j = 0
+    for si, sj in _longest_increasing(sorted(unique)):
+        if si >= end_i and sj >= end_j:
+            n = unique[si, sj]
+            runs.append((si, sj, n))
+            end_i, end_j = si + n, sj + n
+    return runs, common
+
+
+def histogram(a: array, alo: int, ahi: int, b: array, blo: int, bhi: int, blocks: list[Block]) -> None:
+    """Append the matching blocks of a histogram diff (as in JGit / ``git diff --histogram``) to ``blocks``.
+
+    Regions are split around their longest common run of lowest-occurrence lines, falling back to :func:`myers` where
+    every common line is too frequent.
+    """
+    regions = [(alo, ahi, blo, bhi)]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = _trim(a, alo, ahi, b, blo, bhi, blocks)
+        if alo == ahi or blo == bhi:
+            continue
+        runs, common = _histogram_split(a, alo, ahi, b, blo, bhi)
+        if not runs:
+            if common:
+                myers(a, alo, ahi, b, blo, bhi, blocks)
+            continue
+        i0, j0 = alo, blo
+        for i, j, n in runs:
+            blocks.append((i, j, n))
+            regions.append((i0, i, j0, j))
+            i0, j0 = i + n, j + n
+        regions.append((i0, ahi, j0, bhi))
+
+
+DIFFS: dict[str, Callable[[array, int, int, array, int, int, list[Block]], None]] = dict(
+    myers=myers,
+    patience=patience,
+    histogram=histogram,
+)
+
+
+def diff_blocks(a: array, b: array, algorithm: str = 'myers') -> list[Block]:
+    """Matching blocks (sorted, with adjacent blocks merged) of a diff of ``a`` and ``b`` using ``algorithm``."""
+    if algorithm not in DIFFS:
+        raise ValueError(f"Unknown diff algorithm: {algorithm} (expected one of {', '.join(ALGORITHMS)})")
+    blocks: list[Block] = []
+    DIFFS[algorithm](a, 0, len(a), b, 0, len(b), blocks)
+    blocks.sort()
+    merged: list[Block] = []
+    for i, j, n in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and merged[-1][1] + merged[-1][2] == j:
+            pi, pj, pn = merged[-1]
+            merged[-1] = (pi, pj, pn + n)
+        else:
+            merged.append((i, j, n))
+    return merged
+
+
+def _shift_boundaries(keys: array, changed: bytearray, other_changed: bytearray) -> None:
+    """Slide runs of changed lines (in ``changed``) to canonical positions, like GNU diff's ``shift_boundaries``.
+
+    Runs are merged with neighboring runs where possible, then moved as far down as they can go, then back up to line
+    up with a run in the other input. ``changed`` and ``other_changed`` are flags for each line, with a 0 sentinel at
+    each end (so line ``k``'s flag is at index ``k + 1``).
+    """
+    i_end = len(changed) - 2
+    i = j = 0
+    while True:
+        # Find the start of the next run of changes, tracking the corresponding point in the other input
+        while i < i_end and not changed[i + 1]:
+            while other_changed[j + 1]:
+                j += 1
+            j += 1
+            i += 1
+        if i == i_end:
+            break
+        start = i
+        i += 1
+        while changed[i + 1]:
+            i += 1
+        while other_changed[j + 1]:
+            j += 1
+        while True:
+            run_length = i - start
+            # Move the run up while the preceding unchanged line matches its last line (merging with earlier runs)
+            while start and keys[start - 1] == keys[i - 1]:
+                start -= 1
+                changed[start + 1] = 1
+                i -= 1
+                changed[i + 1] = 0
+                while changed[start]:
+                    start -= 1
+                j -= 1
+                while other_changed[j + 1]:
+                    j -= 1
+            # End of the run, at the last point where it lines up with a run in the other input
+            corresponding = i if other_changed[j] else i_end
+            # Move the run down while its first line matches the following unchanged line (merging with later runs)
+            while i != i_end and keys[start] == keys[i]:
+                changed[start + 1] = 0
+                start += 1
+                changed[i + 1] = 1
+                i += 1
+                while changed[i + 1]:
+                    i += 1
+                j += 1
+                while other_changed[j + 1]:
+                    j += 1
+                    corresponding = i
+            if run_length == i - start:
+                break
+        # Move the (fully merged) run back up to line up with a run in the other input, if possible
+        while corresponding < i:
+            start -= 1
+            changed[start + 1] = 1
+            i -= 1
+            changed[i + 1] = 0
+            j -= 1
+            while other_changed[j + 1]:
+                j -= 1
+
+
+def changes(blocks: list[Block], a: array, b: array) -> list[Change]:
+    """Convert matching blocks (of ``a`` and ``b``) to the ranges between them.
+
+    Equivalent edits are normalized the way GNU diff does (see :func:`_shift_boundaries`), so that the output
+    usually matches ``diff``'s exactly.
+    """
+    n, m = len(a), len(b)
+    changed1 = bytearray(b'\x01') * (n + 2)
+    changed2 = bytearray(b'\x01') * (m + 2)
+    changed1[0] = changed1[-1] = changed2[0] = changed2[-1] = 0
+    for i, j, size in blocks:
+        changed1[i + 1:i + size + 1] = bytes(size)
+        changed2[j + 1:j + size + 1] = bytes(size)
+    _shift_boundaries(a, changed1, changed2)
+    _shift_boundaries(b, changed2, changed1)
+    result = []
+    i = j = 0
+    while i < n or j < m:
+        if changed1[i + 1] or changed2[j + 1]:
+            i1, j1 = i, j
+            while changed1[i + 1]:
+                i += 1
+            while changed2[j + 1]:
+                j += 1
+            result.append((i1, i, j1, j))
+        else:
+            i += 1
+            j += 1
+    return result
+
+
+def _line(prefix: bytes, line: bytes, color: bytes | None = None) -> bytes:
+    """Format an output line, marking a missing trailing newline like ``diff`` does."""
+    newline = line.endswith(b'\n')
+    text = prefix + (line[:-1] if newline else line)
+    if color:
+        text = color + text + RESET
+    return text + b'\n' + (b'' if newline else NO_NEWLINE)
+
+
+def _normal_range(start: int, end: int) -> bytes:
+    """Format 0-based ``[start, end)`` (or, if empty, the line before it) as ``diff``'s 1-based inclusive range."""
+    if end - start <= 1:
+        return b'%d' % end
+    return b'%d,%d' % (start + 1, end)
+
+
+def _unified_range(start: int, length: int) -> bytes:
+    if length == 0:
+        return b'%d,0' % start
+    if length == 1:
+        return b'%d' % (start + 1)
+    return b'%d,%d' % (start + 1, length)
+
+
+@dataclass
+class DiffEngine:
+    """Compare two byte streams line by line in-process, writing ``diff``-compatible output.
+
+    Instances are comparators for :func:`~dffs.utils.join_pipelines`: they're called with both inputs (read
+    concurrently) and an output stream, and return ``diff``'s exit code (0 if the inputs are the same, else 1).
+
+    Args:
+        algorithm: One of ``ALGORITHMS``
+        context: Lines of context for unified output (like ``diff -U``); "normal" ``diff`` output if ``None``
+        ignore_whitespace: Ignore whitespace when comparing lines (like ``diff -w``)
+        color: Colorize output (like ``diff --color=always``)
+        labels: Names of the inputs, for unified output's header
+        max_hunks: Stop after this many hunks of output (each change in normal output, or group of changes sharing
+            context in unified output)
+    """
+    algorithm: str = 'myers'
+    context: int | None = None
+    ignore_whitespace: bool = False
+    color: bool = False
+    labels: tuple[str, str] = ('a', 'b')
+    max_hunks: int | None = None
+
+    def read(self, in1: BinaryIO, in2: BinaryIO) -> tuple[Lines, array, array, array, array]:
+        """Intern both inputs' lines, reading the second in a background thread (so neither pipeline stalls)."""
+        lines1 = Lines(self.ignore_whitespace)
+        lines2 = Lines(self.ignore_whitespace)
+        result2 = []
+        thread = Thread(target=lambda: result2.append(lines2.read(in2)), daemon=True)
+        thread.start()
+        ids1, keys1 = lines1.read(in1)
+        thread.join()
+        if not result2:
+            raise ValueError("Failed to read second input")
+        ids2, keys2 = result2[0]
+        # Re-number the second input's lines (and keys) in the first's tables
+        id_map = array('i', (lines1.intern(line) for line in lines2.lines))
+        ids2 = array('i', (id_map[id] for id in ids2))
+        if self.ignore_whitespace:
+            key_map = array('i', (lines1.intern_key(key) for key in lines2.keys))
+            keys2 = array('i', (key_map[key] for key in keys2))
+        else:
+            keys2 = ids2
+        return lines1, ids1, keys1, ids2, keys2
+
+    def normal(self, lines: list[bytes], ids1: array, ids2: array, diffs: list[Change]) -> Iterable[bytes]:
+        for i1, i2, j1, j2 in diffs[:self.max_hunks]:
+            op = b'c' if i1 < i2 and j1 < j2 else b'd' if i1 < i2 else b'a'
+            header = _normal_range(i1, i2) + op + _normal_range(j1, j2)
+            yield (CYAN + header + RESET if self.color else header) + b'\n'
+            for i in range(i1, i2):
+                yield _line(b'< ', lines[ids1[i]], RED if self.color else None)
+            if op == b'c':
+                yield b'---\n'
+            for j in range(j1, j2):
+                yield _line(b'> ', lines[ids2[j]], GREEN if self.color else None)
+
+    def unified(self, lines: list[bytes], ids1: array, ids2: array, diffs: list[Change]) -> Iterable[bytes]:
+        context = self.context
+        n, m = len(ids1), len(ids2)
+        for prefix, label in zip((b'--- ', b'+++ '), self.labels):
+            header = prefix + label.encode()
+            yield (BOLD + header + RESET if self.color else header) + b'\n'
+        # Group changes whose unchanged gap is small enough that their context would overlap
+        groups: list[list[Change]] = []
+        for change in diffs:
+            if groups and change[0] - groups[-1][-1][1] <= 2 * context:
+                groups[-1].append(change)
+            else:
+                groups.append([change])
+        for group in groups[:self.max_hunks]:
+            first, last = group[0], group[-1]
+            before = min(context, first[0], first[2])
+            after = min(context, n - last[1], m - last[3])
+            a_start, b_start = first[0] - before, first[2] - before
+            a_end, b_end = last[1] + after, last[3] + after
+            header = b'@@ -%s +%s @@' % (
+                _unified_range(a_start, a_end - a_start),
+                _unified_range(b_start, b_end - b_start),
+            )
+            yield (CYAN + header + RESET if self.color else header) + b'\n'
+            i = a_start
+            for i1, i2, j1, j2 in group:
+                for k in range(i, i1):
+                    yield _line(b' ', lines[ids1[k]])
+                for k in range(i1, i2):
+                    yield _line(b'-', lines[ids1[k]], RED if self.color else None)
+                for k in range(j1, j2):
+                    yield _line(b'+', lines[ids2[k]], GREEN if self.color else None)
+                i = i2
+            for k in range(i, a_end):
+                yield _line(b' ', lines[ids1[k]])
+
+    def write(self, out: BinaryIO, lines: list[bytes], ids1: array, ids2: array, diffs: list[Change]) -> None:
+        """Write ``diffs`` (between inputs whose lines are ``lines[ids1[i]]`` and ``lines[ids2[j]]``) to ``out``."""
+        fmt = self.normal if self.context is None else self.unified
+        buf = bytearray()
+        for chunk in fmt(lines, ids1, ids2, diffs):
+            buf += chunk
+            if len(buf) >= OUTPUT_CHUNK_SIZE:
+                out.write(bytes(buf))
+                buf.clear()
+        if buf:
+            out.write(bytes(buf))
+
+    def __call__(self, in1: BinaryIO, in2: BinaryIO, out: BinaryIO) -> int:
+        lines, ids1, keys1, ids2, keys2 = self.read(in1, in2)
+        diffs = changes(diff_blocks(keys1, keys2, self.algorithm), keys1, keys2)
+        if not diffs:
+            return 0
+        self.write(out, lines.lines, ids1, ids2, diffs)
+        return 1
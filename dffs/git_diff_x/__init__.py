@@ -1,28 +1,172 @@
 from __future__ import annotations
 
-import posixpath
+import os
 import shlex
 import signal
 import sys
+from functools import partial
+from io import BytesIO
+from os.path import join, relpath
+from pathlib import Path, PurePosixPath
 from shlex import quote
-from subprocess import call
+from subprocess import call, run, PIPE
+from typing import BinaryIO, Callable, TYPE_CHECKING
 
 from click import option, argument, command
-from utz import process, err
 
-from dffs.cli import shell_exec_opt, no_shell_opt, pipefail_opt, verbose_opt, exec_cmd_opt, version_opt
-from dffs.diff_x import color_opt, unified_opt, ignore_whitespace_opt
-from dffs.utils import join_pipelines
+from dffs.base import err, line
+from dffs.blobs import Blob, Commit, blob_reader, changed_files, file_history
+from dffs.cli import cache_hash_opt, cache_opt, result_cache_opt, shell_exec_opt, no_shell_opt, pipefail_opt, skip_identical_opt, timings_json_opt, timings_opt, trace_opt, verbose_opt, exec_cmd_opt, version_opt
+from dffs.diff_x import brief_opt, color_opt, comparator, csv_key_opt, engine_opt, max_hunks_opt, unified_opt, ignore_whitespace_opt
+from dffs.identity import matches_blob, same_contents
+from dffs.transforms import is_py_stage
+from dffs.utils import Comparator, aggregate_returncodes, join_pipelines, Input
+
+if TYPE_CHECKING:
+    from dffs.timings import Timings
+
+# Modules only needed by some options (caches, `-j`, `--timings`, …) are imported when those are used, to keep startup
+# (paid on every invocation, e.g. from editor hooks and Git aliases) fast
+
+# Marks a comparison side that's read from the worktree
+WORKTREE = 'worktree'
+# A comparison side: a blob, the worktree, or ``None`` (file doesn't exist; compared as empty)
+Side = Blob | str | None
+
+
+def parse_maps(maps: tuple[str, ...]) -> list[tuple[str, list[str]]]:
+    """Parse ``GLOB=CMD`` args into ``(glob, cmds)`` pairs; repeating a glob appends commands to its pipeline."""
+    pipelines = {}
+    for spec in maps:
+        glob, sep, cmd = spec.partition('=')
+        if not sep or not glob or not cmd:
+            raise ValueError(f"Invalid -m/--map (expected GLOB=CMD): {spec}")
+        pipelines.setdefault(glob, []).append(cmd)
+    return list(pipelines.items())
+
+
+def first_change(commits: list[Commit], differs: Callable[[Commit], bool]) -> Commit | None:
+    """Binary-search ``commits`` (oldest first) for the first one after which ``differs`` (e.g. whether the file's
+    transformed contents differ from a known-good version's); like ``git bisect``, this assumes that once they differ,
+    they stay different. Returns ``None`` if the last commit doesn't differ.
+    """
+    if not commits or not differs(commits[-1]):
+        return None
+    lo, hi = 0, len(commits) - 1  # `commits[hi]` differs
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if differs(commits[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return commits[hi]
+
+
+def bisect_changes(
+    spec: str,
+    path: str,
+    cmds: list[str],
+    make_comparator: Callable[..., list[str] | Comparator],
+    cache: bool = False,
+    verbose: bool = False,
+    shell: bool = True,
+    executable: str | None = None,
+    pipefail: bool = False,
+    color: bool = False,
+) -> int:
+    """Find the first commit in ``spec`` (``GOOD..BAD``; ``BAD`` defaults to ``HEAD``) after which ``path``'s contents,
+    through ``cmds``, differ from ``GOOD``'s, and print it (like ``git log``), followed by its diff against ``GOOD``.
+
+    Only commits (along first parents) that change ``path`` are probed, by binary search (see :func:`first_change`);
+    each distinct blob is transformed at most once (and probes of ``GOOD``'s blob aren't run), so about ``log2(n)``
+    pipelines run for ``n`` commits.
+
+    Returns:
+        Exit code: 1 if a commit was found, 0 if ``BAD``'s output matches ``GOOD``'s, or a failed pipeline's
+    """
+    from dffs.git_log_x import ABBREV, BlobOutputs, header
+
+    good, _, bad = spec.partition('..')
+    if not good:
+        raise ValueError(f"Invalid -b/--bisect range (expected GOOD..BAD): {spec}")
+    bad = bad or 'HEAD'
+    commits = file_history(path, revs=[f'{good}..{bad}'], first_parent=True)[::-1]
+    if cache:
+        from dffs.cache import PipelineCache
+    reader = blob_reader()
+    outputs = BlobOutputs(
+        reader,
+        cmds or ['cat'],
+        path,
+        cache=PipelineCache() if cache else None,
+        verbose=verbose,
+        shell=shell,
+        executable=executable,
+        pipefail=pipefail,
+    )
+    with reader, outputs:
+        good_blob = reader.info(good, path)
+        logged = set()
+
+        def output(blob: Blob | None) -> Path:
+            returncode, out, logs = outputs(blob)
+            name = blob.sha if blob else None
+            if name not in logged:
+                logged.add(name)
+                for msg in logs:
+                    err(msg)
+            if returncode:
+                raise SystemExit(returncode)
+            return out
+
+        def differs(commit: Commit) -> bool:
+            if commit.new == good_blob:
+                differ = False
+            else:
+                differ = not same_contents(output(good_blob), output(commit.new))
+            if verbose:
+                err(f"Probed {commit.sha[:ABBREV]}: {'differs' if differ else 'same'}")
+            return differ
+
+        commit = first_change(commits, differs)
+        if commit is None:
+            err(f"{path}: output at {bad} matches {good}'s ({len(commits)} commits, {len(outputs.outputs)} pipeline runs)")
+            return 0
+        err(f"{commit.sha} is the first commit whose output differs ({len(commits)} commits, {len(outputs.outputs)} pipeline runs)")
+        sys.stdout.buffer.write(header(commit, color))
+        sys.stdout.buffer.flush()
+        base_cmd = make_comparator(labels=(f'{good}:{path}', f'{commit.sha[:ABBREV]}:{path}'))
+        return join_pipelines(
+            base_cmd=base_cmd,
+            cmds1=output(good_blob),
+            cmds2=output(commit.new),
+            verbose=verbose,
+        )
 
 
 @command('git-diff-x', short_help='Diff a Git-tracked file at two commits (or one commit vs. current worktree), optionally passing both through another command first', no_args_is_help=True)
+@option('-a', '--all', 'all_files', is_flag=True, help='Diff every file changed in the refspec (or vs. the index/worktree); positional args (after `-`, if commands precede it) are pathspecs filtering which files')
+@option('-b', '--bisect', metavar='GOOD..BAD', help="Binary-search the commits changing a path, from GOOD to BAD (default `HEAD`), for the first whose output differs from GOOD's; print it, and its diff")
+@brief_opt
+@cache_opt
+@cache_hash_opt
 @color_opt
+@csv_key_opt
+@engine_opt
 @option('-r', '--refspec', help='<commit 1>..<commit 2> (compare two commits) or <commit> (compare <commit> to the worktree)')
+@option('-j', '--jobs', type=int, default=1, help='Diff up to this many paths in parallel (0: one per CPU); output is still printed in argument order')
+@max_hunks_opt
+@option('-m', '--map', 'maps', multiple=True, help='`GLOB=CMD`: pipe files matching GLOB through CMD (instead of the default pipeline); repeat a GLOB to add more stages. With `-a`, files matching no GLOB are skipped unless a default pipeline is given')
 @option('-R', '--ref', help="Diff a specific commit; alias for `-r <ref>^..<ref>`")
 @option('-t', '--staged', is_flag=True, help='Compare HEAD vs. staged changes (index)')
 @pipefail_opt
+@result_cache_opt
 @shell_exec_opt
 @no_shell_opt
+@skip_identical_opt
+@timings_opt
+@timings_json_opt
+@trace_opt
 @unified_opt
 @version_opt
 @verbose_opt
@@ -30,13 +174,27 @@ from dffs.utils import join_pipelines
 @exec_cmd_opt
 @argument('args', metavar='[exec_cmd...] [<path> | - [paths...]]', nargs=-1)
 def main(
+    all_files: bool,
+    bisect: str | None,
+    brief: bool,
+    cache: bool,
+    cache_hash: bool,
     color: bool,
+    csv_key: str | None,
+    engine: str,
     refspec: str | None,
+    jobs: int,
+    max_hunks: int | None,
+    maps: tuple[str, ...],
     ref: str | None,
     staged: bool,
     pipefail: bool,
+    result_cache: bool,
     shell_executable: str | None,
     no_shell: bool,
+    skip_identical: bool,
+    timings_fmt: str | None,
+    trace_path: str | None,
     unified: int | None,
     verbose: bool,
     ignore_whitespace: bool,
@@ -59,18 +217,28 @@ def main(
     the largest 10 numbers in `file{1,2}` (HEAD vs. worktree):
 
     git diff-x 'sort -rn' head - file1 file2
+
+    # Diff every changed JSON file between two tags, through `jq -S .`:
+
+    git diff-x -a -r v1..v2 -m '*.json=jq -S .'
     """
     if '-' in args:
         idx = args.index('-')
         cmd_args = args[:idx]
         paths = args[idx+1:]
+    elif all_files:
+        cmd_args = []
+        paths = args
     else:
         *cmd_args, path = args
         paths = [path]
 
     cmds = list(exec_cmds) + list(cmd_args)
+    globs = parse_maps(maps)
     shell = not no_shell
-    git_relpath_prefix = process.line('git', 'rev-parse', '--show-prefix', log=False)
+
+    if bisect and (all_files or refspec or ref or staged or maps or len(paths) != 1):
+        raise ValueError("-b/--bisect takes one path, and can't be combined with -a, -m, -r, -R, or -t")
 
     if sum([bool(refspec), bool(ref), staged]) > 1:
         raise ValueError("Specify at most one of -r/--refspec, -R/--ref, -C/--cached")
@@ -98,48 +266,233 @@ def main(
         *(['-U', str(unified)] if unified is not None else []),
         *(['--color=always'] if use_color else []),
     ]
-    for path in paths:
-        if len(paths) > 1:
-            err(path)
-        if cmds:
-            git_path = posixpath.normpath(f'{git_relpath_prefix}{path}')
-            cmds1 = [ f'git show {ref1}:{quote(git_path)}', *cmds ]
-            if ref2:
-                cmds2 = [ f'git show {ref2}:{quote(git_path)}', *cmds ]
+    if bisect:
+        returncode = bisect_changes(
+            bisect,
+            paths[0],
+            cmds,
+            make_comparator=partial(comparator, engine, diff_args, unified, ignore_whitespace, use_color, csv_key=csv_key, brief=brief, max_hunks=max_hunks),
+            cache=cache,
+            verbose=verbose,
+            shell=shell,
+            executable=shell_executable,
+            pipefail=pipefail,
+            color=use_color,
+        )
+        raise SystemExit(returncode)
+    if cache or result_cache:
+        from dffs.cache import EMPTY_IDENTITY, PipelineCache, ResultCache, blob_identity
+    pipeline_cache = PipelineCache() if cache else None
+    results = ResultCache() if result_cache else None
+    # Whether to compute each side's cache key (identifying its input and pipeline)
+    keyed = bool(pipeline_cache or results)
+    reader = blob_reader()
+    trace = None
+    if trace_path:
+        from dffs.trace import Trace
+        trace = Trace()
+    if timings_fmt or trace:
+        from dffs.timings import Timings
+
+    def split(side_cmds: list[str]) -> list:
+        return [ shlex.split(c) for c in side_cmds ] if not shell else side_cmds
+
+    def pipeline_for(path: str) -> list[str]:
+        """Pipeline for ``path``: from the first matching `-m/--map` GLOB, else the default commands."""
+        for glob, glob_cmds in globs:
+            if PurePosixPath(path).match(glob):
+                return glob_cmds
+        return cmds
+
+    def side_args(side: Side, path: str, path_cmds: list[str], log: Callable[[str], None]) -> tuple[list, Input, str | None]:
+        """Commands, stdin input, and pipeline cache key for one side of a comparison."""
+        if side == WORKTREE:
+            # First command reads the worktree file (as an argument, or on stdin if it's a Python stage)
+            cmd, *sub_cmds = path_cmds
+            if is_py_stage(cmd):
+                side_cmds = split(path_cmds)
+                stdin = partial(open, path, 'rb')
             else:
-                cmd, *sub_cmds = cmds
-                if staged:
-                    # Use :0: to read from index (staged version)
-                    cmds2 = [ f'git show :0:{quote(git_path)} | {cmd}', *sub_cmds ]
-                else:
-                    # Read from worktree
-                    cmds2 = [ f'{cmd} {quote(path)}', *sub_cmds ]
-            if not shell:
-                cmds1 = [ shlex.split(c) for c in cmds1 ]
-                cmds2 = [ shlex.split(c) for c in cmds2 ]
-
-            returncode = join_pipelines(
-                base_cmd=['diff', *diff_args],
-                cmds1=cmds1,
-                cmds2=cmds2,
-                verbose=verbose,
-                shell=not no_shell,
-                executable=shell_executable,
-                pipefail=pipefail,
-            )
-            # SIGPIPE (-13) is expected when piping to a pager that exits early
-            if returncode < 0 and returncode == -signal.SIGPIPE:
-                raise SystemExit(0)
-            raise SystemExit(returncode)
-        else:
-            git_diff_args = ['git', 'diff', *diff_args]
-            if staged:
-                git_diff_args.append('--cached')
-            git_diff_args.extend([refspec, '--', path])
+                side_cmds = split([ f'{cmd} {quote(path)}', *sub_cmds ])
+                stdin = None
+            key = PipelineCache.file_key(path, side_cmds, content_hash=cache_hash or bool(results), executable=shell_executable, shell=shell) if keyed else None
+            return side_cmds, stdin, key
+        side_cmds = split(path_cmds)
+        if side is None:
+            key = PipelineCache.key(EMPTY_IDENTITY, side_cmds, executable=shell_executable, shell=shell) if keyed else None
+            return side_cmds, b'', key
+        # Git sides feed blob contents (via `git cat-file`) into the first command
+        if verbose:
+            size = f', {side.size} bytes' if side.size is not None else ''
+            log(f"Reading {path} (blob {side.sha}{size})")
+        key = PipelineCache.key(blob_identity(side.sha), side_cmds, executable=shell_executable, shell=shell) if keyed else None
+        return side_cmds, partial(reader.stream, side), key
+
+    def shortcut(path: str, side1: Side, side2: Side) -> str | None:
+        """Why both sides are provably identical (so their pipelines needn't run), if they are."""
+        if isinstance(side1, Blob) and isinstance(side2, Blob) and side1.sha == side2.sha:
+            return f'same blob ({side1.sha})'
+        if skip_identical and isinstance(side1, Blob) and side2 == WORKTREE and matches_blob(path, side1):
+            return f'worktree matches blob {side1.sha}'
+        return None
+
+    def traced_stream(timings: Timings, side_num: int, blob: Blob) -> Callable[[], BinaryIO]:
+        """Stream ``blob`` (when a pipeline needs it), timing its copy (until the stream is drained) as a ``timings``
+        span."""
+        def stream() -> BinaryIO:
+            span_cm = timings.span('blob read', 'blob', side_num, sha=blob.sha)
+            span = span_cm.__enter__()
+
+            def done(size: int) -> None:
+                span.args['bytes'] = size
+                span_cm.__exit__(None, None, None)
+
+            return reader.stream(blob, done=done)
+        return stream
+
+    def diff_sides(path: str, side1: Side, side2: Side, path_cmds: list[str], out: BinaryIO | None, log: Callable[[str], None]) -> int:
+        reason = shortcut(path, side1, side2)
+        if reason:
             if verbose:
-                err(f"Running: {' '.join(git_diff_args)}")
-            returncode = call(git_diff_args)
-            # SIGPIPE (-13) is expected when piping to a pager that exits early
-            if returncode < 0 and returncode == -signal.SIGPIPE:
-                raise SystemExit(0)
-            raise SystemExit(returncode)
+                log(f"Skipping pipelines for {path}: {reason}")
+            return 0
+        cmds1, input1, key1 = side_args(side1, path, path_cmds, log)
+        cmds2, input2, key2 = side_args(side2, path, path_cmds, log)
+        timings = Timings(label=path) if timings_fmt or trace else None
+        if timings:
+            input1, input2 = (
+                traced_stream(timings, side_num, side) if isinstance(side, Blob) else stdin
+                for side_num, (side, stdin) in enumerate(((side1, input1), (side2, input2)), start=1)
+            )
+        labels = (f'{ref1}:{path}', f'{ref2 or ""}:{path}' if ref2 or staged else path)
+        base_cmd = comparator(engine, diff_args, unified, ignore_whitespace, use_color, labels, csv_key, brief, max_hunks)
+        result_key = ResultCache.key((key1, key2), base_cmd) if results and key1 and key2 else None
+        returncode = join_pipelines(
+            base_cmd=base_cmd,
+            cmds1=cmds1,
+            cmds2=cmds2,
+            verbose=verbose,
+            shell=shell,
+            executable=shell_executable,
+            pipefail=pipefail,
+            cache=pipeline_cache,
+            cache_keys=(key1, key2),
+            inputs=(input1, input2),
+            out=out,
+            log=log,
+            result_cache=results,
+            result_key=result_key,
+            timings=timings,
+        )
+        if timings_fmt:
+            timings.report(timings_fmt, log)
+        if trace:
+            trace.add(timings)
+        return returncode
+
+    def git_diff(path: str, out: BinaryIO | None, log: Callable[[str], None]) -> int:
+        git_diff_args = ['git', 'diff', *diff_args]
+        if staged:
+            git_diff_args.append('--cached')
+        git_diff_args.extend([refspec, '--', path])
+        if verbose:
+            log(f"Running: {' '.join(git_diff_args)}")
+        if out is None:
+            return call(git_diff_args)
+        proc = run(git_diff_args, stdout=PIPE)
+        out.write(proc.stdout)
+        return proc.returncode
+
+    # Keyed CSV diffs (and in-process comparisons) need each side's contents, even without a pipeline to transform
+    # them; otherwise, paths without one are passed to `git diff`
+    needs_contents = bool(csv_key or brief or max_hunks is not None)
+
+    def diff_path(path: str, out: BinaryIO | None = None, log: Callable[[str], None] = err) -> int:
+        """Diff one path (writing to ``out``, default stdout), return the exit code."""
+        path_cmds = pipeline_for(path)
+        if not path_cmds:
+            if not needs_contents:
+                return git_diff(path, out, log)
+            path_cmds = ['cat']
+
+        sides = []
+        for side_ref in (ref1, ref2 if ref2 or staged else WORKTREE):
+            if side_ref == WORKTREE:
+                sides.append(WORKTREE)
+                continue
+            blob = reader.info(side_ref, path)
+            if blob is None:
+                log(f"Path '{path}' does not exist in {side_ref or 'the index'}")
+                return 128
+            sides.append(blob)
+        return diff_sides(path, *sides, path_cmds, out, log)
+
+    def diff_change(path: str, out: BinaryIO | None = None, log: Callable[[str], None] = err) -> int:
+        """Diff one file from ``changes`` (writing to ``out``, default stdout), return the exit code."""
+        change = changes[path]
+        path_cmds = pipeline_for(path)
+        if not path_cmds:
+            if not needs_contents:
+                return git_diff(path, out, log)
+            path_cmds = ['cat']
+        side2 = WORKTREE if change.worktree else change.new
+        return diff_sides(path, change.old, side2, path_cmds, out, log)
+
+    diff = diff_path
+    if all_files:
+        # Enumerate changed files (and both sides' blob SHAs) up front; paths are made relative to the cwd
+        root = line('git', 'rev-parse', '--show-toplevel')
+        changes = {
+            relpath(join(root, change.path)): change
+            for change in changed_files(ref1, ref2, staged=staged, pathspecs=paths)
+        }
+        paths = [
+            path for path in changes
+            if cmds or not globs or pipeline_for(path)
+        ]
+        diff = diff_change
+
+    def diff_buffered(path: str) -> tuple[int, bytes, list[str]]:
+        """Diff one path, buffering its output and log messages (for printing in argument order)."""
+        out = BytesIO()
+        logs = []
+        returncode = diff(path, out=out, log=logs.append)
+        return returncode, out.getvalue(), logs
+
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    returncodes = []
+    try:
+        with reader:
+            if jobs == 1 or len(paths) == 1:
+                for path in paths:
+                    if len(paths) > 1:
+                        err(path)
+                    returncode = diff(path)
+                    # SIGPIPE (-13) is expected when piping to a pager that exits early
+                    if returncode < 0 and returncode == -signal.SIGPIPE:
+                        raise SystemExit(0)
+                    returncodes.append(returncode)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=jobs) as pool:
+                    futures = [ pool.submit(diff_buffered, path) for path in paths ]
+                    try:
+                        for path, future in zip(paths, futures):
+                            returncode, output, logs = future.result()
+                            err(path)
+                            for msg in logs:
+                                err(msg)
+                            sys.stdout.buffer.write(output)
+                            sys.stdout.buffer.flush()
+                            returncodes.append(returncode)
+                    except BrokenPipeError:
+                        # Pager exited early; skip paths that haven't started yet
+                        for future in futures:
+                            future.cancel()
+                        raise SystemExit(0)
+    finally:
+        if trace:
+            trace.write(trace_path)
+    raise SystemExit(aggregate_returncodes(returncodes))
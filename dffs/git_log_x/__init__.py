@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import os
+import shlex
+import sys
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING
+
+from click import option, argument, command
+
+from dffs.base import err
+from dffs.blobs import Blob, BlobReader, Commit, blob_reader, file_history
+from dffs.cli import cache_opt, shell_exec_opt, no_shell_opt, pipefail_opt, verbose_opt, exec_cmd_opt, version_opt
+from dffs.diff_x import brief_opt, color_opt, comparator, csv_key_opt, engine_opt, max_hunks_opt, unified_opt, ignore_whitespace_opt
+from dffs.identity import same_contents
+from dffs.utils import join_pipelines, run_pipeline
+
+if TYPE_CHECKING:
+    from dffs.cache import PipelineCache
+
+# Modules only needed by some options (caches, …) are imported when those are used, to keep startup (paid on every
+# invocation, e.g. from Git aliases) fast
+
+# ANSI escape `git log --color` uses for commit lines
+YELLOW = '\x1b[33m'
+RESET = '\x1b[0m'
+# Length commit SHAs are abbreviated to, in diff labels and log messages
+ABBREV = 12
+
+# A transformed blob: the pipeline's exit code, its output's path (if it succeeded), and log messages
+Output = tuple[int, Path | None, list[str]]
+
+
+def header(commit: Commit, color: bool) -> bytes:
+    """A commit's log entry header, like ``git log``'s (medium format)."""
+    line = f'commit {commit.sha}'
+    return '\n'.join([
+        f'{YELLOW}{line}{RESET}' if color else line,
+        f'Author: {commit.author}',
+        f'Date:   {commit.date}',
+        '',
+        f'    {commit.subject}',
+        '',
+        '',
+    ]).encode()
+
+
+class BlobOutputs:
+    """Pipeline outputs for versions (blobs) of a file, each computed once, on first request: read via ``reader``, run
+    through ``cmds``, and written to ``cache`` (if given) or a temporary directory (removed on :meth:`close`).
+
+    Requests for different blobs can be made from multiple threads (the pipelines run concurrently; blob reads are
+    serialized by ``reader``).
+    """
+
+    def __init__(
+        self,
+        reader: BlobReader,
+        cmds: list[str],
+        path: str,
+        cache: PipelineCache | None = None,
+        verbose: bool = False,
+        shell: bool = True,
+        executable: str | None = None,
+        pipefail: bool = False,
+    ):
+        self.reader = reader
+        self.cmds = cmds if shell else [ shlex.split(c) for c in cmds ]
+        self.path = path
+        self.cache = cache
+        self.verbose = verbose
+        self.shell = shell
+        self.executable = executable
+        self.pipefail = pipefail
+        self.tmpdir = TemporaryDirectory(prefix='dffs-log-')
+        self.outputs: dict[str | None, Output] = {}
+
+    def __call__(self, blob: Blob | None) -> Output:
+        """Output of the pipeline over ``blob`` (or, if ``None``, empty input)."""
+        name = blob.sha if blob else None
+        if name not in self.outputs:
+            self.outputs[name] = self._run(blob)
+        return self.outputs[name]
+
+    def _run(self, blob: Blob | None) -> Output:
+        logs = []
+        name = blob.sha if blob else 'empty'
+        key = None
+        if self.cache:
+            from dffs.cache import EMPTY_IDENTITY, PipelineCache, blob_identity
+            identity = blob_identity(blob.sha) if blob else EMPTY_IDENTITY
+            key = PipelineCache.key(identity, self.cmds, executable=self.executable, shell=self.shell)
+            hit = self.cache.get(key)
+            if hit:
+                if self.verbose:
+                    logs.append(f"Cache hit: {name}")
+                return 0, hit, logs
+        tmp = self.cache.tmp() if key else open(Path(self.tmpdir.name) / name, 'wb')
+        if self.verbose and blob:
+            logs.append(f"Reading {self.path} (blob {blob.sha})")
+        returncode = run_pipeline(
+            self.cmds,
+            tmp,
+            verbose=self.verbose,
+            shell=self.shell,
+            executable=self.executable,
+            pipefail=self.pipefail,
+            stdin=partial(self.reader.stream, blob) if blob else b'',
+            log=logs.append,
+        )
+        if returncode:
+            os.remove(tmp.name)
+            return returncode, None, logs
+        out = self.cache.put(key, tmp.name) if key else Path(tmp.name)
+        return 0, out, logs
+
+    def close(self) -> None:
+        self.tmpdir.cleanup()
+
+    def __enter__(self) -> BlobOutputs:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+@command('git-log-x', short_help="Show how a Git-tracked file's transformed contents changed, commit by commit", no_args_is_help=True)
+@brief_opt
+@cache_opt
+@color_opt
+@csv_key_opt
+@engine_opt
+@max_hunks_opt
+@option('-j', '--jobs', type=int, default=0, help='Transform up to this many blobs in parallel, ahead of the output (default 0: one per CPU)')
+@option('-n', '--max-count', type=int, help='Only consider the last N commits changing the file')
+@option('-r', '--revs', help='Revision range to walk (e.g. `v1..v2`; default: `HEAD`)')
+@pipefail_opt
+@shell_exec_opt
+@no_shell_opt
+@unified_opt
+@version_opt
+@verbose_opt
+@ignore_whitespace_opt
+@exec_cmd_opt
+@argument('args', metavar='[exec_cmd...] <path>', nargs=-1)
+def main(
+    brief: bool,
+    cache: bool,
+    color: bool,
+    csv_key: str | None,
+    engine: str,
+    max_hunks: int | None,
+    jobs: int,
+    max_count: int | None,
+    revs: str | None,
+    pipefail: bool,
+    shell_executable: str | None,
+    no_shell: bool,
+    unified: int | None,
+    verbose: bool,
+    ignore_whitespace: bool,
+    exec_cmds: tuple[str, ...],
+    args: tuple[str, ...],
+):
+    """Walk the commits changing a file, showing each one's diff of the file's contents after a pipeline of commands.
+
+    Each distinct version (blob) of the file is transformed once (including those shared by consecutive commits, and
+    ones a commit reverts to), up to `-j` at a time, ahead of the output. Commits whose transformed output didn't change
+    are skipped.
+
+    Examples:
+
+    # How the set of top-level keys in `config.json` changed, over the last 20 commits changing it:
+
+    git log-x -n 20 'jq -c keys' config.json
+    """
+    if not args:
+        raise ValueError('Must provide a path')
+    *cmd_args, path = args
+    cmds = list(exec_cmds) + list(cmd_args) or ['cat']
+
+    # Auto-detect color based on TTY if not explicitly set
+    use_color = color if color is not None else sys.stdout.isatty()
+    diff_args = [
+        *(['-w'] if ignore_whitespace else []),
+        *(['-U', str(unified)] if unified is not None else []),
+        *(['--color=always'] if use_color else []),
+    ]
+    if cache:
+        from dffs.cache import PipelineCache
+    commits = file_history(path, revs=[revs or 'HEAD'], max_count=max_count)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    reader = blob_reader()
+    outputs = BlobOutputs(
+        reader,
+        cmds,
+        path,
+        cache=PipelineCache() if cache else None,
+        verbose=verbose,
+        shell=not no_shell,
+        executable=shell_executable,
+        pipefail=pipefail,
+    )
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    returncodes = []
+    with reader, outputs, ThreadPoolExecutor(max_workers=jobs) as pool:
+        # Submit each distinct blob's transform once, in the order they're needed (newest first)
+        futures = {}
+        for commit in commits:
+            if commit.old == commit.new:
+                continue
+            for blob in (commit.new, commit.old):
+                name = blob.sha if blob else None
+                if name not in futures:
+                    futures[name] = pool.submit(outputs, blob)
+        # Log messages are printed (and failures counted) once per blob, when its first commit is output
+        logged = set()
+        try:
+            for commit in commits:
+                short = commit.sha[:ABBREV]
+                if commit.old == commit.new:
+                    if verbose:
+                        err(f"Skipping {short}: blob unchanged")
+                    continue
+                pair = []
+                for blob in (commit.old, commit.new):
+                    name = blob.sha if blob else None
+                    returncode, out, logs = futures[name].result()
+                    if name not in logged:
+                        logged.add(name)
+                        for msg in logs:
+                            err(msg)
+                        if returncode:
+                            returncodes.append(returncode)
+                    pair.append((returncode, out))
+                (returncode1, out1), (returncode2, out2) = pair
+                if returncode1 or returncode2:
+                    err(f"Skipping {short}: pipeline failed")
+                    continue
+                if same_contents(out1, out2):
+                    if verbose:
+                        err(f"Skipping {short}: transformed output unchanged")
+                    continue
+                sys.stdout.buffer.write(header(commit, use_color))
+                labels = (f'{short}^:{path}', f'{short}:{path}')
+                base_cmd = comparator(engine, diff_args, unified, ignore_whitespace, use_color, labels, csv_key, brief, max_hunks)
+                output = BytesIO()
+                returncode = join_pipelines(base_cmd=base_cmd, cmds1=out1, cmds2=out2, out=output, verbose=verbose)
+                if returncode not in (0, 1):
+                    returncodes.append(returncode)
+                sys.stdout.buffer.write(output.getvalue())
+                sys.stdout.buffer.flush()
+        except BrokenPipeError:
+            # Pager exited early; skip transforms that haven't started yet
+            for future in futures.values():
+                future.cancel()
+            raise SystemExit(0)
+    # Like `git log`, differences aren't errors; exit with the first error (e.g. a failed pipeline), if any
+    raise SystemExit(returncodes[0] if returncodes else 0)
@@ -0,0 +1,65 @@
+"""Cheap checks for comparison inputs that are provably identical, so their pipelines needn't run."""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from stat import S_ISREG
+
+from dffs.blobs import Blob
+
+# Bytes read from each file at a time when comparing or hashing contents
+CHUNK_SIZE = 1024 * 1024
+
+
+def same_contents(path1: str, path2: str) -> bool:
+    """Whether two regular files have identical contents; compares sizes first, then chunks (stopping at the first
+    mismatch). Non-regular files (e.g. named pipes, which can only be read once) never match.
+    """
+    try:
+        st1, st2 = os.stat(path1), os.stat(path2)
+    except OSError:
+        return False
+    if not (S_ISREG(st1.st_mode) and S_ISREG(st2.st_mode)):
+        return False
+    if (st1.st_dev, st1.st_ino) == (st2.st_dev, st2.st_ino):
+        return True
+    if st1.st_size != st2.st_size:
+        return False
+    with open(path1, 'rb') as f1, open(path2, 'rb') as f2:
+        while True:
+            chunk1 = f1.read(CHUNK_SIZE)
+            if chunk1 != f2.read(CHUNK_SIZE):
+                return False
+            if not chunk1:
+                return True
+
+
+def git_blob_sha(path: str, algorithm: str = 'sha1') -> str:
+    """Compute the blob SHA Git would assign a file's contents (like ``git hash-object``, without filters)."""
+    size = os.stat(path).st_size
+    h = hashlib.new(algorithm)
+    h.update(f'blob {size}\0'.encode())
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def matches_blob(path: str, blob: Blob) -> bool:
+    """Whether the (regular) file at ``path`` has the same contents as ``blob``.
+
+    Checks the size first (if ``blob``'s is known), then hashes the file. Files that Git would filter (e.g. with
+    ``autocrlf`` or LFS) may not match even if ``git diff`` considers them unchanged, which only means a missed
+    shortcut.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if not S_ISREG(st.st_mode):
+        return False
+    if blob.size is not None and st.st_size != blob.size:
+        return False
+    algorithm = 'sha256' if len(blob.sha) == 64 else 'sha1'
+    return git_blob_sha(path, algorithm) == blob.sha
@@ -0,0 +1,22 @@
+"""``dffs`` CLI: housekeeping subcommands shared by ``diff-x``, ``comm-x``, and ``git-diff-x``."""
+
+from click import group
+
+from dffs.cli import version_opt
+from dffs.commands import bench, cache, serve, shell_integration
+
+
+@group('dffs')
+@version_opt
+def cli():
+    """Pipe and diff files: execute shell pipelines against multiple inputs, diff/compare/join results."""
+
+
+shell_integration.register(cli)
+cache.register(cli)
+bench.register(cli)
+serve.register(cli)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,171 @@
+"""Built-in normalizing transforms, usable as ``@<name>[:<arg>]`` pipeline stages (see :mod:`dffs.transforms`).
+
+These stream in-process, replacing common external tools (and the process spawns they cost):
+
+- ``@json-canon[:<indent>]``: canonical JSON (like ``jq -S .``): sorted keys, normalized numbers, ``<indent>``-space
+  indentation (default 2; 0 for compact); buffers its whole input
+- ``@ndjson-canon``: canonicalize each line of newline-delimited JSON to a compact, sorted-key record
+- ``@csv-cols:<col>,<col>,...``: project (and reorder) CSV columns, by header name
+- ``@csv-header``: a CSV's column names, one per line (like ``head -1 | tr , '\\n'``)
+- ``@sort[:u]``: sort lines in byte order (like ``LC_ALL=C sort [-u]``), spilling to disk beyond a memory budget
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import re
+from decimal import Decimal
+from itertools import chain
+from typing import Any, Iterable, Iterator
+
+from dffs.sort import ExternalSort
+from dffs.transforms import register
+
+# Floats with integral values, and magnitudes below this, are written as integers (``1.0`` → ``1``)
+MAX_EXACT_INT = 2 ** 53
+
+
+class _Number(str):
+    """A (non-integral, or large) number's canonical JSON text, written as-is by :func:`_dumps`."""
+
+
+def _number(s: str) -> int | _Number:
+    """Normalize a JSON number with a fraction or exponent, without rounding it (or overflowing to ``Infinity``).
+
+    Integral values below ``MAX_EXACT_INT`` become integers; values a ``float`` holds exactly are written as Python
+    writes them (``1.50`` → ``1.5``, ``1E300`` → ``1e+300``); others keep all their digits (``1e400``, or
+    ``0.1000000000000000000001``).
+    """
+    d = Decimal(s)
+    if d == d.to_integral_value() and abs(d) < MAX_EXACT_INT:
+        return int(d)
+    f = repr(float(d))
+    if Decimal(f) == d:
+        return _Number(f)
+    return _Number(str(d.normalize()).replace('E', 'e'))
+
+
+def _non_finite(s: str) -> None:
+    raise ValueError(f"Non-finite number {s} isn't valid JSON")
+
+
+_decoder = json.JSONDecoder(parse_float=_number, parse_constant=_non_finite)
+_whitespace = re.compile(r'\s*')
+
+
+def _skip_ws(text: str, pos: int) -> int:
+    return _whitespace.match(text, pos).end()
+
+
+def _encode(obj: Any, indent: int | None, level: int) -> Iterator[str]:
+    """Chunks of ``obj``'s JSON text, as ``json.dumps(obj, sort_keys=True, ensure_ascii=False)`` would write them
+    (indented, or compact if ``indent`` is falsy), but with :class:`_Number` texts written as-is."""
+    if isinstance(obj, _Number):
+        yield obj
+    elif isinstance(obj, (dict, list)):
+        items = sorted(obj.items()) if isinstance(obj, dict) else obj
+        start, end = '{}' if isinstance(obj, dict) else '[]'
+        if not items:
+            yield start + end
+            return
+        newline = '\n' + ' ' * (indent * (level + 1)) if indent else ''
+        yield start
+        for idx, item in enumerate(items):
+            yield (',' if idx else '') + newline
+            if isinstance(obj, dict):
+                key, item = item
+                yield json.dumps(key, ensure_ascii=False) + (': ' if indent else ':')
+            yield from _encode(item, indent, level + 1)
+        yield ('\n' + ' ' * (indent * level) if indent else '') + end
+    else:
+        yield json.dumps(obj, ensure_ascii=False)
+
+
+def _dumps(obj: Any, indent: int | None) -> str:
+    return ''.join(_encode(obj, indent, 0))
+
+
+def _json_values(lines: Iterable[bytes]) -> Iterator[Any]:
+    """Parse a stream of (whitespace-separated) JSON values, like ``jq`` does (after reading all of it)."""
+    text = b''.join(lines).decode()
+    pos = _skip_ws(text, 0)
+    while pos < len(text):
+        obj, pos = _decoder.raw_decode(text, pos)
+        yield obj
+        pos = _skip_ws(text, pos)
+
+
+@register('json-canon')
+def json_canon(lines: Iterable[bytes], indent: str = '2') -> Iterator[bytes]:
+    """Canonicalize JSON values: sort object keys, normalize numbers, and pretty-print with ``indent`` spaces.
+
+    Unlike the other stages, this buffers its whole input (values may span lines), so memory use scales with the input;
+    use ``@ndjson-canon`` for large newline-delimited inputs. Numbers are normalized without rounding (see
+    :func:`_number`), and non-finite ones (``NaN``, ``Infinity``), which aren't valid JSON, are rejected.
+    """
+    for obj in _json_values(lines):
+        yield (_dumps(obj, int(indent)) + '\n').encode()
+
+
+@register('ndjson-canon')
+def ndjson_canon(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """Canonicalize each (non-blank) line of newline-delimited JSON as a compact, sorted-key record."""
+    for line in lines:
+        if line.strip():
+            yield (_dumps(_decoder.decode(line.decode()), None) + '\n').encode()
+
+
+def _csv_rows(lines: Iterable[bytes]) -> Iterator[list[str]]:
+    return csv.reader(line.decode(errors='surrogateescape') for line in lines)
+
+
+class _Encoder:
+    """``csv.writer`` "file" whose ``write`` returns the encoded row (which ``writerow`` passes through)."""
+    @staticmethod
+    def write(s: str) -> bytes:
+        return s.encode(errors='surrogateescape')
+
+
+def _csv_lines(rows: Iterable[list[str]]) -> Iterator[bytes]:
+    writer = csv.writer(_Encoder(), lineterminator='\n')
+    return map(writer.writerow, rows)
+
+
+@register('csv-cols')
+def csv_cols(lines: Iterable[bytes], cols: str) -> Iterator[bytes]:
+    """Project a CSV onto (comma-separated) columns ``cols``, in that order, selected by header name."""
+    rows = _csv_rows(lines)
+    header = next(rows, None)
+    if header is None:
+        return
+    names = cols.split(',')
+    missing = [ name for name in names if name not in header ]
+    if missing:
+        raise ValueError(f"CSV column(s) not found: {', '.join(missing)} (header: {', '.join(header)})")
+    idxs = [ header.index(name) for name in names ]
+    yield from _csv_lines(
+        [ row[idx] if idx < len(row) else '' for idx in idxs ]
+        for row in chain([header], rows)
+    )
+
+
+@register('csv-header')
+def csv_header(lines: Iterable[bytes]) -> Iterator[bytes]:
+    """A CSV's column names, one per line."""
+    header = next(_csv_rows(lines), None)
+    for name in header or []:
+        yield name.encode(errors='surrogateescape') + b'\n'
+
+
+@register('sort')
+def sort(lines: Iterable[bytes], flags: str = '') -> Iterator[bytes]:
+    """Sort lines in byte order; with ``flags`` ``u``, drop duplicates."""
+    unique = 'u' in flags
+    prev = None
+    with ExternalSort() as sorter:
+        for line in sorter.sort(lines):
+            if unique and line == prev:
+                continue
+            prev = line
+            yield line + b'\n'
@@ -0,0 +1,212 @@
+"""Start pipelines of shell commands (and Python stages) without waiting for them."""
+
+from __future__ import annotations
+
+import os
+import shlex
+import sys
+from functools import cache
+from io import BytesIO
+from itertools import groupby
+from shutil import which
+from subprocess import Popen, PIPE, STDOUT
+from threading import Thread
+from typing import BinaryIO
+
+from dffs.transforms import PyStage, Stage, is_py_stage
+
+# Shell that runs commands needing one, by default (``--shell-executable`` overrides it)
+DEFAULT_SHELL = '/bin/sh'
+# Characters with special meaning to a shell outside quotes (expansions, globs, redirection, control operators, …)
+SHELL_CHARS = frozenset('|&;<>()$`*?[]{}~#!^\n')
+# Characters with special meaning within double quotes (expansions, and escapes that ``shlex`` treats differently)
+DOUBLE_QUOTED_SHELL_CHARS = frozenset('$`\\')
+# Builtins and keywords, whose behavior can differ from (or that have no) executables of the same name
+SHELL_WORDS = frozenset({
+    '.', ':', '[', '{', '}', '!', 'alias', 'bg', 'break', 'case', 'cd', 'command', 'continue', 'do', 'done', 'echo',
+    'elif', 'else', 'esac', 'eval', 'exec', 'exit', 'export', 'false', 'fg', 'fi', 'for', 'function', 'getopts',
+    'hash', 'if', 'jobs', 'kill', 'local', 'printf', 'pwd', 'read', 'readonly', 'return', 'select', 'set', 'shift',
+    'source', 'test', 'then', 'time', 'times', 'trap', 'true', 'type', 'ulimit', 'umask', 'unalias', 'unset', 'until',
+    'wait', 'while',
+})
+
+
+def needs_shell(cmd: str) -> bool:
+    """Whether ``cmd`` uses shell syntax (beyond quoting and backslash escapes), so can't just be split into args."""
+    quote = None
+    escaped = False
+    for c in cmd:
+        if escaped:
+            escaped = False
+        elif quote == "'":
+            if c == "'":
+                quote = None
+        elif quote == '"':
+            if c == '"':
+                quote = None
+            elif c in DOUBLE_QUOTED_SHELL_CHARS:
+                return True
+        elif c in ('"', "'"):
+            quote = c
+        elif c == '\\':
+            escaped = True
+        elif c in SHELL_CHARS:
+            return True
+    return quote is not None or escaped
+
+
+@cache
+def _which(name: str, path: str | None) -> str | None:
+    return which(name, path=path)
+
+
+def direct_args(cmd: str, path: str | None = None) -> tuple[str, list[str]] | None:
+    """``cmd``'s executable (resolved on ``path``, default ``$PATH``) and args, if it can be run without a shell: it
+    uses no shell syntax, doesn't start with a builtin, keyword, or variable assignment, and its executable exists
+    (otherwise the shell's reporting of a missing command is kept). Else ``None``."""
+    if needs_shell(cmd):
+        return None
+    args = shlex.split(cmd)
+    if not args or args[0] in SHELL_WORDS or '=' in args[0]:
+        return None
+    exe = _which(args[0], path if path is not None else os.environ.get('PATH'))
+    if exe is None:
+        return None
+    return exe, args
+
+
+def _drain_stderr(proc: Popen) -> None:
+    """Read ``proc``'s stderr in a background thread (so it can't fill up and block), saving it for error reporting."""
+    proc.stderr_output = b''
+
+    def read():
+        proc.stderr_output = proc.stderr.read()
+
+    proc.stderr_thread = Thread(target=read, daemon=True)
+    proc.stderr_thread.start()
+
+
+def stderr_output(proc: Popen) -> bytes:
+    """Return everything a process started by :func:`spawn` wrote to stderr (empty if it was merged into stdout)."""
+    thread = getattr(proc, 'stderr_thread', None)
+    if thread:
+        thread.join()
+    return getattr(proc, 'stderr_output', b'')
+
+
+def _feed(pipe: BinaryIO, data: bytes) -> None:
+    try:
+        pipe.write(data)
+        pipe.close()
+    except BrokenPipeError:
+        # The first command exited without reading all of its input
+        pass
+
+
+def _stdin_source(stdin: bytes | BinaryIO | None) -> BinaryIO:
+    """Stream for a leading Python stage to read: ``stdin``'s bytes or file, else (a copy of) our own stdin."""
+    if isinstance(stdin, bytes):
+        return BytesIO(stdin)
+    if stdin is not None:
+        return stdin
+    return open(sys.stdin.fileno(), 'rb', closefd=False)
+
+
+def spawn(
+    cmds: list[Stage],
+    out: str | BinaryIO,
+    stdin: bytes | BinaryIO | None = None,
+    both: bool = False,
+    shell: bool = True,
+    executable: str | None = None,
+    direct: bool = True,
+    **kwargs,
+) -> list[Popen | PyStage]:
+    """Start ``cmds`` as a pipeline (like ``cmd1 | cmd2 | …``), without waiting for it to finish.
+
+    Args:
+        cmds: Commands to pipe together; ``str``s are split with ``shlex`` when ``shell=False``. Python stages (see
+            :mod:`dffs.transforms`) run in-process, each run of consecutive ones fused into one :class:`PyStage`
+        out: Path (e.g. a named pipe) or writable binary file to send the last command's stdout to; file objects are
+            closed (in this process) once the last command has started
+        stdin: Bytes to feed (from a background thread) to the first command's stdin, or a readable binary file to
+            connect to it (closed in this process once the first command has started); by default it inherits ours
+        both: Merge each command's stderr into its stdout (like shell ``2>&1``)
+        shell: Run each command via ``executable``
+        executable: Shell to run commands with (when ``shell=True``); defaults to ``/bin/sh``
+        direct: With ``shell=True``, run commands that don't need a shell (see :func:`direct_args`), e.g. ``sort -u``,
+            directly, skipping the shell's startup
+        **kwargs: Additional arguments passed to ``subprocess.Popen``
+
+    Returns:
+        The started processes (and Python stages), in pipeline order. Unless ``both=True``, each process's stderr is
+        drained in the background, and is available via :func:`stderr_output`.
+    """
+    procs = []
+    prev: BinaryIO | None = None  # Output of the previous stage, for the next one to read
+    groups = [ (py, list(group)) for py, group in groupby(cmds, key=is_py_stage) ]
+    for group_idx, (py, group) in enumerate(groups):
+        is_last_group = group_idx + 1 == len(groups)
+        if py:
+            src = prev if prev is not None else _stdin_source(stdin)
+            if is_last_group:
+                dst = out
+                prev = None
+            else:
+                fd_r, fd_w = os.pipe()
+                dst = open(fd_w, 'wb')
+                prev = open(fd_r, 'rb')
+            procs.append(PyStage(group, src, dst))
+            continue
+
+        for idx, cmd in enumerate(group):
+            cmd_shell = shell
+            cmd_executable = executable if shell else None
+            resolved = None
+            if not shell and isinstance(cmd, str):
+                cmd = shlex.split(cmd)
+            elif shell and direct and isinstance(cmd, str):
+                resolved = direct_args(cmd, kwargs['env'].get('PATH') if kwargs.get('env') else None)
+            if resolved:
+                cmd_executable, args = resolved
+                cmd_shell = False
+            else:
+                args = cmd
+            is_last = is_last_group and idx + 1 == len(group)
+            feed = prev is None and isinstance(stdin, bytes)
+            if prev is not None:
+                proc_stdin = prev
+            elif feed:
+                proc_stdin = PIPE
+            else:
+                proc_stdin = stdin
+
+            def mkproc(stdout):
+                return Popen(
+                    args,
+                    stdin=proc_stdin,
+                    stdout=stdout,
+                    stderr=STDOUT if both else PIPE,
+                    shell=cmd_shell,
+                    executable=cmd_executable,
+                    **kwargs,
+                )
+
+            if is_last:
+                with (open(out, 'wb') if isinstance(out, str) else out) as out_file:
+                    proc = mkproc(out_file)
+            else:
+                proc = mkproc(PIPE)
+
+            if feed:
+                Thread(target=_feed, args=(proc.stdin, stdin), daemon=True).start()
+            if proc_stdin is not None and proc_stdin is not PIPE:
+                proc_stdin.close()
+            if not both:
+                _drain_stderr(proc)
+            if resolved:
+                # Report the command as written (e.g. in failure messages and timings)
+                proc.args = cmd
+            procs.append(proc)
+            prev = proc.stdout
+    return procs
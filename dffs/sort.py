@@ -0,0 +1,170 @@
+"""In-process external-merge sort of byte lines (in byte order, like ``LC_ALL=C sort``), for ``comm``-ing streams."""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from heapq import merge
+from multiprocessing import get_context
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import Lock
+from typing import Callable, Iterable, Iterator
+
+# Default memory budget for buffering each input's lines (beyond which sorted runs are spilled to disk)
+DEFAULT_SORT_MEMORY = 256 * 1024 * 1024
+# Approximate per-line overhead (beyond its bytes) of holding a line in a ``list``
+LINE_OVERHEAD = 40
+
+
+def _strip(line: bytes) -> bytes:
+    return line[:-1] if line.endswith(b'\n') else line
+
+
+def _read_run(path: str) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        for line in f:
+            yield line[:-1]
+
+
+def _write_run(lines: list[bytes], path: str) -> str:
+    with open(path, 'wb') as f:
+        for line in lines:
+            f.write(line + b'\n')
+    return path
+
+
+def _sort_run(data: bytes, path: str, case_insensitive: bool) -> str:
+    """Sort newline-terminated lines in ``data``, and write them to ``path`` (in a worker process)."""
+    lines = data.split(b'\n')[:-1]
+    lines.sort(key=bytes.lower if case_insensitive else None)
+    return _write_run(lines, path)
+
+
+@dataclass
+class ExternalSort:
+    """Sort streams of lines in byte order, within a memory budget, skipping the sort if a stream is already sorted.
+
+    Lines are buffered while checking whether they're in order. Each time ``memory`` bytes are buffered, the buffer is
+    written to a "run" file in ``spill_dir``: as is if it's in order, else sorted by a worker process (so runs are
+    sorted in parallel, on up to ``jobs`` cores). If every run is in order (and follows the previous one), the runs
+    are just read back; otherwise they're k-way merged. Inputs that fit in ``memory`` are never spilled.
+
+    Args:
+        memory: Approximate bytes of lines to buffer (per stream) before spilling a run
+        jobs: Worker processes to sort runs with (0: one per CPU); started on first use, and shared by all streams
+        spill_dir: Directory to spill runs to; defaults to the system temp directory
+        case_insensitive: Order lines case-insensitively (by their lowercased bytes)
+    """
+    memory: int = DEFAULT_SORT_MEMORY
+    jobs: int = 0
+    spill_dir: str | None = None
+    case_insensitive: bool = False
+    pool: ProcessPoolExecutor | None = field(default=None, init=False, repr=False)
+    lock: Lock = field(default_factory=Lock, init=False, repr=False)
+
+    @property
+    def key(self) -> Callable[[bytes], bytes] | None:
+        return bytes.lower if self.case_insensitive else None
+
+    @property
+    def workers(self) -> int:
+        return self.jobs or os.cpu_count() or 1
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+            return self.pool
+
+    def close(self) -> None:
+        """Shut down the worker processes (if any were started)."""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+
+    def __enter__(self) -> ExternalSort:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def read(self, stream: Iterable[bytes]) -> Sorted:
+        """Read all of ``stream`` (buffering and spilling runs of lines); iterate the result for the sorted lines."""
+        key = self.key
+        buf: list[bytes] = []
+        size = 0
+        in_order = True  # Whether ``buf`` (and all spilled runs) are in order so far
+        prev = None
+        runs: list[Future | str] = []  # Spilled runs: paths, or futures of paths (for runs being sorted by workers)
+        tmpdir = None
+
+        def spill():
+            nonlocal tmpdir
+            if tmpdir is None:
+                tmpdir = TemporaryDirectory(dir=self.spill_dir, prefix='dffs-sort-')
+            path = NamedTemporaryFile(dir=tmpdir.name, prefix='run-', delete=False).name
+            if in_order:
+                runs.append(_write_run(buf, path))
+            else:
+                pool = self._pool()
+                # Bound the runs held in memory awaiting a worker
+                pending = [ run for run in runs if isinstance(run, Future) and not run.done() ]
+                if len(pending) >= self.workers:
+                    pending[0].result()
+                data = b''.join(line + b'\n' for line in buf)
+                runs.append(pool.submit(_sort_run, data, path, self.case_insensitive))
+
+        for line in stream:
+            line = _strip(line)
+            if in_order and prev is not None and (key(line) < key(prev) if key else line < prev):
+                # Runs already spilled are in order; only this buffer (and later ones) need sorting
+                in_order = False
+            prev = line
+            buf.append(line)
+            size += len(line) + LINE_OVERHEAD
+            if size >= self.memory:
+                spill()
+                buf = []
+                size = 0
+        if not in_order:
+            buf.sort(key=key)
+        return Sorted(runs, buf, in_order, key, tmpdir)
+
+    def sort(self, stream: Iterable[bytes]) -> Iterator[bytes]:
+        """Yield the lines of ``stream`` (without trailing newlines) in sorted order."""
+        yield from self.read(stream)
+
+
+@dataclass
+class Sorted:
+    """A stream read by :meth:`ExternalSort.read`: spilled runs, plus a final (sorted) in-memory buffer.
+
+    Iterating yields the lines in sorted order (concatenating the runs if the stream was already in order, else
+    merging them), then removes the spilled runs.
+    """
+    runs: list[Future | str]
+    buf: list[bytes]
+    in_order: bool
+    key: Callable[[bytes], bytes] | None = None
+    tmpdir: TemporaryDirectory | None = None
+
+    @property
+    def spilled(self) -> int:
+        return len(self.runs)
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            paths = [ run.result() if isinstance(run, Future) else run for run in self.runs ]
+            if self.in_order:
+                for path in paths:
+                    yield from _read_run(path)
+                yield from self.buf
+            elif not paths:
+                yield from self.buf
+            else:
+                yield from merge(*map(_read_run, paths), self.buf, key=self.key)
+        finally:
+            if self.tmpdir:
+                self.tmpdir.cleanup()
@@ -0,0 +1,211 @@
+"""Per-stage resource usage of :func:`~dffs.utils.join_pipelines` runs, for ``--timings`` reports."""
+
+from __future__ import annotations
+
+import json
+import os
+import resource
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from subprocess import Popen
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterator
+
+from dffs.base import fmt_size
+from dffs.transforms import PyStage
+
+# ``--timings`` output formats
+FORMATS = ('table', 'json')
+
+
+def _own_peak_rss_kb() -> int | None:
+    """This process's peak RSS (KiB), from ``/proc`` (unlike ``ru_maxrss``, it isn't inherited across ``exec``)."""
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        return None
+
+
+@dataclass
+class Stage:
+    """Resource usage of one pipeline process, Python stage, or comparator.
+
+    ``max_rss_kb`` is ``None`` for in-process stages. A process's ``ru_maxrss`` includes the RSS of the process that
+    spawned it (it's carried across ``fork``/``exec``), so values up to ``rss_floor_kb`` (this process's peak RSS when
+    the stage was spawned) are only an upper bound.
+    """
+    side: int | None
+    cmd: str
+    start: float
+    pid: int | None = None
+    wall: float | None = None
+    user: float | None = None
+    sys: float | None = None
+    max_rss_kb: int | None = None
+    rss_floor_kb: int | None = None
+    returncode: int | None = None
+
+
+@dataclass
+class Pipe:
+    """Bytes and lines a pipeline wrote to the comparator (through its FIFO)."""
+    side: int
+    bytes: int = 0
+    lines: int = 0
+
+    def count(self, chunk: bytes) -> None:
+        self.bytes += len(chunk)
+        self.lines += chunk.count(b'\n')
+
+
+@dataclass
+class Span:
+    """A step of a comparison other than running a stage, e.g. a cache lookup (``cat='cache'``) or a blob read."""
+    name: str
+    cat: str
+    side: int | None
+    start: float
+    wall: float | None = None
+    args: dict = field(default_factory=dict)
+
+
+@dataclass
+class Timings:
+    """Collects per-stage wall time, CPU, and peak RSS, and per-pipeline output sizes, for one comparison.
+
+    Args:
+        label: Name of the comparison (e.g. the path being diffed), included in reports
+    """
+    label: str | None = None
+    start: float = field(default_factory=perf_counter)
+    stages: list[Stage] = field(default_factory=list)
+    pipes: list[Pipe] = field(default_factory=list)
+    spans: list[Span] = field(default_factory=list)
+    lock: Lock = field(default_factory=Lock, repr=False)
+
+    def spawned(self, side: int | None, procs: list[Popen | PyStage], cmd: str | None = None) -> None:
+        """Note the start of ``procs`` (a pipeline, or the comparator), just after spawning them; ``cmd`` overrides
+        their displayed command (e.g. to omit the comparator's FIFO args)."""
+        floor = _own_peak_rss_kb()
+        now = perf_counter() - self.start
+        for proc in procs:
+            args = proc.args if isinstance(proc.args, str) else ' '.join(map(str, proc.args))
+            if isinstance(proc, PyStage):
+                proc.timing = Stage(side=side, cmd=args if cmd is None else cmd, start=now)
+            else:
+                proc.timing = Stage(side=side, cmd=args if cmd is None else cmd, start=now, pid=proc.pid, rss_floor_kb=floor)
+            with self.lock:
+                self.stages.append(proc.timing)
+
+    def wait(self, proc: Popen | PyStage) -> int:
+        """Wait for a process spawned by :meth:`spawned` (reaping it with ``wait4``, to get its resource usage)."""
+        stage = proc.timing
+        usage = None
+        if isinstance(proc, PyStage):
+            proc.wait()
+            stage.user = proc.cpu
+        else:
+            try:
+                _, status, usage = os.wait4(proc.pid, 0)
+            except ChildProcessError:
+                # Already reaped (e.g. by ``Popen.poll``)
+                proc.wait()
+            else:
+                proc.returncode = os.waitstatus_to_exitcode(status)
+        if usage:
+            stage.user = usage.ru_utime
+            stage.sys = usage.ru_stime
+            # macOS reports ``ru_maxrss`` in bytes
+            stage.max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+        stage.wall = perf_counter() - self.start - stage.start
+        stage.returncode = proc.returncode
+        return proc.returncode
+
+    def comparator(self, name: str, fn: Callable[[], int]) -> int:
+        """Run an in-process comparator, recording its wall and (thread) CPU time."""
+        stage = Stage(side=None, cmd=name, start=perf_counter() - self.start)
+        with self.lock:
+            self.stages.append(stage)
+        cpu = resource.getrusage(resource.RUSAGE_THREAD) if hasattr(resource, 'RUSAGE_THREAD') else None
+        try:
+            stage.returncode = fn()
+        finally:
+            stage.wall = perf_counter() - self.start - stage.start
+            if cpu:
+                end = resource.getrusage(resource.RUSAGE_THREAD)
+                stage.user = end.ru_utime - cpu.ru_utime
+                stage.sys = end.ru_stime - cpu.ru_stime
+        return stage.returncode
+
+    @contextmanager
+    def span(self, name: str, cat: str, side: int | None = None, **args) -> Iterator[Span]:
+        """Time the enclosed block as a :class:`Span`; its ``args`` can be added to within the block."""
+        span = Span(name=name, cat=cat, side=side, start=perf_counter() - self.start, args=args)
+        try:
+            yield span
+        finally:
+            span.wall = perf_counter() - self.start - span.start
+            with self.lock:
+                self.spans.append(span)
+
+    def pipe(self, side: int) -> Pipe:
+        pipe = Pipe(side)
+        with self.lock:
+            self.pipes.append(pipe)
+        return pipe
+
+    def to_dict(self) -> dict:
+        return dict(
+            label=self.label,
+            wall=perf_counter() - self.start,
+            stages=[ asdict(stage) for stage in self.stages ],
+            pipes=[ asdict(pipe) for pipe in self.pipes ],
+            spans=[ asdict(span) for span in self.spans ],
+        )
+
+    def table(self) -> list[str]:
+        """Report lines: a row per stage (pipelines' stages, then the comparator), then a row per pipeline output."""
+        def secs(value: float | None) -> str:
+            return '' if value is None else f'{value:.3f}s'
+
+        def rss(stage: Stage) -> str:
+            if stage.max_rss_kb is None:
+                return ''
+            size = fmt_size(stage.max_rss_kb * 1024)
+            if stage.rss_floor_kb and stage.max_rss_kb <= stage.rss_floor_kb:
+                return f'≤{size}'
+            return size
+
+        rows = [ ('Side', 'Command', 'Wall', 'User', 'Sys', 'Max RSS', 'Exit') ]
+        for stage in sorted(self.stages, key=lambda s: (s.side is None, s.side or 0)):
+            rows.append((
+                str(stage.side) if stage.side else 'cmp',
+                stage.cmd,
+                secs(stage.wall),
+                secs(stage.user),
+                secs(stage.sys),
+                rss(stage),
+                '' if stage.returncode is None else str(stage.returncode),
+            ))
+        widths = [ max(len(row[idx]) for row in rows) for idx in range(len(rows[0])) ]
+        lines = [ f'Timings: {self.label}' if self.label else 'Timings:' ]
+        for row in rows:
+            lines.append('  '.join(
+                cell.ljust(width) if idx < 2 else cell.rjust(width)
+                for idx, (cell, width) in enumerate(zip(row, widths))
+            ).rstrip())
+        for pipe in sorted(self.pipes, key=lambda p: p.side):
+            lines.append(f'Pipe {pipe.side} → cmp: {fmt_size(pipe.bytes)}, {pipe.lines} lines')
+        lines.append(f'Total: {perf_counter() - self.start:.3f}s')
+        return lines
+
+    def report(self, fmt: str, log: Callable[[str], None]) -> None:
+        """Log the timings as a table, or a (single-line) JSON object."""
+        if fmt == 'json':
+            log(json.dumps(self.to_dict()))
+        else:
+            for line in self.table():
+                log(line)
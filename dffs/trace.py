@@ -0,0 +1,92 @@
+"""Chrome trace-event (``chrome://tracing``, Perfetto) export of comparisons' :class:`~dffs.timings.Timings`."""
+
+from __future__ import annotations
+
+import json
+import os
+from collections import Counter
+from threading import Lock, current_thread, main_thread
+from time import perf_counter
+
+from dffs.timings import Timings
+
+
+class Trace:
+    """Trace events for the comparisons in one run, on a track per worker thread.
+
+    Each comparison is a span on its worker's track, containing its cache lookups, blob reads, and (in-process or
+    spawned) comparator. Pipeline stages overlap, so each gets its own track (per worker, side, and stage index), with
+    its process's ID, exit code, CPU time, and peak RSS (and, for a pipeline's last stage, the bytes and lines it sent
+    the comparator) as args.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.pid = os.getpid()
+        self.events: list[dict] = []
+        self.tracks: dict[str, int] = {}
+        self.workers: dict[str, str] = {}
+        self.lock = Lock()
+
+    def _worker(self) -> str:
+        """Name of the current thread's track: ``main``, or ``worker <n>`` (numbered in order of first use)."""
+        thread = current_thread()
+        if thread is main_thread():
+            return 'main'
+        return self.workers.setdefault(thread.name, f'worker {len(self.workers) + 1}')
+
+    def _track(self, name: str) -> int:
+        """Thread ID of the track ``name``, emitting its metadata on first use."""
+        tid = self.tracks.get(name)
+        if tid is None:
+            tid = self.tracks[name] = len(self.tracks) + 1
+            self.events.append(dict(name='thread_name', ph='M', pid=self.pid, tid=tid, args=dict(name=name)))
+            self.events.append(dict(name='thread_sort_index', ph='M', pid=self.pid, tid=tid, args=dict(sort_index=tid)))
+        return tid
+
+    def _span(self, name: str, cat: str, track: str, start: float, wall: float | None, args: dict) -> None:
+        self.events.append(dict(
+            name=name,
+            cat=cat,
+            ph='X',
+            ts=round((start - self.start) * 1e6, 1),
+            dur=round((wall or 0) * 1e6, 1),
+            pid=self.pid,
+            tid=self._track(track),
+            args=args,
+        ))
+
+    def add(self, timings: Timings) -> None:
+        """Add a finished comparison's spans, on the current (worker) thread's track."""
+        end = perf_counter()
+        with self.lock:
+            worker = self._worker()
+            self._span(
+                timings.label or 'comparison', 'comparison', worker, timings.start, end - timings.start,
+                { f'side {pipe.side} bytes': pipe.bytes for pipe in timings.pipes },
+            )
+            for span in timings.spans:
+                args = dict(span.args, side=span.side) if span.side else span.args
+                self._span(span.name, span.cat, worker, timings.start + span.start, span.wall, args)
+
+            pipes = { pipe.side: pipe for pipe in timings.pipes }
+            counts = Counter(stage.side for stage in timings.stages)
+            idxs = Counter()
+            for stage in timings.stages:
+                args = dict(pid=stage.pid, exit=stage.returncode, user=stage.user, sys=stage.sys, max_rss_kb=stage.max_rss_kb)
+                args = { k: round(v, 6) if isinstance(v, float) else v for k, v in args.items() if v is not None }
+                if stage.side is None:
+                    self._span(stage.cmd, 'comparator', worker, timings.start + stage.start, stage.wall, args)
+                    continue
+                idxs[stage.side] += 1
+                idx = idxs[stage.side]
+                pipe = pipes.get(stage.side)
+                if pipe and idx == counts[stage.side]:
+                    args.update(bytes=pipe.bytes, lines=pipe.lines)
+                track = f'{worker} · side {stage.side} · stage {idx}'
+                self._span(stage.cmd, 'stage', track, timings.start + stage.start, stage.wall, args)
+
+    def write(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit='ms'), f)
+            f.write('\n')
@@ -0,0 +1,143 @@
+"""Python transform stages: generator functions over byte lines, run in-process alongside shell pipeline stages.
+
+A stage written ``py:<module>:<func> [args...]`` (or ``py:<name>``, for transforms registered with :func:`register`
+or via a ``dffs.transforms`` entry point) calls ``func(lines, *args)``, where ``lines`` iterates the stage's input
+lines (as ``bytes``, including trailing newlines), and which returns (or yields) its output lines. Consecutive Python
+stages are fused, and run together in one thread (see :class:`PyStage`).
+
+Built-in transforms (see :mod:`dffs.normalize`) are written ``@<name>[:<arg>] [args...]``, e.g. ``@csv-cols:a,b``.
+"""
+
+from __future__ import annotations
+
+import shlex
+import signal
+import traceback
+from functools import reduce
+from importlib import import_module
+from operator import attrgetter
+from threading import Thread
+from time import thread_time
+from typing import BinaryIO, Callable, Iterable
+
+# Prefix marking a pipeline stage as a Python transform
+PREFIX = 'py:'
+# Prefix marking a pipeline stage as a built-in transform (with an optional ``:``-separated argument)
+BUILTIN_PREFIX = '@'
+# Entry point group that packages can register named transforms under
+ENTRY_POINT_GROUP = 'dffs.transforms'
+
+# A transform: called with an iterable of input lines (and any stage args), returns an iterable of output lines
+Transform = Callable[..., Iterable[bytes]]
+# A pipeline stage: a shell command (string or args list), a ``py:`` stage, or a Python callable (taking lines)
+Stage = str | list[str] | Callable[[Iterable[bytes]], Iterable[bytes]]
+
+_registry: dict[str, Transform] = {}
+
+
+def register(name: str | None = None) -> Callable[[Transform], Transform]:
+    """Decorator registering a transform, usable as a ``py:<name>`` stage (``name`` defaults to the function's)."""
+    def wrapper(fn: Transform) -> Transform:
+        _registry[name or fn.__name__] = fn
+        return fn
+    return wrapper
+
+
+def is_py_stage(cmd: Stage) -> bool:
+    """Whether ``cmd`` is a Python stage: a callable, or a (string or args list) command starting with ``py:`` or
+    ``@``."""
+    if callable(cmd):
+        return True
+    if not isinstance(cmd, str):
+        if not cmd:
+            return False
+        cmd = cmd[0]
+    return cmd.startswith((PREFIX, BUILTIN_PREFIX))
+
+
+def resolve(name: str) -> Transform:
+    """Look up a transform by ``<module>:<func>`` path, or registered (or entry point) name."""
+    if ':' in name:
+        module, func = name.split(':', 1)
+        return attrgetter(func)(import_module(module))
+    # Register built-ins (on first use, to keep them off the CLI's startup path)
+    import dffs.normalize  # noqa: F401
+    if name in _registry:
+        return _registry[name]
+    from importlib.metadata import entry_points
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP, name=name):
+        return entry_point.load()
+    raise ValueError(f"Unknown Python transform: {name}")
+
+
+def parse_stage(cmd: Stage) -> Callable[[Iterable[bytes]], Iterable[bytes]]:
+    """Convert a Python stage to a function from input lines to output lines."""
+    if callable(cmd):
+        return cmd
+    name, *args = shlex.split(cmd) if isinstance(cmd, str) else cmd
+    if name.startswith(BUILTIN_PREFIX):
+        name, *arg = name[len(BUILTIN_PREFIX):].split(':', 1)
+        fn = resolve(name)
+        args = [ *arg, *args ]
+    else:
+        fn = resolve(name[len(PREFIX):])
+    return lambda lines: fn(lines, *args)
+
+
+def describe(cmd: Stage) -> str:
+    """Display form of a stage."""
+    if isinstance(cmd, str):
+        return cmd
+    if callable(cmd):
+        return getattr(cmd, '__name__', repr(cmd))
+    return shlex.join(cmd)
+
+
+def fuse(cmds: list[Stage]) -> Callable[[Iterable[bytes]], Iterable[bytes]]:
+    """Compose consecutive Python stages into one function, which pulls lines through all of them lazily."""
+    fns = [ parse_stage(cmd) for cmd in cmds ]
+    return lambda lines: reduce(lambda it, fn: fn(it), fns, lines)
+
+
+class PyStage:
+    """A fused run of Python stages, reading ``src`` and writing ``dst`` in a background thread.
+
+    Quacks like a :class:`~subprocess.Popen` for :func:`~dffs.utils.join_pipelines`: it has ``args``, ``wait()``, and a
+    ``returncode`` (0 on success, 1 if a stage raised, or ``-SIGPIPE`` if ``dst``'s reader exited early). A stage's
+    traceback is saved in ``stderr_output``, and the CPU time its thread used in ``cpu``. Lines are pulled from ``src``
+    only as ``dst`` accepts output.
+
+    Args:
+        cmds: Python stages to fuse
+        src: Binary stream to read input lines from; closed when done
+        dst: Path (e.g. a named pipe; opened in the background thread) or binary stream to write to; closed when done
+    """
+
+    def __init__(self, cmds: list[Stage], src: BinaryIO, dst: str | BinaryIO):
+        self.args = ' | '.join(map(describe, cmds))
+        self.fn = fuse(cmds)
+        self.src = src
+        self.dst = dst
+        self.returncode: int | None = None
+        self.stderr_output = b''
+        self.cpu: float | None = None
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        start = thread_time()
+        try:
+            with self.src, (open(self.dst, 'wb') if isinstance(self.dst, str) else self.dst) as out:
+                out.writelines(self.fn(self.src))
+            self.returncode = 0
+        except BrokenPipeError:
+            self.returncode = -signal.SIGPIPE
+        except Exception:
+            self.stderr_output = traceback.format_exc().encode()
+            self.returncode = 1
+        finally:
+            self.cpu = thread_time() - start
+
+    def wait(self) -> int:
+        self.thread.join()
+        return self.returncode
@@ -1,17 +1,63 @@
 from __future__ import annotations
 
-from functools import cache
-from os import environ as env, getcwd
+import os
+import signal
+import sys
+from functools import cache, partial
+from os import fspath, getcwd, PathLike
 from os.path import relpath
+from shutil import copyfileobj
 from subprocess import Popen, PIPE
-from sys import stdout
+from tempfile import SpooledTemporaryFile
+from threading import Lock, Thread
+from typing import BinaryIO, Callable, TYPE_CHECKING
 
-from utz import err, named_pipes, pipeline, process
+from dffs.base import err, line, named_pipes
+from dffs.pipeline import spawn, stderr_output
+from dffs.transforms import Stage, describe, is_py_stage
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from dffs.cache import PipelineCache, ResultCache
+    from dffs.timings import Pipe, Timings
+
+# Bytes of comparator output held in memory (before spilling to disk) while pipeline success is unknown
+DEFAULT_SPOOL_SIZE = 8 * 1024 * 1024
+# Max bytes read from the comparator's stdout at a time
+CHUNK_SIZE = 64 * 1024
+
+# Data fed to a pipeline's first command: bytes or a readable binary file, a callable producing either lazily, or
+# ``None`` (inherit stdin)
+Input = bytes | BinaryIO | Callable[[], bytes | BinaryIO] | None
+# In-process comparator: reads both inputs, writes its output, returns an exit code (e.g. ``dffs.engine.DiffEngine``).
+# Comparators with a true ``stops_early`` attribute (e.g. ``dffs.cmp.Cmp``) may return before reading all of their
+# inputs; their pipelines are then terminated, rather than run to completion.
+Comparator = Callable[[BinaryIO, BinaryIO, BinaryIO], int]
+
+
+class ComparatorError(Exception):
+    """Raised by an in-process comparator that can't finish comparing its inputs (e.g. a ``dffs.csv_diff.CsvDiff``
+    input with a duplicate key): :func:`join_pipelines` stops the pipelines (like for ``stops_early`` comparators),
+    logs the message, and returns ``returncode`` (2, like ``diff``'s, by default) whatever the pipelines' statuses."""
+
+    def __init__(self, msg: str, returncode: int = 2):
+        super().__init__(msg)
+        self.returncode = returncode
+
+
+# Exit codes of pipeline commands killed once an early-stopping comparator is done: by SIGPIPE (writing to a closed
+# input), or by being terminated (directly, or, with 128 added, as reported by a shell)
+STOPPED_RETURNCODES = {
+    code
+    for sig in (signal.SIGPIPE, signal.SIGTERM)
+    for code in (-sig, 128 + sig)
+}
 
 
 @cache
 def get_git_root() -> str:
-    return process.line('git', 'rev-parse', '--show-toplevel', log=False)
+    return line('git', 'rev-parse', '--show-toplevel')
 
 
 @cache
@@ -19,6 +65,15 @@ def get_dir_path() -> str:
     return relpath(getcwd(), get_git_root())
 
 
+def path_pipeline(cmds: list[Stage], path: str) -> tuple[list[Stage], Input]:
+    """Pipeline over the file at ``path``, and its input: the first command is passed ``path`` as an argument, or, if
+    it's a Python stage, reads the file's contents."""
+    first, *rest = cmds
+    if is_py_stage(first):
+        return cmds, partial(open, path, 'rb')
+    return [ f'{first} {path}', *rest ], None
+
+
 def _format_exit_code(returncode: int) -> str:
     """Format an exit code with signal explanation if applicable.
 
@@ -45,28 +100,225 @@ def _format_exit_code(returncode: int) -> str:
     return str(returncode)
 
 
+class OutputGate:
+    """Forward bytes to ``out`` once the pipelines feeding a comparator are known to have succeeded.
+
+    Until :meth:`resolve` is called, written bytes are held in a :class:`SpooledTemporaryFile` (in memory up to
+    ``spool_size`` bytes, then on disk). Resolving successfully flushes the spool to ``out`` and switches to writing
+    through directly; resolving unsuccessfully discards the spool, and all subsequent writes. Every write is also
+    copied to ``copy`` (if given), even after ``out``'s reader has gone away.
+    """
+
+    def __init__(self, out: BinaryIO, spool_size: int = DEFAULT_SPOOL_SIZE, copy: BinaryIO | None = None):
+        self.out = out
+        self.copy = copy
+        self.spool = SpooledTemporaryFile(max_size=spool_size)
+        self.ok: bool | None = None
+        self.broken = False
+        self.lock = Lock()
+
+    def _forward(self, fn) -> None:
+        if self.broken:
+            return
+        try:
+            fn()
+            self.out.flush()
+        except BrokenPipeError:
+            # Reader (e.g. a pager) exited early; drop the remaining output
+            self.broken = True
+
+    def write(self, data: bytes) -> None:
+        with self.lock:
+            if self.copy and self.ok is not False:
+                self.copy.write(data)
+            if self.ok is None:
+                self.spool.write(data)
+            elif self.ok:
+                self._forward(lambda: self.out.write(data))
+
+    def resolve(self, ok: bool) -> None:
+        with self.lock:
+            if self.ok is not None:
+                return
+            self.ok = ok
+            if ok:
+                self.spool.seek(0)
+                self._forward(lambda: copyfileobj(self.spool, self.out))
+            self.spool.close()
+
+
+def aggregate_returncodes(returncodes: list[int]) -> int:
+    """Combine per-comparison exit codes: the first error (not 0 or 1), else 1 if any differed, else 0."""
+    errors = [ code for code in returncodes if code not in (0, 1) ]
+    if errors:
+        return errors[0]
+    return 1 if 1 in returncodes else 0
+
+
+def _tee(fd: int, pipe: str | BinaryIO, copy: BinaryIO | None = None, count: Pipe | None = None) -> None:
+    """Copy a pipeline's output (read from ``fd``) to ``pipe`` (a named pipe, or writable file), as well as to ``copy``
+    (if given), counting the bytes and lines ``pipe`` is sent in ``count`` (if given).
+
+    If ``pipe``'s reader exits early, the rest of the output is still copied to ``copy``.
+    """
+    with open(fd, 'rb') as src:
+        dst = open(pipe, 'wb') if isinstance(pipe, str) else pipe
+        while chunk := src.read1(CHUNK_SIZE):
+            if copy:
+                copy.write(chunk)
+            if dst:
+                if count:
+                    count.count(chunk)
+                try:
+                    dst.write(chunk)
+                except BrokenPipeError:
+                    dst = None
+        if dst:
+            try:
+                dst.close()
+            except BrokenPipeError:
+                pass
+    if copy:
+        copy.close()
+
+
+def _failed_procs(pipeline_groups: list, pipefail: bool, stopped: bool = False) -> list:
+    """Return ``(cmd, proc)`` pairs from finished pipelines that exited non-zero (other than, if ``stopped``, due to
+    an early-stopping comparator; see ``STOPPED_RETURNCODES``)."""
+    if pipefail:
+        # Check all processes (like bash's `set -o pipefail`)
+        to_check = [
+            p
+            for _, procs in pipeline_groups
+            for p in procs
+        ]
+    else:
+        # Only check the last process of each pipeline (standard shell behavior)
+        to_check = [
+            procs[-1]
+            for _, procs in pipeline_groups
+            if procs
+        ]
+    # Processes' (and Python stages') ``args`` are their commands (consecutive Python stages run as one)
+    return [
+        (p.args, p)
+        for p in to_check
+        if p.returncode != 0 and not (stopped and p.returncode in STOPPED_RETURNCODES)
+    ]
+
+
+def _stop(procs: list) -> None:
+    """Terminate pipeline processes that are still running (once an early-stopping comparator is done with their
+    output). Python stages can't be interrupted, but stop at their next write (as their reader has gone)."""
+    for p in procs:
+        if isinstance(p, Popen) and p.poll() is None:
+            try:
+                p.terminate()
+            except ProcessLookupError:
+                pass
+
+
+def _log_failures(failed: list, log: Callable[[str], None]) -> None:
+    """Log each failed pipeline command (from :func:`_failed_procs`), with its exit code and stderr."""
+    for cmd, p in failed:
+        # Format the command for display
+        cmd_str = cmd if isinstance(cmd, str) else ' '.join(cmd)
+        exit_str = _format_exit_code(p.returncode)
+        log(f"Pipeline command failed: `{cmd_str}` (exit {exit_str})")
+
+        # Print stderr from failed process if available
+        stderr = stderr_output(p)
+        if stderr:
+            log(stderr.decode('utf-8', errors='replace').rstrip())
+
+
+def run_pipeline(
+    cmds: list[Stage],
+    out: BinaryIO,
+    verbose: bool = False,
+    executable: str | None = None,
+    both: bool = False,
+    pipefail: bool = False,
+    stdin: Input = None,
+    log: Callable[[str], None] | None = None,
+    timings: Timings | None = None,
+    side: int | None = 1,
+    **kwargs,
+) -> int:
+    """Run ``cmds`` as a pipeline writing to ``out`` (e.g. a file, to compare against several others; see
+    :func:`join_pipelines`), and wait for it to finish.
+
+    Returns:
+        Exit code: 0, or (if the pipeline failed, which is logged) the first failed command's
+    """
+    if log is None:
+        log = err
+    if verbose:
+        log(f"Running pipeline: {' | '.join(map(describe, cmds))}")
+    if callable(stdin):
+        stdin = stdin()
+    procs = spawn(cmds, out, stdin=stdin, executable=executable, both=both, **kwargs)
+    if timings:
+        timings.spawned(side, procs)
+    for p in procs:
+        if timings:
+            timings.wait(p)
+        else:
+            p.wait()
+    failed = _failed_procs([(cmds, procs)], pipefail)
+    _log_failures(failed, log)
+    return failed[0][1].returncode if failed else 0
+
+
 def join_pipelines(
-    base_cmd: list[str],
-    cmds1: list[str],
-    cmds2: list[str],
+    base_cmd: list[str] | Comparator,
+    cmds1: list[Stage] | PathLike,
+    cmds2: list[Stage] | PathLike,
     verbose: bool = False,
     executable: str | None = None,
     both: bool = False,
     pipefail: bool = False,
+    out: BinaryIO | None = None,
+    spool_size: int = DEFAULT_SPOOL_SIZE,
+    cache: PipelineCache | None = None,
+    cache_keys: tuple[str | None, str | None] = (None, None),
+    inputs: tuple[Input, Input] = (None, None),
+    log: Callable[[str], None] | None = None,
+    result_cache: ResultCache | None = None,
+    result_key: str | None = None,
+    timings: Timings | None = None,
     **kwargs,
 ) -> int:
     """Run two sequences of piped commands, pass their outputs as inputs to a ``base_cmd``.
 
     Args:
         base_cmd: Top=level command that takes two positional args (named pipes with the outputs
-            of the ``cmds1`` and ``cmds2`` pipelines).
-        cmds1: First sequence of commands to pipe together
-        cmds2: Second sequence of commands to pipe together
+            of the ``cmds1`` and ``cmds2`` pipelines), or a ``Comparator`` to run in-process instead (reading the
+            pipelines' outputs directly from anonymous pipes, and writing to ``out``)
+        cmds1: First sequence of commands to pipe together, or a path (``PathLike``) to an already-computed output
+        cmds2: Second sequence of commands to pipe together, or a path (``PathLike``) to an already-computed output
         verbose: Whether to print commands being executed
-        executable: Shell to use for executing commands; defaults to $SHELL
+        executable: Shell to run commands that need one with; defaults to ``/bin/sh`` (commands that don't are run
+            directly; see ``dffs.pipeline.direct_args``)
         both: Merge stderr into stdout in pipeline commands (like shell `2>&1`)
         pipefail: If True, check all processes for errors (like bash's `set -o pipefail`).
             If False (default), only check the last process of each pipeline.
+        out: Binary stream to write ``base_cmd``'s output to; defaults to ``sys.stdout.buffer``
+        spool_size: Bytes of ``base_cmd`` output to buffer in memory (before spilling to a temporary file) while
+            the pipelines are still running; output is streamed through directly once they've all succeeded
+        cache: Cache of pipeline outputs; sides with a ``cache_keys`` entry are read from it (without running their
+            pipeline) on a hit, and stored in it (if their pipeline succeeds) on a miss
+        cache_keys: Cache key (see ``PipelineCache.key``) for each of ``cmds1`` and ``cmds2``, or ``None`` to not cache
+        inputs: Data (or a file) to feed to the first command of ``cmds1`` and ``cmds2`` (e.g. Git blob contents), or a
+            callable returning it (only called if that pipeline actually runs, e.g. not on a cache hit), or ``None`` to
+            leave its stdin inherited
+        log: Function to print verbose and error messages with; defaults to printing to stderr
+        result_cache: Cache of comparison results; on a hit for ``result_key``, its output is replayed (and exit code
+            returned) without running anything; on a miss, the result is stored (if every pipeline succeeds, and
+            ``base_cmd`` exits 0 or 1)
+        result_key: Key (see ``ResultCache.key``) for this comparison's result, or ``None`` to not cache it
+        timings: Collects each pipeline stage's (and ``base_cmd``'s) wall time, CPU time, and peak RSS, and the bytes
+            and lines each pipeline sends ``base_cmd`` (see ``dffs.timings``), as well as cache lookups' durations
         **kwargs: Additional arguments passed to subprocess.Popen
 
     Returns:
@@ -74,96 +326,192 @@ def join_pipelines(
 
     Each command sequence will be piped together before being compared.
     For example, if cmds1 = ['cat foo.txt', 'sort'], the function will
-    execute 'cat foo.txt | sort' before comparing with cmds2's output.
+    execute 'cat foo.txt | sort' before comparing with cmds2's output. Commands can also be Python stages (see
+    ``dffs.transforms``, e.g. ``'py:mymodule:func'``), which run in-process and mix freely with shell commands.
+
+    ``base_cmd``'s output is never held in memory in full: it is spooled (see ``spool_size``) only until every
+    pipeline has exited, then flushed and streamed as it arrives. If a pipeline fails, the output is suppressed.
+
+    Comparators with ``stops_early`` set (e.g. ``dffs.cmp.Cmp``) may return before their inputs end; pipeline processes
+    still running then are terminated, and neither that nor the SIGPIPEs it causes count as pipeline failures. The same
+    goes for comparators raising :class:`ComparatorError`, whose exit code is returned (and message logged).
 
     Adapted from https://stackoverflow.com/a/28840955"""
-    if executable is None:
-        executable = env.get('SHELL')
+    if log is None:
+        log = err
+
+    if out is None:
+        sys.stdout.flush()
+        out = sys.stdout.buffer
+
+    def lookup(cache: PipelineCache | ResultCache, key: str, side: int | None = None) -> Path | None:
+        if not timings:
+            return cache.get(key)
+        with timings.span('cache lookup', 'cache', side, cache=cache.name) as span:
+            hit = cache.get(key)
+            span.args['hit'] = hit is not None
+        return hit
+
+    record = None
+    if result_cache and result_key:
+        hit = lookup(result_cache, result_key)
+        if hit:
+            if verbose:
+                log(f"Result cache hit: {hit.name}")
+            return result_cache.replay(hit, out)
+        record_tmp, record = result_cache.recorder()
 
+    in_process = callable(base_cmd)
+    stops_early = getattr(base_cmd, 'stops_early', False)
     with named_pipes(n=2) as pipes:
-        (pipe1, pipe2) = pipes
-        join_cmd = [
-            *base_cmd,
-            pipe1,
-            pipe2,
-        ]
-        # Capture stdout so we can suppress it if a pipeline fails
-        proc = Popen(join_cmd, stdout=PIPE)
+        # Comparator args: named pipes (or, for in-process comparators, anonymous pipes' read ends) fed by pipelines,
+        # or paths to existing outputs (e.g. cache hits)
+        paths = []
+        sides = []  # List of (side number, pipe, cmds, cache key, stdin) tuples for pipelines that need to run
+        for side, (pipe, cmds, key, stdin) in enumerate(zip(pipes, (cmds1, cmds2), cache_keys, inputs), start=1):
+            if isinstance(cmds, PathLike):
+                paths.append(fspath(cmds))
+                continue
+            if cache and key:
+                hit = lookup(cache, key, side)
+                if hit:
+                    if verbose:
+                        log(f"Cache hit: {' | '.join(map(describe, cmds))}")
+                    paths.append(str(hit))
+                    continue
+            if in_process:
+                fd_r, fd_w = os.pipe()
+                paths.append(open(fd_r, 'rb'))
+                pipe = open(fd_w, 'wb')
+            else:
+                paths.append(pipe)
+            if callable(stdin):
+                stdin = stdin()
+            sides.append((side, pipe, cmds, key if cache else None, stdin))
+
+        if in_process:
+            proc = None
+        else:
+            join_cmd = [
+                *base_cmd,
+                *paths,
+            ]
+            # Capture stdout so we can suppress it if a pipeline fails
+            proc = Popen(join_cmd, stdout=PIPE)
+            if timings:
+                timings.spawned(None, [proc], cmd=' '.join(base_cmd))
 
         # Track pipeline processes and their commands
         pipeline_groups = []  # List of (cmds, procs) tuples
-        for pipe, cmds in ((pipe1, cmds1), (pipe2, cmds2)):
+        tees = []  # List of (cache key, temp file, thread, (cmds, procs)) tuples, for outputs being cached
+        counters = []  # Threads relaying (and counting) outputs that aren't being cached
+        for side, pipe, cmds, key, stdin in sides:
             if verbose:
-                err(f"Running pipeline: {' | '.join(cmds)}")
-
-            procs = pipeline(
-                cmds,
-                pipe,
-                wait=False,
-                executable=executable,
-                both=both,
-                **kwargs,
-            )
+                log(f"Running pipeline: {' | '.join(map(describe, cmds))}")
+
+            if key or timings:
+                # Write the pipeline to an anonymous pipe, and tee that to the named pipe and cache (or byte counts)
+                fd_r, fd_w = os.pipe()
+                procs = spawn(
+                    cmds,
+                    open(fd_w, 'wb'),
+                    stdin=stdin,
+                    executable=executable,
+                    both=both,
+                    **kwargs,
+                )
+                tmp = cache.tmp() if key else None
+                count = timings.pipe(side) if timings else None
+                thread = Thread(target=_tee, args=(fd_r, pipe, tmp, count), daemon=True)
+                thread.start()
+                if key:
+                    tees.append((key, tmp, thread, (cmds, procs)))
+                else:
+                    counters.append(thread)
+            else:
+                procs = spawn(
+                    cmds,
+                    pipe,
+                    stdin=stdin,
+                    executable=executable,
+                    both=both,
+                    **kwargs,
+                )
+            if timings:
+                timings.spawned(side, procs)
             pipeline_groups.append((cmds, procs))
 
         all_pipeline_procs = [p for _, procs in pipeline_groups for p in procs]
+        gate = OutputGate(out, spool_size=spool_size, copy=record)
+        error = None  # Raised by an in-process comparator
 
-        # Wait for pipeline processes first
-        for p in all_pipeline_procs:
-            p.wait()
+        def wait_pipelines():
+            if timings:
+                # Reap each process as soon as it exits, so its wall time is accurate
+                waiters = [ Thread(target=timings.wait, args=(p,), daemon=True) for p in all_pipeline_procs ]
+                for waiter in waiters:
+                    waiter.start()
+                for waiter in waiters:
+                    waiter.join()
+            else:
+                for p in all_pipeline_procs:
+                    p.wait()
+            gate.resolve(not _failed_procs(pipeline_groups, pipefail, stopped=stops_early))
 
-        # Determine which (cmd, proc) pairs to check for errors
-        if pipefail:
-            # Check all processes (like bash's `set -o pipefail`)
-            to_check = [
-                (cmd, p)
-                for cmds, procs in pipeline_groups
-                for cmd, p in zip(cmds, procs)
-            ]
+        # Wait for pipelines in the background, while `base_cmd`'s output is drained (so that it never blocks on a
+        # full stdout pipe, and can be streamed as soon as the pipelines are known to have succeeded)
+        waiter = Thread(target=wait_pipelines, daemon=True)
+        waiter.start()
+        if in_process:
+            ins = [ open(path, 'rb') if isinstance(path, str) else path for path in paths ]
+            try:
+                if timings:
+                    name = getattr(base_cmd, '__name__', type(base_cmd).__name__)
+                    returncode = timings.comparator(name, partial(base_cmd, *ins, gate))
+                else:
+                    returncode = base_cmd(*ins, gate)
+            except ComparatorError as e:
+                # Its unread input stops the pipelines (before the inputs' closing makes them exit on SIGPIPE)
+                error = e
+                returncode = e.returncode
+                stops_early = True
+            finally:
+                for f in ins:
+                    f.close()
         else:
-            # Only check the last process of each pipeline (standard shell behavior)
-            to_check = [
-                (cmds[-1], procs[-1])
-                for cmds, procs in pipeline_groups
-                if procs
-            ]
+            while chunk := proc.stdout.read1(CHUNK_SIZE):
+                gate.write(chunk)
+            returncode = timings.wait(proc) if timings else proc.wait()
+        if stops_early:
+            _stop(all_pipeline_procs)
+        waiter.join()
+        for thread in counters:
+            thread.join()
+
+        for key, tmp, thread, group in tees:
+            thread.join()
+            # Killed (e.g. stopped early) stages anywhere in a pipeline mean its output is incomplete
+            if _failed_procs([group], pipefail or stops_early):
+                os.remove(tmp.name)
+            else:
+                cache.put(key, tmp.name)
+
+        failed = _failed_procs(pipeline_groups, pipefail, stopped=stops_early)
+        if record:
+            record.close()
+            record_tmp.close()
+            if not failed and returncode in (0, 1):
+                result_cache.put(result_key, record_tmp.name, returncode)
+            else:
+                os.remove(record_tmp.name)
 
-        pipeline_failed = False
-        first_error_code = None
-        for cmd, p in to_check:
-            if p.returncode != 0:
-                pipeline_failed = True
-                if first_error_code is None:
-                    first_error_code = p.returncode
-
-                # Format the command for display
-                cmd_str = cmd if isinstance(cmd, str) else ' '.join(cmd)
-                exit_str = _format_exit_code(p.returncode)
-                err(f"Pipeline command failed: `{cmd_str}` (exit {exit_str})")
-
-                # Print stderr from failed process if available
-                if p.stderr:
-                    stderr_output = p.stderr.read()
-                    if stderr_output:
-                        if isinstance(stderr_output, bytes):
-                            stderr_output = stderr_output.decode('utf-8', errors='replace')
-                        err(stderr_output.rstrip())
-
-        # Wait for base_cmd and capture its output
-        proc.wait()
-        base_stdout = proc.stdout.read() if proc.stdout else b''
-
-        # If any pipeline failed, suppress base_cmd output and return error code
-        if pipeline_failed:
-            return first_error_code
-
-        # Pipeline succeeded - print base_cmd output and return its exit code
-        if base_stdout:
-            if isinstance(base_stdout, bytes):
-                base_stdout = base_stdout.decode('utf-8', errors='replace')
-            stdout.write(base_stdout)
-            stdout.flush()
-
-        return proc.returncode
+        _log_failures(failed, log)
+        if error:
+            log(str(error))
+            return error.returncode
 
+        # If any pipeline failed, base_cmd output was suppressed; return the first error code
+        if failed:
+            return failed[0][1].returncode
 
+        return returncode
@@ -0,0 +1,93 @@
+"""Tests for the asyncio `join_pipelines` counterpart."""
+import asyncio
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from dffs import aio
+from dffs.engine import DiffEngine
+from dffs.utils import ComparatorError, join_pipelines
+
+DIFF = b'2c2\n< b\n---\n> c\n'
+
+
+def run(base_cmd, cmds1, cmds2, **kwargs) -> tuple[int, bytes]:
+    out = BytesIO()
+    returncode = asyncio.run(aio.join_pipelines(base_cmd, cmds1, cmds2, out=out, **kwargs))
+    return returncode, out.getvalue()
+
+
+def test_diff():
+    assert run(['diff'], ['sort'], ['sort'], inputs=(b'b\na\n', b'c\na\n')) == (1, DIFF)
+    assert run(['diff'], ['sort'], ['cat'], inputs=(b'b\na\n', b'a\nb\n')) == (0, b'')
+
+
+def test_no_shell_and_paths(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_bytes(b'a\nc\n')
+    assert run(['diff'], ['sort', 'head -n 2'], Path(path), inputs=(b'b\na\n', None), shell=False) == (1, DIFF)
+
+
+def test_in_process_comparator():
+    assert run(DiffEngine(), ['sort'], ['sort'], inputs=(b'b\na\n', b'c\na\n')) == (1, DIFF)
+
+
+@pytest.mark.parametrize('pipefail', [False, True])
+def test_failures_match_sync(pipefail):
+    """Exit codes, suppressed output, and failure logs match `dffs.utils.join_pipelines`'."""
+    kwargs = dict(inputs=(b'a\n', b'b\n'), pipefail=pipefail)
+    cmds1 = ['sh -c "cat; echo oops >&2; exit 3"', 'cat']
+    sync_out, sync_logs = BytesIO(), []
+    sync = join_pipelines(['diff'], cmds1, ['cat'], out=sync_out, log=sync_logs.append, **kwargs)
+    logs = []
+    returncode, output = run(['diff'], cmds1, ['cat'], log=logs.append, **kwargs)
+    assert (returncode, output, logs) == (sync, sync_out.getvalue(), sync_logs)
+    if pipefail:
+        assert returncode == 3
+        assert logs == ['Pipeline command failed: `sh -c "cat; echo oops >&2; exit 3"` (exit 3)', 'oops']
+    else:
+        assert returncode == 1
+
+
+def test_stops_early():
+    from dffs.cmp import Cmp
+    assert run(Cmp(), ['echo a; exec yes'], ['echo b; exec yes']) == (1, b'a b differ: byte 1, line 1\n')
+
+
+def test_comparator_error_matches_sync():
+    """A `ComparatorError` stops the pipelines (whose SIGPIPEs aren't failures), is logged, and sets the exit code."""
+    def fail(in1, in2, out):
+        out.write(b'partial\n')
+        raise ComparatorError('bad input')
+
+    data = b'x' * (1 << 20)
+    sync_out, sync_logs = BytesIO(), []
+    sync = join_pipelines(fail, ['cat'], ['cat'], inputs=(data, data), out=sync_out, log=sync_logs.append)
+    logs = []
+    assert run(fail, ['cat'], ['cat'], inputs=(data, data), log=logs.append) == (sync, sync_out.getvalue())
+    assert sync == 2
+    assert sync_out.getvalue() == b'partial\n'
+    assert logs == sync_logs == ['bad input']
+
+
+def test_python_stages_unsupported():
+    with pytest.raises(ValueError, match="Python stages"):
+        run(['diff'], ['@sort'], ['cat'], inputs=(b'', b''))
+
+
+def test_gather():
+    running, peak = 0, 0
+
+    async def comparison(idx: int) -> int:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await aio.join_pipelines(['diff'], ['cat'], ['cat'], inputs=(b'a\n', b'a\n' if idx % 2 else b'b\n'), out=BytesIO())
+        finally:
+            running -= 1
+
+    returncodes = asyncio.run(aio.gather((comparison(idx) for idx in range(40)), jobs=8))
+    assert returncodes == [ 1 - idx % 2 for idx in range(40) ]
+    assert peak == 8
@@ -0,0 +1,80 @@
+"""Tests for the benchmark suite."""
+import json
+
+from click.testing import CliRunner
+
+from dffs.bench import MUTATE_EVERY, Scenario, compare, generate, run, scenarios
+from dffs.main import cli
+
+
+class TestGenerate:
+    def test_generate(self, tmp_path):
+        """Test generated pairs are deterministic, about the requested size, and differ in every ``MUTATE_EVERY``th line."""
+        path1, path2 = generate(str(tmp_path / 'a'), 10_000, 'short')
+        lines1 = open(path1, 'rb').read().splitlines()
+        lines2 = open(path2, 'rb').read().splitlines()
+        assert all(len(line) == 16 for line in lines1)
+        assert 10_000 <= 17 * len(lines1) < 10_000 + 17
+        diffs = [ idx for idx, (l1, l2) in enumerate(zip(lines1, lines2)) if l1 != l2 ]
+        assert diffs == list(range(MUTATE_EVERY - 1, len(lines1), MUTATE_EVERY))
+        other1, _ = generate(str(tmp_path / 'b'), 10_000, 'short')
+        assert open(other1, 'rb').read() == open(path1, 'rb').read()
+
+
+class TestScenarios:
+    def test_matrix(self):
+        """Test git-diff-x scenarios vary path counts, and others vary line lengths, stages, and shell use."""
+        names = [ s.name for s in scenarios(sizes=['1K'], stages=[1], paths=[1, 4]) ]
+        assert 'diff-x/1K/long/stages=1/no-shell' in names
+        assert 'git-diff-x/1K/lognormal/stages=1/shell/paths=4' in names
+        assert len(names) == 3 * 3 * 2 + 2
+        assert Scenario('comm-x', '1K', 'short', 2).cmds == ['cat', 'sort']
+
+    def test_run(self, tmp_path):
+        """Test a scenario's metrics, including the processes it spawned (two pipelines and `diff`)."""
+        results = run([Scenario('diff-x', '1K', 'short', 2)], str(tmp_path), repeat=1)
+        result = results['results']['diff-x/1K/short/stages=2/shell']
+        assert result['procs'] == 5
+        assert result['wall_s'] > 0
+        assert result['max_rss_kb'] > 0
+        assert 'python' in results['meta']
+
+
+class TestCompare:
+    baseline = dict(results={
+        'a': dict(wall_s=1.0, max_rss_kb=1000, procs=3),
+        'b': dict(wall_s=0.001, max_rss_kb=1000, procs=3),
+    })
+
+    def test_compare(self):
+        """Test regressions beyond the threshold are flagged, ignoring tiny wall-time changes and unknown scenarios."""
+        current = dict(results={
+            'a': dict(wall_s=1.2, max_rss_kb=1050, procs=4),
+            'b': dict(wall_s=0.002, max_rss_kb=1000, procs=3),
+            'c': dict(wall_s=9, max_rss_kb=9, procs=9),
+        })
+        assert compare(self.baseline, current) == [('a', 'wall_s', 1.0, 1.2), ('a', 'procs', 3, 4)]
+        assert compare(self.baseline, current, threshold=0.5) == []
+
+    def test_compare_command(self, tmp_path):
+        """Test `dffs bench compare` exits 1 on regressions."""
+        base = tmp_path / 'base.json'
+        cur = tmp_path / 'cur.json'
+        base.write_text(json.dumps(self.baseline))
+        cur.write_text(json.dumps(dict(results={'a': dict(wall_s=2.0, max_rss_kb=1000, procs=3)})))
+        runner = CliRunner()
+        result = runner.invoke(cli, ['bench', 'compare', str(base), str(cur)])
+        assert result.exit_code == 1
+        assert 'REGRESSION a wall_s: 1.0 -> 2.0 (+100.0%)' in result.output
+        result = runner.invoke(cli, ['bench', 'compare', str(base), str(base)])
+        assert result.exit_code == 0
+
+
+class TestSpawn:
+    def test_spawn_command(self):
+        """Test `dffs bench spawn` reports per-stage times, directly and via each shell."""
+        result = CliRunner().invoke(cli, ['bench', 'spawn', '-s', '/bin/sh', '-n', '2', '-r', '2'])
+        assert result.exit_code == 0
+        lines = result.output.splitlines()
+        assert [ line.split(':')[0] for line in lines ] == ['direct', '/bin/sh']
+        assert lines[1].endswith('ms)')
@@ -0,0 +1,184 @@
+"""Tests for the `git cat-file`-backed blob reader."""
+import subprocess
+import time
+import tracemalloc
+import pytest
+from dffs import blobs
+from dffs.blobs import CHUNK_SIZE, Blob, BlobReader, Change, blob_reader, changed_files
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    """Repo with `data/foo.txt` at two commits, a staged change, and an empty `sub/` dir."""
+    def git(*args, input: bytes | None = None):
+        proc = subprocess.run(['git', *args], cwd=tmp_path, check=True, capture_output=True, input=input)
+        return proc.stdout.decode().strip()
+
+    git('init')
+    git('config', 'user.email', 'test@example.com')
+    git('config', 'user.name', 'Test User')
+    (tmp_path / 'data').mkdir()
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'data' / 'foo.txt').write_text('a\n')
+    git('add', '.')
+    git('commit', '-m', 'c1')
+    (tmp_path / 'data' / 'foo.txt').write_text('a\nb\n')
+    git('commit', '-am', 'c2')
+    (tmp_path / 'data' / 'foo.txt').write_text('staged\n')
+    git('add', '.')
+    monkeypatch.chdir(tmp_path)
+    return git
+
+
+class TestBlobReader:
+    """Test ref resolution, blob lookup, and reads."""
+
+    def test_resolve(self, git_repo):
+        """Test refs resolve to commit SHAs, and invalid refs to ``None``."""
+        with BlobReader() as reader:
+            assert reader.resolve('HEAD') == git_repo('rev-parse', 'HEAD')
+            assert reader.resolve('HEAD^') == git_repo('rev-parse', 'HEAD^')
+            assert reader.resolve('nonexistent') is None
+
+    def test_info_and_read(self, git_repo):
+        """Test looking up and reading blobs at commits and in the index."""
+        with BlobReader() as reader:
+            blob = reader.info('HEAD^', 'data/foo.txt')
+            assert blob == Blob(sha=git_repo('rev-parse', 'HEAD^:data/foo.txt'), size=2)
+            assert reader.read(blob) == b'a\n'
+            assert reader.read(reader.info('HEAD', 'data/foo.txt')) == b'a\nb\n'
+            assert reader.read(reader.info(None, 'data/foo.txt')) == b'staged\n'
+
+    def test_missing_path(self, git_repo):
+        """Test that paths missing from a commit return ``None``."""
+        with BlobReader() as reader:
+            assert reader.info('HEAD', 'nonexistent.txt') is None
+            assert reader.info('HEAD', 'data') is None  # A tree, not a blob
+
+    def test_invalid_ref(self, git_repo):
+        """Test that looking up a path in an invalid ref raises."""
+        with BlobReader() as reader:
+            with pytest.raises(ValueError, match='Invalid ref'):
+                reader.info('nonexistent', 'data/foo.txt')
+
+    def test_paths_relative_to_cwd(self, git_repo, monkeypatch, tmp_path):
+        """Test paths are resolved relative to the current directory."""
+        monkeypatch.chdir(tmp_path / 'sub')
+        with BlobReader() as reader:
+            assert reader.read(reader.info('HEAD', '../data/foo.txt')) == b'a\nb\n'
+
+    def test_processes_reused(self, git_repo):
+        """Test that one `git cat-file` process serves all (sequential) lookups."""
+        with BlobReader() as reader:
+            reader.read(reader.info('HEAD', 'data/foo.txt'))
+            pids = ([ proc.pid for proc in reader.batches ], reader.batch_check.pid)
+            with reader.stream(reader.info('HEAD^', 'data/foo.txt')) as f:
+                assert f.read() == b'a\n'
+            reader.read(reader.info('HEAD^', 'data/foo.txt'))
+            assert ([ proc.pid for proc in reader.batches ], reader.batch_check.pid) == pids
+
+    def test_kept_reader(self, git_repo, monkeypatch, tmp_path):
+        """Test that, after `keep_readers`, later invocations reuse a reader's processes, but re-resolve refs."""
+        monkeypatch.setattr(blobs, '_keeping', False)
+        monkeypatch.setattr(blobs, '_kept', None)
+        with blob_reader() as reader:
+            assert not reader.keep
+        blobs.keep_readers()
+        with blob_reader() as reader:
+            assert reader.read(reader.info('HEAD', 'data/foo.txt')) == b'a\nb\n'
+            pids = ([ proc.pid for proc in reader.batches ], reader.batch_check.pid)
+        git_repo('commit', '-m', 'c3')
+        with blob_reader() as kept:
+            assert kept is reader
+            assert kept.read(kept.info('HEAD', 'data/foo.txt')) == b'staged\n'
+            assert ([ proc.pid for proc in kept.batches ], kept.batch_check.pid) == pids
+        # A different directory gets a new reader (its processes resolve paths relative to it)
+        monkeypatch.chdir(tmp_path / 'sub')
+        with blob_reader() as other:
+            assert other is not reader
+            assert other.read(other.info('HEAD', '../data/foo.txt')) == b'staged\n'
+        assert reader.batch_check is None
+        other.shutdown()
+
+    def test_concurrent_streams(self, git_repo):
+        """Test streams of different blobs can be consumed concurrently (each from its own `--batch` process)."""
+        big = b''.join(b'line %d\n' % i for i in range(100_000))
+        sha = git_repo('hash-object', '-w', '--stdin', input=big)
+        with BlobReader() as reader:
+            copied = []
+            f1, f2 = reader.stream(sha, done=copied.append), reader.stream(sha, done=copied.append)
+            with f1, f2:
+                data1, data2 = bytearray(), bytearray()
+                while chunk := f2.read1(65536):
+                    data2 += chunk
+                    data1 += f1.read1(65536)
+                data1 += f1.read()
+            assert data1 == data2 == big
+            assert len(reader.batches) == 2
+            with pytest.raises(ValueError, match='Missing object'):
+                reader.stream('0' * 40)
+
+    def test_stream_bounded(self, git_repo):
+        """Test streaming a blob doesn't hold it in memory (only a chunk at a time)."""
+        big = b'x' * 999 + b'\n'
+        sha = git_repo('hash-object', '-w', '--stdin', input=big * 16_000)
+        with BlobReader() as reader:
+            tracemalloc.start()
+            try:
+                total = 0
+                with reader.stream(sha) as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        total += len(chunk)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            assert total == len(big) * 16_000
+            # A few chunks (being copied, buffered, and read), rather than the 16MB blob
+            assert peak < 16 * CHUNK_SIZE
+
+    def test_stream_closed_early(self, git_repo):
+        """Test a stream abandoned partway stops its copy, and its process isn't reused (mid-blob)."""
+        sha = git_repo('hash-object', '-w', '--stdin', input=b'x\n' * 1_000_000)
+        with BlobReader() as reader:
+            copied = []
+            with reader.stream(sha, done=copied.append) as f:
+                f.read(10)
+            while not copied:
+                time.sleep(0.01)
+            assert copied[0] < 2_000_000
+            assert reader.batches == []
+            assert reader.read(reader.info('HEAD', 'data/foo.txt')) == b'a\nb\n'
+
+
+class TestChangedFiles:
+    """Test listing changed files with ``changed_files``."""
+
+    def test_commits(self, git_repo):
+        """Test changes between two commits include both blob SHAs."""
+        changes = changed_files('HEAD^', 'HEAD')
+        assert changes == [
+            Change(
+                path='data/foo.txt',
+                status='M',
+                old=Blob(git_repo('rev-parse', 'HEAD^:data/foo.txt')),
+                new=Blob(git_repo('rev-parse', 'HEAD:data/foo.txt')),
+            )
+        ]
+
+    def test_index_and_worktree(self, git_repo, tmp_path):
+        """Test changes vs. the index (staged) and worktree, including additions and deletions."""
+        staged = changed_files('HEAD', staged=True)
+        assert [ (c.path, c.new) for c in staged ] == [ ('data/foo.txt', Blob(git_repo('rev-parse', ':0:data/foo.txt'))) ]
+
+        (tmp_path / 'data' / 'foo.txt').unlink()
+        (tmp_path / 'new.txt').write_text('new\n')
+        git_repo('add', '-N', 'new.txt')
+        worktree = changed_files('HEAD')
+        assert [ (c.path, c.status, c.new, c.worktree) for c in worktree ] == [
+            ('data/foo.txt', 'D', None, False),
+            ('new.txt', 'A', None, True),
+        ]
+
+    def test_pathspecs(self, git_repo):
+        """Test filtering changes by pathspec."""
+        assert changed_files('HEAD^', 'HEAD', pathspecs=['*.json']) == []
@@ -0,0 +1,235 @@
+"""Tests for the pipeline-output cache."""
+import json
+import os
+import time
+import pytest
+from io import BytesIO
+from click.testing import CliRunner
+from dffs.cache import PipelineCache, ResultCache, blob_identity, file_identity, flush_stats
+from dffs.diff_x import main as diff_x
+from dffs.engine import DiffEngine
+from dffs.main import cli
+from dffs.utils import join_pipelines
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A ``PipelineCache`` rooted in a temporary directory."""
+    monkeypatch.setenv('DFFS_CACHE_DIR', str(tmp_path / 'cache'))
+    return PipelineCache()
+
+
+def put(cache, key, data):
+    with cache.tmp() as f:
+        f.write(data)
+    return cache.put(key, f.name)
+
+
+class TestCacheKeys:
+    """Test cache-key construction."""
+
+    def test_key_depends_on_pipeline_and_shell(self):
+        """Test that keys differ by input, commands, and shell."""
+        key = PipelineCache.key(blob_identity('abc'), ['sort'], executable='/bin/sh')
+        assert key == PipelineCache.key(blob_identity('abc'), ['sort'], executable='/bin/sh')
+        assert key != PipelineCache.key(blob_identity('abd'), ['sort'], executable='/bin/sh')
+        assert key != PipelineCache.key(blob_identity('abc'), ['sort -r'], executable='/bin/sh')
+        assert key != PipelineCache.key(blob_identity('abc'), ['sort'], executable='/bin/bash')
+
+    def test_file_identity_tracks_mtime(self, tmp_path):
+        """Test that stat-based file identities change when a file is rewritten."""
+        path = tmp_path / 'f.txt'
+        path.write_text('a\n')
+        id1 = file_identity(str(path))
+        os.utime(path, ns=(0, time.time_ns() + 10**9))
+        assert file_identity(str(path)) != id1
+
+    def test_file_identity_content_hash(self, tmp_path):
+        """Test that content-hash identities match for identical contents at different paths."""
+        (tmp_path / 'a').write_text('same\n')
+        (tmp_path / 'b').write_text('same\n')
+        assert file_identity(str(tmp_path / 'a'), content_hash=True) == file_identity(str(tmp_path / 'b'), content_hash=True)
+        assert file_identity(str(tmp_path / 'a')) != file_identity(str(tmp_path / 'b'))
+
+    def test_file_key_missing_file(self):
+        """Test that nonexistent files aren't cached."""
+        assert PipelineCache.file_key('/nonexistent/file', ['cat']) is None
+
+
+class TestCacheStore:
+    """Test cache lookups, stats, and eviction."""
+
+    def test_get_put(self, cache):
+        """Test a miss, then a hit after ``put``."""
+        assert cache.get('ab12') is None
+        put(cache, 'ab12', b'output\n')
+        assert cache.get('ab12').read_bytes() == b'output\n'
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['entries'], stats['size']) == (1, 1, 1, 7)
+
+    def test_prune_evicts_least_recently_used(self, cache):
+        """Test that pruning removes the entries with the oldest use times first."""
+        for i, key in enumerate(['aa', 'bb', 'cc']):
+            path = put(cache, key, b'x' * 10)
+            os.utime(path, (i, i))
+        cache.get('aa')  # Bump `aa` to most-recently-used
+        assert cache.prune(max_size=20) == (1, 10)
+        assert cache.get('bb') is None
+        assert cache.get('aa') and cache.get('cc')
+
+    def test_put_enforces_budget(self, cache):
+        """Test that ``put`` evicts down to ``max_size``."""
+        cache.max_size = 15
+        put(cache, 'aa', b'x' * 10)
+        put(cache, 'bb', b'x' * 10)
+        assert cache.stats()['entries'] == 1
+
+    def test_put_within_budget_skips_scan(self, cache, monkeypatch):
+        """Test that only the first ``put`` scans entries, while the tracked total size is within budget."""
+        scans = []
+        entries = cache.entries
+        monkeypatch.setattr(cache, 'entries', lambda: scans.append(1) or entries())
+        for key in ['aa', 'bb', 'cc']:
+            put(cache, key, b'x' * 10)
+        put(cache, 'aa', b'x' * 5)
+        assert (len(scans), cache.size) == (1, 25)
+        cache.max_size = 25
+        put(cache, 'dd', b'x' * 10)
+        assert len(scans) == 2 and cache.size <= 25
+
+    def test_stats_flushed_in_batches(self, cache):
+        """Test that lookups count hits/misses in memory, until :func:`flush_stats` writes them."""
+        cache.get('aa')
+        cache.get('bb')
+        assert not os.path.exists(cache.stats_path)
+        flush_stats()
+        with open(cache.stats_path) as f:
+            assert json.load(f) == {'hits': 0, 'misses': 2}
+        flush_stats()
+        assert cache.stats()['misses'] == 2
+
+
+class TestJoinPipelinesCache:
+    """Test ``join_pipelines`` reading from and writing to a cache."""
+
+    def test_second_run_hits_cache(self, cache, tmp_path):
+        """Test that a cached side's pipeline isn't re-run."""
+        log = tmp_path / 'log'
+        cmds = [f'echo run >> {log}; echo foo']
+        keys = (PipelineCache.key('in1', cmds), None)
+        for _ in range(2):
+            out = BytesIO()
+            returncode = join_pipelines(['diff'], cmds, ['echo bar'], shell=True, out=out, cache=cache, cache_keys=keys)
+            assert returncode == 1
+            assert out.getvalue() == b'1c1\n< foo\n---\n> bar\n'
+        assert log.read_text() == 'run\n'
+
+    def test_failed_pipeline_not_cached(self, cache):
+        """Test that outputs of failed pipelines aren't stored."""
+        key = PipelineCache.key('in1', ['echo foo; false'])
+        returncode = join_pipelines(['diff'], ['echo foo; false'], ['echo foo'], shell=True, out=BytesIO(), cache=cache, cache_keys=(key, None))
+        assert returncode == 1
+        assert cache.get(key) is None
+
+
+class TestCacheCommand:
+    """Test the `dffs cache` command."""
+
+    def test_info_and_clear(self, cache):
+        """Test `dffs cache` shows stats, and `dffs cache clear` empties the cache."""
+        put(cache, 'aa', b'x' * 10)
+        runner = CliRunner()
+        result = runner.invoke(cli, ['cache'])
+        assert result.exit_code == 0
+        assert 'Entries: 1' in result.output
+        result = runner.invoke(cli, ['cache', 'clear'])
+        assert result.exit_code == 0
+        assert cache.stats()['entries'] == 0
+
+    def test_prune(self, cache):
+        """Test `dffs cache prune -s`."""
+        put(cache, 'aa', b'x' * 10)
+        result = CliRunner().invoke(cli, ['cache', 'prune', '-s', '0'])
+        assert result.exit_code == 0
+        assert 'Removed 1 entries (10B)' in result.output
+
+
+class TestResultCache:
+    """Test caching comparison results."""
+
+    @pytest.fixture
+    def results(self, tmp_path, monkeypatch):
+        monkeypatch.setenv('DFFS_CACHE_DIR', str(tmp_path / 'cache'))
+        return ResultCache()
+
+    def test_key_depends_on_sides_and_comparator(self):
+        """Test keys differ by either side, and by comparator args (or in-process comparator settings)."""
+        keys = {
+            ResultCache.key(('a', 'b'), ['diff']),
+            ResultCache.key(('b', 'a'), ['diff']),
+            ResultCache.key(('a', 'b'), ['diff', '-U', '3']),
+            ResultCache.key(('a', 'b'), DiffEngine()),
+            ResultCache.key(('a', 'b'), DiffEngine(color=True)),
+        }
+        assert len(keys) == 5
+        assert ResultCache.key(('a', 'b'), DiffEngine()) == ResultCache.key(('a', 'b'), DiffEngine())
+
+    def test_hit_replays_without_running(self, results, tmp_path):
+        """Test a second comparison replays the stored output and exit code, without running pipelines."""
+        log = tmp_path / 'log'
+        key = ResultCache.key(('in1', 'in2'), ['diff'])
+        for _ in range(2):
+            out = BytesIO()
+            returncode = join_pipelines(['diff'], [f'echo run >> {log}; echo foo'], ['echo bar'], shell=True, out=out, result_cache=results, result_key=key)
+            assert returncode == 1
+            assert out.getvalue() == b'1c1\n< foo\n---\n> bar\n'
+        assert log.read_text() == 'run\n'
+        assert results.stats()['hits'] == 1
+
+    def test_failure_not_cached(self, results):
+        key = ResultCache.key(('in1', 'in2'), ['diff'])
+        join_pipelines(['diff'], ['echo foo; false'], ['echo foo'], shell=True, out=BytesIO(), result_cache=results, result_key=key, pipefail=True)
+        assert results.get(key) is None
+        assert results.stats()['entries'] == 0
+
+    def test_ttl(self, results, monkeypatch):
+        """Test entries unused for longer than `$DFFS_CACHE_TTL` expire."""
+        key = ResultCache.key(('in1', 'in2'), ['diff'])
+        join_pipelines(['diff'], ['echo foo'], ['echo foo'], shell=True, out=BytesIO(), result_cache=results, result_key=key)
+        path = results.get(key)
+        assert path
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+        monkeypatch.setenv('DFFS_CACHE_TTL', '1h')
+        results = ResultCache()
+        assert results.get(key) is None
+        size = path.stat().st_size
+        assert results.prune() == (1, size)
+
+    def test_diff_x(self, results, tmp_path):
+        """Test `diff-x --result-cache` replays results, and misses when an input or comparator arg changes."""
+        file1, file2 = tmp_path / 'a', tmp_path / 'b'
+        file1.write_text('foo\n')
+        file2.write_text('bar\n')
+        runner = CliRunner()
+        for args in (['cat'], ['cat'], ['-w', 'cat']):
+            result = runner.invoke(diff_x, ['--result-cache', '-e', 'myers', *args, str(file1), str(file2)])
+            assert result.exit_code == 1
+            assert result.output == '1c1\n< foo\n---\n> bar\n'
+        assert results.stats()['entries'] == 2
+        assert results.stats()['hits'] == 1
+
+    def test_diff_x_across_checkouts(self, results, tmp_path, monkeypatch):
+        """Test `diff-x --result-cache` hits for the same files in another checkout (different inodes and mtimes)."""
+        runner = CliRunner()
+        for name in ('co1', 'co2'):
+            checkout = tmp_path / name
+            checkout.mkdir()
+            (checkout / 'a').write_text('foo\n')
+            (checkout / 'b').write_text('bar\n')
+            monkeypatch.chdir(checkout)
+            result = runner.invoke(diff_x, ['--result-cache', '-e', 'myers', 'cat', 'a', 'b'])
+            assert result.exit_code == 1
+            assert result.output == '1c1\n< foo\n---\n> bar\n'
+        assert results.stats()['entries'] == 1
+        assert results.stats()['hits'] == 1
@@ -0,0 +1,86 @@
+"""Tests for the chunk-matching (change-localizing) line diff."""
+import random
+from io import BytesIO
+
+import pytest
+
+from dffs.chunked import ChunkedDiff, chunks
+from dffs.engine import DiffEngine, Lines
+
+LINES = [ b'line %d\n' % i for i in range(5000) ]
+
+
+def run(comparator, a: list[bytes], b: list[bytes]) -> tuple[int, bytes]:
+    out = BytesIO()
+    returncode = comparator(BytesIO(b''.join(a)), BytesIO(b''.join(b)), out)
+    return returncode, out.getvalue()
+
+
+def edited(lines: list[bytes], seed: int, edits: int) -> list[bytes]:
+    """``lines`` with ``edits`` random insertions, deletions, and replacements."""
+    rnd = random.Random(seed)
+    lines = list(lines)
+    for idx in range(edits):
+        k = rnd.randrange(len(lines) + 1)
+        op = idx % 3
+        if op == 0:
+            lines[k:k] = [ b'new %d\n' % rnd.randrange(10) for _ in range(rnd.randrange(1, 10)) ]
+        elif op == 1:
+            del lines[k:k + rnd.randrange(1, 10)]
+        else:
+            lines[k:k + 2] = [ b'line %d\n' % rnd.randrange(5000) ]
+    return lines
+
+
+def test_chunks_realign():
+    """Test cut points after an edit are the same as without it."""
+    def cuts(lines):
+        ends, pos = set(), 0
+        for _, chunk_lines in chunks(lines, avg_size=256):
+            pos += len(chunk_lines)
+            ends.add(b''.join(lines[pos - 3:pos]))
+        return ends
+
+    before = cuts(LINES)
+    after = cuts(LINES[:100] + [b'inserted\n'] + LINES[100:])
+    assert len(before) > 50
+    assert len(before - after) <= 2
+
+
+@pytest.mark.parametrize('seed', range(6))
+@pytest.mark.parametrize('engine', [
+    DiffEngine(),
+    DiffEngine(context=3),
+    DiffEngine(algorithm='histogram', context=0),
+    DiffEngine(ignore_whitespace=True),
+], ids=['normal', 'unified', 'histogram', 'ignore-whitespace'])
+def test_matches_whole_diff(engine, seed):
+    a = LINES if seed % 2 else [ b' ' + line for line in LINES[:1000] ]
+    b = edited(a, seed, edits=seed * 4)
+    assert run(ChunkedDiff(engine, avg_size=256), a, b) == run(engine, a, b)
+
+
+def test_no_trailing_newline():
+    a, b = LINES, LINES[:-1] + [b'line 4999']
+    assert run(ChunkedDiff(avg_size=256), a, b) == (1, b'5000c5000\n< line 4999\n---\n> line 4999\n\\ No newline at end of file\n')
+
+
+def test_only_changes_retained(monkeypatch):
+    """Test only changed regions (and a bounded amount of context) are diffed, and held in memory."""
+    a = LINES * 10
+    b = a[:20_000] + [b'x\n'] + a[20_000:]
+    engine = DiffEngine(context=3)
+    expected = run(engine, a, b)
+    diffed = []
+    read = Lines.read
+
+    def counting_read(self, stream):
+        stream = list(stream)
+        diffed.append(len(stream))
+        return read(self, stream)
+
+    monkeypatch.setattr(Lines, 'read', counting_read)
+    assert run(ChunkedDiff(engine, avg_size=256), a, b) == expected
+    assert expected[1].startswith(b'--- a\n+++ b\n@@ -19998,6 +19998,7 @@\n')
+    # One changed region's lines (a chunk or two, plus slack) were diffed, rather than all 50k
+    assert sum(diffed) < 500
@@ -0,0 +1,45 @@
+"""Tests for the in-process, early-stopping byte comparator."""
+import subprocess
+from io import BytesIO
+
+import pytest
+
+from dffs.cmp import Cmp, READ_SIZE
+
+
+def run(a: bytes, b: bytes) -> tuple[int, bytes]:
+    out = BytesIO()
+    returncode = Cmp(labels=('a', 'b'))(BytesIO(a), BytesIO(b), out)
+    return returncode, out.getvalue()
+
+
+def gnu_cmp(tmp_path, a: bytes, b: bytes) -> tuple[int, bytes]:
+    """``cmp``'s exit code and message (from stdout, or stderr for EOFs, minus its ``cmp: `` prefix)."""
+    (tmp_path / 'a').write_bytes(a)
+    (tmp_path / 'b').write_bytes(b)
+    proc = subprocess.run(['cmp', 'a', 'b'], cwd=tmp_path, capture_output=True)
+    return proc.returncode, (proc.stdout or proc.stderr.removeprefix(b'cmp: ')).replace(b'char', b'byte')
+
+
+BIG = b''.join(b'line %d\n' % i for i in range(100_000))
+
+
+@pytest.mark.parametrize('a, b', [
+    (b'a\nb\n', b'a\nb\n'),
+    (b'a\nb\n', b'a\nc\n'),
+    (b'a\nb\n', b'a\nb\nc\n'),
+    (b'a\nb\nc', b'a\nb'),
+    (b'', b'a\n'),
+    (BIG, BIG),
+    (BIG, BIG.replace(b'line 77777\n', b'line 77778\n')),
+    (BIG, BIG[:READ_SIZE * 3 + 5]),
+], ids=['same', 'differ', 'prefix', 'prefix-mid-line', 'empty', 'big-same', 'big-differ', 'big-prefix'])
+def test_matches_cmp(tmp_path, a, b):
+    assert run(a, b) == gnu_cmp(tmp_path, a, b)
+
+
+def test_stops_at_first_difference():
+    """Test the rest of both inputs is left unread."""
+    in1, in2 = BytesIO(b'x' + BIG), BytesIO(b'y' + BIG)
+    assert Cmp(labels=('a', 'b'))(in1, in2, BytesIO()) == 1
+    assert in1.tell() <= READ_SIZE and in2.tell() <= READ_SIZE
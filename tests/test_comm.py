@@ -0,0 +1,130 @@
+"""Tests for the in-process, hash-based comm."""
+from hashlib import blake2b
+from io import BytesIO
+
+import pytest
+
+from dffs.comm import DIGEST_SIZE, MIN_SLOTS, HashComm, LineCounts, SortedComm
+from dffs.sort import ExternalSort
+
+
+def run(comm: HashComm, a: bytes, b: bytes) -> bytes:
+    out = BytesIO()
+    assert comm(BytesIO(a), BytesIO(b), out) == 0
+    return out.getvalue()
+
+
+class TestLineCounts:
+    """Test the hashed line multiset."""
+
+    def test_take_and_unmatched(self):
+        """Test duplicates are matched one for one, and unmatched occurrences replayed in order."""
+        lines = LineCounts()
+        lines.read(BytesIO(b'b\na\nb\nc'))
+        assert lines.take(b'b')
+        assert not lines.take(b'd')
+        assert lines.take(b'b')
+        assert not lines.take(b'b')
+        assert list(lines.unmatched()) == [b'a', b'c']
+
+    def test_slot_collision(self):
+        """Test lines whose digests start at the same slot are still told apart."""
+        def slot(line: bytes) -> int:
+            return int.from_bytes(blake2b(line, digest_size=DIGEST_SIZE).digest()[:8], 'little') % MIN_SLOTS
+
+        seen = {}
+        a, b = next( (seen[slot(line)], line) for line in (b'%d' % i for i in range(10 * MIN_SLOTS)) if seen.setdefault(slot(line), line) != line )
+        lines = LineCounts()
+        lines.read(BytesIO(a + b'\n' + b + b'\n' + a + b'\n'))
+        assert list(lines.counts) == [2, 1]
+        assert lines.take(b)
+        assert not lines.take(b'c')
+        assert list(lines.unmatched()) == [a, a]
+
+    def test_digest_collision(self, monkeypatch):
+        """Test lines whose digests collide are still told apart (by comparing them to the spooled lines)."""
+        class Constant:
+            def __init__(self, data, digest_size):
+                pass
+
+            def digest(self):
+                return bytes(DIGEST_SIZE)
+
+        monkeypatch.setattr('dffs.comm.blake2b', Constant)
+        lines = LineCounts()
+        lines.read(BytesIO(b'a\nb\na\nc\n'))
+        assert list(lines.counts) == [2, 1, 1]
+        assert lines.take(b'b')
+        assert not lines.take(b'b')
+        assert not lines.take(b'd')
+        assert list(lines.unmatched()) == [b'a', b'a', b'c']
+
+    def test_grow(self):
+        """Test the table grows (keeping every entry) as distinct lines are added."""
+        lines = LineCounts()
+        lines.read(BytesIO(b''.join(b'%d\n' % (i % 5000) for i in range(10000))))
+        assert len(lines.slots) > MIN_SLOTS
+        assert list(lines.counts) == [2] * 5000
+        assert all(lines.take(b'%d' % i) for i in range(0, 5000, 2))
+        assert len(list(lines.unmatched())) == 7500
+
+    def test_case_insensitive(self):
+        lines = LineCounts(case_insensitive=True)
+        lines.read(BytesIO(b'Foo\n'))
+        assert lines.take(b'fOO')
+
+
+class TestHashComm:
+    """Test ``comm``-style output from unsorted inputs."""
+
+    A = b'c\na\nb\na\n'
+    B = b'd\na\nc\n'
+
+    def test_columns(self):
+        """Test columns 1 and 3 follow the first input's order, then column 2 the second's."""
+        assert run(HashComm(), self.A, self.B) == b'\t\tc\n\t\ta\nb\na\n\td\n'
+
+    @pytest.mark.parametrize('excludes, expected', [
+        ((1,), b'\tc\n\ta\nd\n'),
+        ((2,), b'\tc\n\ta\nb\na\n'),
+        ((3,), b'b\na\n\td\n'),
+        ((1, 2), b'c\na\n'),
+        ((1, 2, 3), b''),
+    ])
+    def test_excludes(self, excludes, expected):
+        comm = HashComm(**{f'exclude_{col}': True for col in excludes})
+        assert run(comm, self.A, self.B) == expected
+
+    def test_case_insensitive(self):
+        """Test ``case_insensitive`` matches lines differing in case, printing the first input's."""
+        assert run(HashComm(case_insensitive=True), b'Foo\nbar\n', b'BAR\n') == b'Foo\n\t\tbar\n'
+
+    def test_counts(self):
+        assert run(HashComm(counts=True), self.A, self.B) == b'2\t1\t2\n'
+        assert run(HashComm(counts=True, exclude_3=True), self.A, self.B) == b'2\t1\n'
+
+    def test_spill(self):
+        """Test a second input larger than ``spool_size`` is spilled to disk and read back intact."""
+        a = b''.join(b'%d\n' % i for i in range(0, 20000, 2))
+        b = b''.join(b'%d\n' % i for i in range(20000))
+        comm = HashComm(exclude_1=True, exclude_3=True, spool_size=1024)
+        assert run(comm, a, b) == b''.join(b'%d\n' % i for i in range(1, 20000, 2))
+
+
+class TestSortedComm:
+    """Test ``comm`` output from inputs sorted in-process."""
+
+    def test_columns(self):
+        """Test output matches ``comm`` on (byte-order) sorted inputs, with duplicates matched one for one."""
+        assert run(SortedComm(), b'c\na\nb\na\n', b'd\na\nc\n') == b'\t\ta\na\nb\n\t\tc\n\td\n'
+
+    def test_spilled(self):
+        """Test inputs larger than the sort's memory budget."""
+        a = b''.join(b'%d\n' % i for i in range(20000, 0, -1))
+        b = b''.join(b'%d\n' % i for i in range(10000, 30000))
+        comm = SortedComm(counts=True, sort=ExternalSort(memory=10000, jobs=2))
+        assert run(comm, a, b) == b'9999\t9999\t10001\n'
+        assert comm.sort.pool is None
+
+    def test_case_insensitive(self):
+        assert run(SortedComm(case_insensitive=True), b'B\na\n', b'A\nc\n') == b'\t\ta\nB\n\tc\n'
@@ -114,6 +114,51 @@ class TestCommXPipelines:
         assert result.exit_code == 0
 
 
+class TestCommXUnsorted:
+    """Test comm-x's hash-based comparison of unsorted inputs (-u/--unsorted)."""
+
+    def test_unsorted(self, temp_files):
+        """Test unsorted inputs compare like sorted ones, with columns in input order."""
+        file1, file2 = temp_files
+        file1.write_text('c\na\nb\n')
+        file2.write_text('d\nc\nb\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['-u', str(file1), str(file2)])
+        assert result.exit_code == 0
+        assert result.output == '\t\tc\na\n\t\tb\n\td\n'
+        result = runner.invoke(main, ['-u', '-12', 'tac', str(file1), str(file2)])
+        assert result.exit_code == 0
+        assert result.output == 'b\nc\n'
+
+    def test_counts(self, temp_files):
+        """Test --counts prints per-column line counts."""
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['--counts', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 0
+        assert result.output == '1\t1\t2\n'
+
+
+class TestCommXSort:
+    """Test comm-x's in-process sort (--sort)."""
+
+    def test_sort(self, temp_files):
+        """Test --sort compares unsorted inputs like `comm` on sorted ones."""
+        file1, file2 = temp_files
+        file1.write_text('c\na\nb\n')
+        file2.write_text('d\nc\nb\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['--sort', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 0
+        assert result.output == 'a\n\t\tb\n\t\tc\n\td\n'
+
+    def test_sort_and_unsorted_conflict(self, temp_files):
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['--sort', '-u', str(file1), str(file2)])
+        assert result.exit_code != 0
+
+
 class TestCommXErrors:
     """Test comm-x error handling."""
 
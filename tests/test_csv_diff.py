@@ -0,0 +1,78 @@
+"""Tests for keyed CSV row diffs."""
+import gc
+from io import BytesIO
+
+import pytest
+
+from dffs.csv_diff import CsvDiff
+from dffs.utils import ComparatorError
+
+A = b'id,name,city\n1,alice,NYC\n2,bob,LA\n3,carol,"Portland, OR"\n'
+B = b'id,name,city\n4,dave,SF\n3,carol,Portland\n1,alice,NYC\n'
+
+
+def run(diff: CsvDiff, a: bytes, b: bytes, returncode: int = 1) -> str:
+    out = BytesIO()
+    assert diff(BytesIO(a), BytesIO(b), out) == returncode
+    return out.getvalue().decode()
+
+
+class TestCsvDiff:
+    def test_keyed(self):
+        """Test rows are matched by key regardless of order, with removed/changed rows first, then added ones."""
+        assert run(CsvDiff(key=('id',)), A, B) == (
+            '- id=2: name=bob, city=LA\n'
+            '~ id=3: city: "Portland, OR" -> Portland\n'
+            '+ id=4: name=dave, city=SF\n'
+        )
+
+    def test_same(self):
+        """Test reordered rows (and columns) compare equal."""
+        b = b'city,id,name\nLA,2,bob\n"Portland, OR",3,carol\nNYC,1,alice\n'
+        assert run(CsvDiff(key=('id',)), A, b, returncode=0) == ''
+
+    def test_composite_key_and_columns(self):
+        """Test multi-column keys, and columns present on only one side."""
+        a = b'k1,k2,v,old\na,1,x,o\na,2,y,o\n'
+        b = b'k2,k1,v,new\n1,a,x,n\n2,a,z,n\n'
+        assert run(CsvDiff(key=('k1', 'k2')), a, b) == (
+            'columns: -old +new\n'
+            '~ k1=a,k2=2: v: y -> z\n'
+        )
+
+    def test_empty_side(self):
+        """Test an empty input (e.g. a file missing on one side) has every row of the other added."""
+        assert run(CsvDiff(key=('id',)), b'', b'id,v\n1,x\n') == '+ id=1: v=x\n'
+
+    def test_errors(self):
+        """Test missing key columns and duplicate keys raise a ``ComparatorError`` (exit code 2), after any differences
+        found before them are written."""
+        with pytest.raises(ComparatorError, match=r'--csv-key: Key column\(s\) not found in input 1: id \(header: a, b\)') as exc:
+            run(CsvDiff(key=('id',)), b'a,b\n', B)
+        assert exc.value.returncode == 2
+        with pytest.raises(ComparatorError, match='Duplicate key in input 2: id=1'):
+            run(CsvDiff(key=('id',)), A, B + b'1,x,y\n')
+        out = BytesIO()
+        with pytest.raises(ComparatorError, match='Duplicate key in input 1: id=2'):
+            CsvDiff(key=('id',))(BytesIO(A + b'2,x,y\n'), BytesIO(B), out)
+        assert out.getvalue() == b'- id=2: name=bob, city=LA\n~ id=3: city: "Portland, OR" -> Portland\n'
+
+    def test_gc_scope(self):
+        """Test GC is only paused while loading the second input, not while records are consumed."""
+        diff = CsvDiff(key=('id',))
+        _, _, records = diff.records(BytesIO(A), BytesIO(B))
+        assert gc.isenabled()
+        next(records)
+        assert gc.isenabled()
+        list(records)
+        assert gc.isenabled()
+
+    def test_partitioned(self, tmp_path):
+        """Test inputs larger than the memory budget are joined partition by partition, with the same records."""
+        a = b'id,v\n' + b''.join(b'%d,%d\n' % (i, i) for i in range(1000))
+        b = b'id,v\n' + b''.join(b'%d,%d\n' % (i, i + (i % 100 == 0)) for i in range(999, 1, -1)) + b'1000,x\n'
+        expected = run(CsvDiff(key=('id',)), a, b)
+        partitioned = run(CsvDiff(key=('id',), memory=1000, partitions=4, spill_dir=str(tmp_path)), a, b)
+        assert sorted(partitioned.splitlines()) == sorted(expected.splitlines())
+        assert len(expected.splitlines()) == 2 + 9 + 1
+        assert list(tmp_path.iterdir()) == []
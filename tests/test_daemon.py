@@ -0,0 +1,150 @@
+"""Tests for `dffs serve`, and CLI invocations handed to it by `dffs.client`."""
+import os
+import re
+import subprocess
+import sys
+import time
+from os.path import dirname, exists
+
+import pytest
+
+import dffs
+from dffs.client import connect, find_root, send, socket_path
+
+ROOT = dirname(dirname(dffs.__file__))
+
+
+def python(*code_args: str, cwd, env, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, '-c', *code_args], cwd=cwd, env=env, capture_output=True, text=True, **kwargs)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Git repository with a committed file, modified in the worktree."""
+    repo = tmp_path / 'repo'
+    repo.mkdir()
+    for cmd in (['init'], ['config', 'user.email', 'test@example.com'], ['config', 'user.name', 'Test User']):
+        subprocess.run(['git', *cmd], cwd=repo, check=True, capture_output=True)
+    (repo / 'f.txt').write_text('b\na\n')
+    subprocess.run(['git', 'add', 'f.txt'], cwd=repo, check=True, capture_output=True)
+    subprocess.run(['git', 'commit', '-m', 'Add f.txt'], cwd=repo, check=True, capture_output=True)
+    (repo / 'f.txt').write_text('c\na\n')
+    return str(repo)
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    """Environment for CLI and daemon processes, with sockets (for them and this process) under ``tmp_path``."""
+    runtime = tmp_path / 'run'
+    runtime.mkdir()
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(runtime))
+    env = { k: v for k, v in os.environ.items() if k not in ('GIT_DIR', 'GIT_WORK_TREE', 'DFFS_DAEMON') }
+    return dict(env, XDG_RUNTIME_DIR=str(runtime), PYTHONPATH=ROOT)
+
+
+@pytest.fixture
+def daemon(repo, env, tmp_path):
+    """A `dffs serve -v` process for ``repo``; yields the path of its log."""
+    log = tmp_path / 'serve.log'
+    with open(log, 'w') as f:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'dffs.main', 'serve', '-v', '-i', '30'],
+            cwd=repo, env=env, stderr=f,
+        )
+    sock = socket_path(find_root(repo))
+    deadline = time.monotonic() + 30
+    while not exists(sock):
+        assert proc.poll() is None and time.monotonic() < deadline
+        time.sleep(.05)
+    yield log
+    python('from dffs.main import cli; cli()', 'serve', '--stop', cwd=repo, env=env)
+    proc.wait(timeout=10)
+
+
+GIT_DIFF_X = 'from dffs.client import git_diff_x; git_diff_x()'
+
+
+def test_forward(repo, env, daemon):
+    result = python(GIT_DIFF_X, 'sort', 'f.txt', cwd=repo, env=env)
+    assert result.returncode == 1
+    assert result.stdout == '2c2\n< b\n---\n> c\n'
+    assert 'git-diff-x sort f.txt' in daemon.read_text()
+
+    # Click usage errors are reported (to the client's stderr) as usual
+    result = python(GIT_DIFF_X, '--nope', 'f.txt', cwd=repo, env=env)
+    assert result.returncode == 2
+    assert 'No such option' in result.stderr
+
+
+def cat_files(pid: int) -> set[str]:
+    """PIDs of `git cat-file` processes started by process ``pid``."""
+    children = set()
+    for task in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{task}/children') as f:
+            children.update(f.read().split())
+    cat_files = set()
+    for child in children:
+        with open(f'/proc/{child}/cmdline', 'rb') as f:
+            if f.read().split(b'\0')[:2] == [b'git', b'cat-file']:
+                cat_files.add(child)
+    return cat_files
+
+
+@pytest.mark.skipif(not exists(f'/proc/{os.getpid()}/task/{os.getpid()}/children'), reason='needs /proc/<pid>/task/<tid>/children')
+def test_worker_reused(repo, env, daemon):
+    """Test a second request runs in the first's worker, reusing its `git cat-file` processes (and that the worker
+    releases each client's stdio when it finishes)."""
+    pids = []
+    procs = []
+    for _ in range(2):
+        result = python(GIT_DIFF_X, '-r', 'HEAD', 'sort', 'f.txt', cwd=repo, env=env, timeout=30)
+        assert result.returncode == 1
+        assert result.stdout == '2c2\n< b\n---\n> c\n'
+        pids = re.findall(r'worker (\d+)', daemon.read_text())
+        procs.append(cat_files(int(pids[-1])))
+    assert len(pids) == 2 and pids[0] == pids[1]
+    assert procs[0] and procs[0] == procs[1]
+
+
+def test_moved_executable(repo, env, daemon, tmp_path):
+    """Test a pipeline command moved (between directories on the same ``$PATH``) since a worker's previous request
+    is found again."""
+    bins = [ tmp_path / 'bin1', tmp_path / 'bin2' ]
+    env = dict(env, PATH=os.pathsep.join([*map(str, bins), env['PATH']]))
+    for bin in bins:
+        bin.mkdir()
+        script = tmp_path / 'my-sort'
+        script.write_text('#!/bin/sh\nexec sort "$@"\n')
+        script.chmod(0o755)
+        script.rename(bin / 'my-sort')
+        result = python(GIT_DIFF_X, 'my-sort', 'f.txt', cwd=repo, env=env, timeout=30)
+        assert result.returncode == 1, result.stderr
+        assert result.stdout == '2c2\n< b\n---\n> c\n'
+        (bin / 'my-sort').unlink()
+
+
+def test_fallback(repo, env, daemon):
+    # With `DFFS_DAEMON=0`, invocations run in-process
+    log = daemon.read_text()
+    result = python(GIT_DIFF_X, 'sort', 'f.txt', cwd=repo, env=dict(env, DFFS_DAEMON='0'))
+    assert result.returncode == 1
+    assert result.stdout == '2c2\n< b\n---\n> c\n'
+    assert daemon.read_text() == log
+
+
+def test_decline(repo, env, daemon):
+    root = find_root(repo)
+    sock = connect(socket_path(root))
+    with sock:
+        send(sock, dict(prog='git-diff-x', argv=[], cwd=repo, env={}, root=root, version='0.0.0'), fds=(0, 1, 2))
+        assert b'declined' in sock.makefile('rb').readline()
+    assert 'Declined version 0.0.0' in daemon.read_text()
+
+
+def test_idle_timeout(repo, env):
+    proc = subprocess.run(
+        [sys.executable, '-m', 'dffs.main', 'serve', '-i', '1'],
+        cwd=repo, env=env, capture_output=True, timeout=30,
+    )
+    assert proc.returncode == 0
+    assert not os.listdir(os.path.join(env['XDG_RUNTIME_DIR'], 'dffs'))
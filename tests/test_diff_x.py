@@ -1,4 +1,5 @@
 """Tests for diff-x CLI."""
+import json
 import signal
 import pytest
 import tempfile
@@ -49,6 +50,15 @@ class TestDiffXBasic:
         result = runner.invoke(main, ['cat', str(file1), str(file2)])
         assert result.exit_code == 1  # Files have different content
 
+    def test_diff_with_pipeline_output(self, temp_files):
+        """Test diff-x streams the comparator's output to stdout."""
+        file1, file2 = temp_files
+
+        runner = CliRunner()
+        result = runner.invoke(main, ['--no-color', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == '2c2\n< bar\n---\n> baz\n'
+
 
 class TestDiffXOptions:
     """Test diff-x CLI options."""
@@ -181,3 +191,291 @@ class TestDiffXSignals:
         assert 'Usage:' in result.output
         assert 'diff-x' in result.output
         assert 'Traceback' not in result.output
+
+
+class TestDiffXIdentical:
+    """Test skipping pipelines for identical inputs."""
+
+    def test_same_path(self, temp_files):
+        """Test diffing a file against itself doesn't run any pipelines."""
+        file1, _ = temp_files
+        runner = CliRunner()
+        with patch('dffs.diff_x.join_pipelines') as join:
+            result = runner.invoke(main, ['cat', str(file1), str(file1)])
+        assert result.exit_code == 0
+        assert result.output == ''
+        join.assert_not_called()
+
+    def test_skip_identical(self, tmp_path):
+        """Test --skip-identical skips pipelines for different paths with equal contents (only)."""
+        (tmp_path / 'a').write_text('x\n')
+        (tmp_path / 'b').write_text('x\n')
+        runner = CliRunner()
+        args = ['wc -l', str(tmp_path / 'a'), str(tmp_path / 'b')]
+        with patch('dffs.diff_x.join_pipelines', return_value=1) as join:
+            assert runner.invoke(main, args).exit_code == 1
+            join.assert_called_once()
+        with patch('dffs.diff_x.join_pipelines') as join:
+            assert runner.invoke(main, ['--skip-identical', *args]).exit_code == 0
+            join.assert_not_called()
+
+
+
+class TestDiffXPyStages:
+    """Test Python transform stages in diff-x pipelines."""
+
+    def test_py_first_stage(self, temp_files):
+        """Test a leading Python stage reads each file's contents."""
+        file1, file2 = temp_files
+        file2.write_text('FOO\nBAR\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['py:tests.test_transforms:upper', str(file1), str(file2)])
+        assert result.exit_code == 0
+        result = runner.invoke(main, ['cat', 'py:tests.test_transforms:upper', str(file1), str(file2)])
+        assert result.exit_code == 0
+
+    def test_builtin(self, tmp_path):
+        """Test built-in (``@``) transforms, via ``-x``."""
+        file1 = tmp_path / 'a.json'
+        file2 = tmp_path / 'b.json'
+        file1.write_text('{"b": 1, "a": [1.0]}')
+        file2.write_text('{\n  "a": [1],\n  "b": 1\n}\n')
+        result = CliRunner().invoke(main, ['-x', '@json-canon', str(file1), str(file2)])
+        assert result.exit_code == 0
+
+
+class TestDiffXEngine:
+    """Test the in-process diff engine (-e/--engine)."""
+
+    @pytest.mark.parametrize('engine', ['myers', 'patience', 'histogram'])
+    def test_engine(self, temp_files, engine):
+        """Test in-process diffs (with and without a pipeline) match `diff`'s output."""
+        file1, file2 = temp_files
+        runner = CliRunner()
+        for args in (['cat', str(file1), str(file2)], [str(file1), str(file2)]):
+            result = runner.invoke(main, ['-e', engine, *args])
+            assert result.exit_code == 1
+            assert result.output == '2c2\n< bar\n---\n> baz\n'
+
+    def test_engine_unified(self, temp_files):
+        """Test -U output from the in-process engine is labeled with the input paths."""
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['-e', 'myers', '-U', '1', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == f'--- {file1}\n+++ {file2}\n@@ -1,2 +1,2 @@\n foo\n-bar\n+baz\n'
+
+
+class TestDiffXCsvKey:
+    """Test keyed CSV diffs (--csv-key)."""
+
+    def test_csv_key(self, tmp_path):
+        file1 = tmp_path / 'a.csv'
+        file2 = tmp_path / 'b.csv'
+        file1.write_text('id,v\n1,x\n2,y\n')
+        file2.write_text('id,v\n3,z\n1,w\n')
+        runner = CliRunner()
+        for args in (['cat', str(file1), str(file2)], [str(file1), str(file2)]):
+            result = runner.invoke(main, ['--csv-key', 'id', *args])
+            assert result.exit_code == 1
+            assert result.output == '~ id=1: v: x -> w\n- id=2: v=y\n+ id=3: v=z\n'
+
+    @pytest.mark.parametrize('args, msg', [
+        (['--csv-key', 'nope'], '--csv-key: Key column(s) not found in input 1: nope (header: id, v)'),
+        (['--csv-key', 'id'], '--csv-key: Duplicate key in input 2: id=0'),
+    ])
+    @pytest.mark.parametrize('pipeline', [['cat'], ['sort'], []])
+    def test_key_errors(self, tmp_path, args, msg, pipeline):
+        """Test key errors exit 2 (not a traceback, nor 0 from pipelines killed by SIGPIPE, with inputs larger than a
+        pipe buffer), and are logged instead of pipeline failures."""
+        rows = ''.join(f'{i},{"x" * 10}\n' for i in range(20000))
+        file1 = tmp_path / 'a.csv'
+        file2 = tmp_path / 'b.csv'
+        file1.write_text('id,v\n' + rows)
+        file2.write_text('id,v\n0,y\n' + rows)
+        with patch('dffs.utils.err') as err:
+            result = CliRunner().invoke(main, [*args, *pipeline, str(file1), str(file2)])
+        assert result.exit_code == 2
+        assert result.output == ''
+        msgs = [ call.args[0] for call in err.call_args_list ]
+        if pipeline == ['sort']:
+            # The header is sorted after the rows, so no "id" column is found
+            assert len(msgs) == 1 and msgs[0].startswith('--csv-key: Key column(s) not found in input 1: ')
+        else:
+            assert msgs == [msg]
+
+
+class TestDiffXTimings:
+    """Test --timings/--timings-json reports (logged to stderr)."""
+
+    def test_timings_table(self, temp_files):
+        file1, file2 = temp_files
+        runner = CliRunner()
+        with patch('dffs.diff_x.err') as err:
+            result = runner.invoke(main, ['--timings', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == '2c2\n< bar\n---\n> baz\n'
+        lines = [ call.args[0] for call in err.call_args_list ]
+        assert lines[0] == 'Timings:'
+        assert lines[1].split() == ['Side', 'Command', 'Wall', 'User', 'Sys', 'Max', 'RSS', 'Exit']
+        assert lines[2].startswith(f'1     cat {file1}')
+        assert lines[4].startswith('cmp   diff')
+        assert lines[5] == 'Pipe 1 → cmp: 8B, 2 lines'
+
+    def test_timings_json(self, temp_files):
+        file1, file2 = temp_files
+        runner = CliRunner()
+        with patch('dffs.diff_x.err') as err:
+            result = runner.invoke(main, ['--timings-json', '-e', 'myers', 'py:dffs.normalize:sort', str(file1), str(file2)])
+        assert result.exit_code == 1
+        timings = json.loads(err.call_args.args[0])
+        assert [ (s['side'], s['cmd'], s['returncode']) for s in timings['stages'] ] == [
+            (1, 'py:dffs.normalize:sort', 0),
+            (2, 'py:dffs.normalize:sort', 0),
+            (None, 'DiffEngine', 1),
+        ]
+        assert all(s['wall'] is not None and s['max_rss_kb'] is None for s in timings['stages'])
+        assert timings['pipes'] == [ {'side': 1, 'bytes': 8, 'lines': 2}, {'side': 2, 'bytes': 8, 'lines': 2} ]
+
+    def test_no_pipeline(self, temp_files, tmp_path):
+        """Test that a plain ``diff`` of two files (no pipeline) is still timed and traced."""
+        file1, file2 = temp_files
+        trace_path = tmp_path / 'trace.json'
+        with patch('dffs.diff_x.err') as err:
+            result = CliRunner().invoke(main, ['--timings', '--trace', str(trace_path), str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == '2c2\n< bar\n---\n> baz\n'
+        lines = [ call.args[0] for call in err.call_args_list ]
+        assert lines[0] == 'Timings:' and lines[2].startswith('cmp   diff')
+        events = json.loads(trace_path.read_text())['traceEvents']
+        assert [ e['name'] for e in events if e['ph'] == 'X' ] == ['comparison', 'diff']
+
+
+class TestDiffXAgainst:
+    """Test --against: diffing several files against one baseline."""
+
+    @pytest.fixture
+    def files(self, tmp_path):
+        paths = {}
+        for name, text in [ ('base', 'b\na\n'), ('same', 'a\nb\n'), ('diff', 'c\na\n'), ('same2', 'b\na\n') ]:
+            paths[name] = tmp_path / f'{name}.txt'
+            paths[name].write_text(text)
+        return paths
+
+    def test_baseline_runs_once(self, files, tmp_path):
+        log = tmp_path / 'runs.log'
+        # Logs each path it's run on, then sorts it
+        cmd = f"""sh -c 'echo "$0" >> {log}; sort "$0"'"""
+        runner = CliRunner()
+        with patch('dffs.diff_x.err') as err:
+            result = runner.invoke(main, [
+                '--against', str(files['base']), cmd, '-', str(files['same']), str(files['diff']), str(files['same2']),
+            ])
+        assert result.exit_code == 1
+        assert result.output == '2c2\n< b\n---\n> c\n'
+        runs = log.read_text().splitlines()
+        assert sorted(runs) == sorted(str(files[name]) for name in ('base', 'same', 'diff', 'same2'))
+        lines = [ call.args[0] for call in err.call_args_list ]
+        assert lines[3:] == [
+            f"1 of 3 files differ from {files['base']}",
+            f"  {files['same']}: same",
+            f"  {files['diff']}: differs",
+            f"  {files['same2']}: same",
+        ]
+
+    @pytest.mark.parametrize('jobs', ['1', '3'])
+    def test_jobs_output_order(self, files, jobs):
+        paths = [ str(files[name]) for name in ('diff', 'same', 'diff', 'same2') ]
+        runner = CliRunner()
+        with patch('dffs.diff_x.err') as err:
+            result = runner.invoke(main, ['--against', str(files['base']), '-j', jobs, '-x', 'sort', *paths])
+        assert result.exit_code == 1
+        assert result.output == '2c2\n< b\n---\n> c\n' * 2
+        lines = [ call.args[0] for call in err.call_args_list ]
+        assert lines[:4] == paths
+
+    def test_no_pipeline(self, files):
+        runner = CliRunner()
+        result = runner.invoke(main, ['--against', str(files['base']), str(files['same2'])])
+        assert result.exit_code == 0
+        assert result.output == ''
+
+    def test_failures(self, files):
+        runner = CliRunner()
+        with patch('dffs.diff_x.err') as err:
+            result = runner.invoke(main, ['--against', str(files['base']), '-x', 'sort', str(files['same']), 'missing.txt'])
+        assert result.exit_code == 2
+        lines = [ call.args[0] for call in err.call_args_list ]
+        assert 'Pipeline command failed: `sort missing.txt` (exit 2)' in lines
+        assert lines[-1] == '  missing.txt: failed (exit 2)'
+
+        # A failed baseline pipeline fails the whole comparison, without running any others
+        with patch('dffs.diff_x.err') as err:
+            result = runner.invoke(main, ['--against', 'missing.txt', '-x', 'sort', str(files['same'])])
+        assert result.exit_code == 2
+        assert result.output == ''
+        assert err.call_args_list[0].args[0] == 'Pipeline command failed: `sort missing.txt` (exit 2)'
+
+
+class TestDiffXEarlyExit:
+    """Test -q/--brief and -H/--max-hunks."""
+
+    def test_brief(self, temp_files):
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['-q', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == f'{file1} {file2} differ: byte 7, line 2\n'
+
+        result = runner.invoke(main, ['-q', str(file1), str(file1)])
+        assert result.exit_code == 0
+        assert result.output == ''
+
+    def test_brief_stops_pipelines(self, temp_files):
+        """Test endless pipelines are stopped once they differ."""
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['-q', """sh -c 'cat "$0"; exec yes'""", str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == f'{file1} {file2} differ: byte 7, line 2\n'
+
+    def test_brief_conflicts(self, temp_files):
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['-q', '-w', 'cat', str(file1), str(file2)])
+        assert isinstance(result.exception, ValueError)
+
+    def test_max_hunks(self, tmp_path):
+        file1, file2 = tmp_path / 'a.txt', tmp_path / 'b.txt'
+        file1.write_text(''.join(f'{i}\n' for i in range(30)))
+        file2.write_text(''.join(f'{i}\n' for i in range(30) if i % 10))
+        runner = CliRunner()
+        result = runner.invoke(main, ['--no-color', '-H', '2', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == '1d0\n< 0\n11d9\n< 10\n'
+
+
+class TestDiffXChunked:
+    """Test --chunked (diff only the regions between matching content-defined chunks)."""
+
+    def test_matches_diff(self, tmp_path):
+        file1, file2 = tmp_path / 'a.txt', tmp_path / 'b.txt'
+        lines = [ f'{i}\n' for i in range(20_000) ]
+        file1.write_text(''.join(lines))
+        lines[5000] = 'x\n'
+        del lines[15_000:15_003]
+        file2.write_text(''.join(lines))
+        runner = CliRunner()
+        result = runner.invoke(main, ['--no-color', '--chunked', '-U', '1', 'cat', str(file1), str(file2)])
+        assert result.exit_code == 1
+        assert result.output == (
+            f'--- {file1}\n+++ {file2}\n'
+            '@@ -5000,3 +5000,3 @@\n 4999\n-5000\n+x\n 5001\n'
+            '@@ -15000,5 +15000,2 @@\n 14999\n-15000\n-15001\n-15002\n 15003\n'
+        )
+
+    def test_conflicts(self, temp_files):
+        file1, file2 = temp_files
+        runner = CliRunner()
+        result = runner.invoke(main, ['--chunked', '-q', 'cat', str(file1), str(file2)])
+        assert isinstance(result.exception, ValueError)
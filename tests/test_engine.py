@@ -0,0 +1,108 @@
+"""Tests for the in-process diff engine."""
+import subprocess
+from io import BytesIO
+
+import pytest
+
+from dffs.engine import ALGORITHMS, DiffEngine, Lines, changes, diff_blocks
+
+
+def run(engine: DiffEngine, a: bytes, b: bytes) -> tuple[int, bytes]:
+    out = BytesIO()
+    returncode = engine(BytesIO(a), BytesIO(b), out)
+    return returncode, out.getvalue()
+
+
+def gnu_diff(tmp_path, a: bytes, b: bytes, *args: str) -> tuple[int, bytes]:
+    (tmp_path / 'a').write_bytes(a)
+    (tmp_path / 'b').write_bytes(b)
+    proc = subprocess.run(['diff', *args, str(tmp_path / 'a'), str(tmp_path / 'b')], capture_output=True)
+    return proc.returncode, proc.stdout
+
+
+A = b''.join(b'line %d\n' % i for i in range(1, 21))
+B = A.replace(b'line 3\n', b'').replace(b'line 10\n', b'line ten\n') + b'line 21'
+
+
+class TestLines:
+    """Test line interning."""
+
+    def test_intern(self):
+        """Test repeated lines share an ID."""
+        ids, keys = Lines().read(BytesIO(b'a\nb\na\n'))
+        assert list(ids) == [0, 1, 0]
+        assert keys is ids
+
+    def test_ignore_whitespace_keys(self):
+        """Test lines differing only in whitespace get distinct IDs but equal keys."""
+        lines = Lines(ignore_whitespace=True)
+        ids, keys = lines.read(BytesIO(b'a b\nab\n a b \n'))
+        assert list(ids) == [0, 1, 2]
+        assert list(keys) == [0, 0, 0]
+
+
+class TestAlgorithms:
+    """Test each algorithm produces a valid, minimal-where-expected edit script."""
+
+    @pytest.mark.parametrize('algorithm', ALGORITHMS)
+    def test_matching_blocks(self, algorithm):
+        """Test matching blocks are increasing, and consistent with the inputs."""
+        lines = Lines()
+        a, _ = lines.read(BytesIO(A))
+        b, _ = lines.read(BytesIO(B))
+        blocks = diff_blocks(a, b, algorithm)
+        assert sum(n for _, _, n in blocks) == 18
+        for i, j, n in blocks:
+            assert a[i:i + n] == b[j:j + n]
+        assert changes(blocks, a, b) == [(2, 3, 2, 2), (9, 10, 8, 9), (20, 20, 19, 20)]
+
+    def test_unknown_algorithm(self):
+        with pytest.raises(ValueError):
+            diff_blocks(Lines().read(BytesIO(A))[0], Lines().read(BytesIO(B))[0], 'bogus')
+
+    def test_shift_boundaries(self):
+        """Test ambiguous deletions are placed where GNU diff puts them."""
+        _, out = run(DiffEngine(), b'a\nb\nb\nc\n', b'a\nb\nc\n')
+        assert out == b'3d2\n< b\n'
+
+
+class TestOutput:
+    """Test output formats match GNU diff's."""
+
+    def test_identical(self):
+        assert run(DiffEngine(), A, A) == (0, b'')
+
+    @pytest.mark.parametrize('algorithm', ALGORITHMS)
+    def test_normal(self, tmp_path, algorithm):
+        """Test normal output (including a missing trailing newline)."""
+        assert run(DiffEngine(algorithm=algorithm), A, B) == gnu_diff(tmp_path, A, B)
+
+    @pytest.mark.parametrize('context', [0, 1, 3])
+    def test_unified(self, tmp_path, context):
+        """Test unified output, with the (timestamped) file headers removed."""
+        returncode, out = run(DiffEngine(context=context), A, B)
+        gnu_returncode, gnu_out = gnu_diff(tmp_path, A, B, '-U', str(context))
+        assert returncode == gnu_returncode == 1
+        assert out.split(b'\n', 2)[:2] == [b'--- a', b'+++ b']
+        assert out.split(b'\n', 2)[2] == gnu_out.split(b'\n', 2)[2]
+
+    def test_color(self, tmp_path):
+        """Test colorized normal output."""
+        assert run(DiffEngine(color=True), A, B) == gnu_diff(tmp_path, A, B, '--color=always')
+
+    def test_ignore_whitespace(self, tmp_path):
+        """Test ``ignore_whitespace`` (like ``diff -w``) shows each input's own lines."""
+        a = b'a\nb c\nd\n'
+        b = b'a\n b  c\ne\n'
+        assert run(DiffEngine(ignore_whitespace=True), a, b) == gnu_diff(tmp_path, a, b, '-w')
+        assert run(DiffEngine(ignore_whitespace=True), a, a.replace(b' ', b'\t')) == (0, b'')
+
+    def test_max_hunks(self, tmp_path):
+        """Test ``max_hunks`` truncates normal output after N changes, and unified output after N hunks."""
+        returncode, out = run(DiffEngine(max_hunks=1), A, B)
+        assert returncode == 1
+        assert out == b'3d2\n< line 3\n'
+        _, full = gnu_diff(tmp_path, A, B, '-U', '1')
+        returncode, out = run(DiffEngine(context=1, max_hunks=2), A, B)
+        assert returncode == 1
+        assert out.split(b'\n', 2)[2] == full.split(b'\n', 2)[2].split(b'@@ -20')[0]
@@ -1,4 +1,5 @@
 """Tests for git-diff-x CLI."""
+import json
 import signal
 import pytest
 import tempfile
@@ -6,6 +7,7 @@ import subprocess
 from pathlib import Path
 from unittest.mock import patch
 from click.testing import CliRunner
+from dffs.cache import PipelineCache
 from dffs.git_diff_x import main
 
 
@@ -150,6 +152,53 @@ class TestGitDiffXPipelines:
         result = runner.invoke(main, ['-x', 'wc -l', 'test.txt'])
         assert result.exit_code == 1  # Difference in wc output format
 
+    def test_engine(self, git_repo, monkeypatch):
+        """Test -e/--engine diffs in-process, labeling unified output with each side's ref and path."""
+        monkeypatch.chdir(git_repo)
+        runner = CliRunner()
+        result = runner.invoke(main, ['-e', 'histogram', '-U', '0', '-R', 'HEAD', 'cat', 'test.txt'])
+        assert result.exit_code == 1
+        assert result.output == '--- HEAD^:test.txt\n+++ HEAD:test.txt\n@@ -2 +2 @@\n-bar\n+baz\n'
+
+    def test_csv_key(self, git_repo, monkeypatch):
+        """Test --csv-key compares HEAD and worktree CSVs by key, with or without a pipeline."""
+        monkeypatch.chdir(git_repo)
+        (git_repo / 'data.csv').write_text('id,v\n1,x\n2,y\n')
+        subprocess.run(['git', 'add', 'data.csv'], check=True, capture_output=True)
+        subprocess.run(['git', 'commit', '-m', 'Add data.csv'], check=True, capture_output=True)
+        (git_repo / 'data.csv').write_text('id,v\n2,z\n1,x\n')
+        runner = CliRunner()
+        for args in (['data.csv'], ['cat', 'data.csv']):
+            result = runner.invoke(main, ['--csv-key', 'id', *args])
+            assert result.exit_code == 1
+            assert result.output == '~ id=2: v: y -> z\n'
+
+    def test_brief(self, git_repo, monkeypatch):
+        """Test -q/--brief reports the first differing byte, with or without a pipeline."""
+        monkeypatch.chdir(git_repo)
+        runner = CliRunner()
+        for args in (['test.txt'], ['cat', 'test.txt']):
+            result = runner.invoke(main, ['-q', '-R', 'HEAD', *args])
+            assert result.exit_code == 1
+            assert result.output == 'HEAD^:test.txt HEAD:test.txt differ: byte 7, line 2\n'
+
+
+class TestGitDiffXCache:
+    """Test git-diff-x `--cache`."""
+
+    def test_cache_hits_on_rerun(self, git_repo, monkeypatch, tmp_path):
+        """Test that a second run reads both sides' pipeline outputs from the cache."""
+        monkeypatch.chdir(git_repo)
+        monkeypatch.setenv('DFFS_CACHE_DIR', str(tmp_path))
+        runner = CliRunner()
+        result = runner.invoke(main, ['--cache', '-r', 'HEAD^..HEAD', 'sort', 'test.txt'])
+        assert result.exit_code == 1
+        result = runner.invoke(main, ['--cache', '-r', 'HEAD^..HEAD', 'sort', 'test.txt'])
+        assert result.exit_code == 1
+        assert '< bar' in result.output
+        stats = PipelineCache().stats()
+        assert (stats['hits'], stats['misses']) == (2, 2)
+
 
 class TestGitDiffXMultiplePaths:
     """Test git-diff-x with multiple file paths."""
@@ -165,6 +214,200 @@ class TestGitDiffXMultiplePaths:
         result = runner.invoke(main, ['cat', '-', 'test.txt', 'test2.txt'], cwd=str(git_repo))
         assert result.exit_code in (0, 1)
 
+    @pytest.fixture
+    def many_paths(self, git_repo, monkeypatch):
+        """Commit 8 files, then modify the odd-numbered ones in the worktree."""
+        monkeypatch.chdir(git_repo)
+        paths = [ f'f{i}.txt' for i in range(8) ]
+        for i, path in enumerate(paths):
+            (git_repo / path).write_text(f'{i}\n')
+        subprocess.run(['git', 'add', *paths], cwd=git_repo, check=True, capture_output=True)
+        subprocess.run(['git', 'commit', '-m', 'Add files'], cwd=git_repo, check=True, capture_output=True)
+        for i, path in enumerate(paths):
+            if i % 2:
+                (git_repo / path).write_text(f'{i}\nchanged\n')
+        return paths
+
+    def test_all_paths_diffed(self, many_paths):
+        """Test that every path is diffed (not just the first), and exit codes are aggregated."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['--no-color', 'cat', '-', *many_paths])
+        assert result.exit_code == 1
+        assert result.output.count('> changed') == 4
+
+    def test_parallel_output_order(self, many_paths):
+        """Test that `-j` output matches serial output, in argument order."""
+        runner = CliRunner()
+        serial = runner.invoke(main, ['--no-color', 'cat', '-', *many_paths])
+        parallel = runner.invoke(main, ['--no-color', '-j', '4', 'cat', '-', *many_paths])
+        assert parallel.exit_code == serial.exit_code == 1
+        assert parallel.output == serial.output
+
+    def test_parallel_identical(self, many_paths):
+        """Test that `-j` exits 0 when no path differs."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-j', '0', 'cat', '-', *many_paths[::2]])
+        assert result.exit_code == 0
+        assert result.output == ''
+
+    def test_parallel_error_code(self, many_paths):
+        """Test that an error on any path takes precedence over differences."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-j', '4', 'cat', '-', *many_paths, 'nonexistent.txt'])
+        assert result.exit_code == 128
+
+    def test_parallel_trace(self, many_paths, tmp_path):
+        """Test that `--trace` writes a span per path, blob read, and stage, on a track per worker."""
+        trace_path = tmp_path / 'trace.json'
+        runner = CliRunner()
+        result = runner.invoke(main, ['-j', '2', '--trace', str(trace_path), 'cat', '-', *many_paths])
+        assert result.exit_code == 1
+        events = json.loads(trace_path.read_text())['traceEvents']
+        tracks = { e['tid']: e['args']['name'] for e in events if e['name'] == 'thread_name' }
+        spans = [ e for e in events if e['ph'] == 'X' ]
+        comparisons = [ e for e in spans if e['cat'] == 'comparison' ]
+        assert sorted(e['name'] for e in comparisons) == many_paths
+        assert { tracks[e['tid']] for e in comparisons } <= {'worker 1', 'worker 2'}
+        reads = [ e for e in spans if e['cat'] == 'blob' ]
+        assert len(reads) == 8 and all(e['args']['side'] == 1 for e in reads)
+        stages = [ e for e in spans if e['cat'] == 'stage' ]
+        assert len(stages) == 16
+        assert all(e['args']['exit'] == 0 and e['args']['pid'] for e in stages)
+        assert { tracks[e['tid']].split(' · ', 1)[1] for e in stages } == {'side 1 · stage 1', 'side 2 · stage 1'}
+        assert sorted(e['args']['bytes'] for e in stages if e['args']['lines'] == 2) == [10, 10, 10, 10]
+
+
+class TestGitDiffXAll:
+    """Test `-a/--all` (diff every changed file)."""
+
+    @pytest.fixture
+    def repo(self, git_repo, monkeypatch):
+        """Second commit modifies `a.json`, adds `b.txt`, deletes `c.txt`; `d.txt` is unchanged."""
+        monkeypatch.chdir(git_repo)
+
+        def commit(msg):
+            subprocess.run(['git', 'add', '-A'], cwd=git_repo, check=True, capture_output=True)
+            subprocess.run(['git', 'commit', '-m', msg], cwd=git_repo, check=True, capture_output=True)
+
+        (git_repo / 'a.json').write_text('{"x":1,"y":2}\n')
+        (git_repo / 'c.txt').write_text('c\n')
+        (git_repo / 'd.txt').write_text('d\n')
+        commit('v1')
+        (git_repo / 'a.json').write_text('{"y":2,"x":3}\n')
+        (git_repo / 'b.txt').write_text('b\n')
+        (git_repo / 'c.txt').unlink()
+        commit('v2')
+        return git_repo
+
+    def test_all_changed_files(self, repo):
+        """Test that only changed files are diffed, with added/deleted files compared against empty input."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '--no-color', '-R', 'HEAD', '-x', 'cat'])
+        assert result.exit_code == 1
+        assert result.output == (
+            '1c1\n< {"x":1,"y":2}\n---\n> {"y":2,"x":3}\n'
+            '0a1\n> b\n'
+            '1d0\n< c\n'
+        )
+
+    def test_pathspec(self, repo):
+        """Test that positional args filter the changed files."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '--no-color', '-R', 'HEAD', '-x', 'cat', '*.txt'])
+        assert result.exit_code == 1
+        assert result.output == '0a1\n> b\n1d0\n< c\n'
+
+    def test_glob_pipelines(self, repo):
+        """Test `-m GLOB=CMD` pipelines, skipping files that match no GLOB."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '--no-color', '-R', 'HEAD', '-m', '*.json=tr , "\\n"', '-m', '*.json=sort'])
+        assert result.exit_code == 1
+        assert result.output == '1,2c1,2\n< "y":2}\n< {"x":1\n---\n> "x":3}\n> {"y":2\n'
+
+    def test_worktree(self, repo):
+        """Test diffing HEAD vs. the worktree."""
+        (repo / 'd.txt').write_text('d\nd2\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '--no-color', '-x', 'cat'])
+        assert result.exit_code == 1
+        assert result.output == '1a2\n> d2\n'
+
+    def test_brief_without_pipeline(self, repo):
+        """Test `-q` compares files in-process (rather than falling back to `git diff`) without a pipeline."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '--no-color', '-q', '-R', 'HEAD'])
+        assert result.exit_code == 1
+        assert result.stdout == (
+            'HEAD^:a.json HEAD:a.json differ: byte 3, line 1\n'
+            'EOF on HEAD^:b.txt which is empty\n'
+            'EOF on HEAD:c.txt which is empty\n'
+        )
+
+    def test_max_hunks_without_pipeline(self, repo):
+        """Test `-H` limits each file's hunks (rather than falling back to `git diff`) without a pipeline."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '--no-color', '-H', '1', '-R', 'HEAD'])
+        assert result.exit_code == 1
+        assert result.stdout == (
+            '1c1\n< {"x":1,"y":2}\n---\n> {"y":2,"x":3}\n'
+            '0a1\n> b\n'
+            '1d0\n< c\n'
+        )
+
+    def test_no_changes(self, repo):
+        """Test that nothing is diffed when nothing changed."""
+        runner = CliRunner()
+        result = runner.invoke(main, ['-a', '-x', 'cat'])
+        assert result.exit_code == 0
+        assert result.output == ''
+
+
+class TestGitDiffXBisect:
+    """Test `-b/--bisect GOOD..BAD` (find the first commit whose output differs from GOOD's)."""
+
+    @pytest.fixture
+    def repo(self, tmp_path, monkeypatch):
+        """Repository with 20 commits changing `f.json`, whose `version` changes from 1 to 2 in the 13th; yields their
+        SHAs (oldest first)."""
+        monkeypatch.chdir(tmp_path)
+        for cmd in (['init'], ['config', 'user.email', 'test@example.com'], ['config', 'user.name', 'Test User']):
+            subprocess.run(['git', *cmd], check=True, capture_output=True)
+        shas = []
+        for idx in range(20):
+            (tmp_path / 'f.json').write_text(json.dumps({'version': 1 if idx < 12 else 2, 'idx': idx}) + '\n')
+            subprocess.run(['git', 'add', 'f.json'], check=True, capture_output=True)
+            subprocess.run(['git', 'commit', '-m', f'Commit {idx}'], check=True, capture_output=True)
+            shas.append(subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip())
+        return shas
+
+    def test_first_differing_commit(self, repo, tmp_path):
+        log = tmp_path / 'runs.log'
+        runner = CliRunner()
+        with patch('dffs.git_diff_x.err') as err:
+            result = runner.invoke(main, ['--no-color', '-b', f'{repo[0]}..', f"sh -c 'echo run >> {log}; jq .version'", 'f.json'])
+        assert result.exit_code == 1
+        assert result.stdout.startswith(f'commit {repo[12]}\n')
+        assert result.stdout.endswith('    Commit 12\n\n1c1\n< 1\n---\n> 2\n')
+        # GOOD, BAD, then one probe per halving of the 19 candidate commits (not one per commit)
+        runs = log.read_text().count('run\n')
+        assert runs <= 7
+        err.assert_called_once_with(f'{repo[12]} is the first commit whose output differs (19 commits, {runs} pipeline runs)')
+
+    def test_no_change(self, repo):
+        runner = CliRunner()
+        with patch('dffs.git_diff_x.err') as err:
+            result = runner.invoke(main, ['-b', f'{repo[0]}..{repo[11]}', 'jq .version', 'f.json'])
+        assert result.exit_code == 0
+        assert result.stdout == ''
+        # Only GOOD and BAD are transformed
+        err.assert_called_once_with(f"f.json: output at {repo[11]} matches {repo[0]}'s (11 commits, 2 pipeline runs)")
+
+    def test_invalid_combinations(self, repo):
+        runner = CliRunner()
+        result = runner.invoke(main, ['-b', f'{repo[0]}..', '-a'])
+        assert result.exit_code != 0
+        assert isinstance(result.exception, ValueError)
+
 
 class TestGitDiffXSubdir:
     """Test git-diff-x invoked from a subdirectory with `..`-containing paths."""
@@ -222,6 +465,29 @@ class TestGitDiffXErrors:
         assert 'Traceback' not in result.output
 
 
+class TestGitDiffXBlobs:
+    """Test reading Git sides' contents via `git cat-file`."""
+
+    def test_missing_path(self, git_repo, monkeypatch):
+        """Test a path that doesn't exist at the ref fails like `git show` would."""
+        monkeypatch.chdir(git_repo)
+        (git_repo / 'new.txt').write_text('new\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['cat', 'new.txt'])
+        assert result.exit_code == 128
+
+    def test_staged_diff_output(self, git_repo, monkeypatch):
+        """Test diffing HEAD vs. the index through a pipeline."""
+        monkeypatch.chdir(git_repo)
+        (git_repo / 'test.txt').write_text('foo\nqux\n')
+        subprocess.run(['git', 'add', 'test.txt'], cwd=git_repo, check=True, capture_output=True)
+        (git_repo / 'test.txt').write_text('unstaged\n')
+        runner = CliRunner()
+        result = runner.invoke(main, ['-t', '--no-color', 'grep -v foo', 'test.txt'])
+        assert result.exit_code == 1
+        assert result.output == '1c1\n< baz\n---\n> qux\n'
+
+
 class TestGitDiffXSignals:
     """Test signal handling in git-diff-x."""
 
@@ -253,3 +519,33 @@ class TestGitDiffXSignals:
 
             # Should exit with the signal's negative value
             assert result.exit_code == -signal.SIGKILL
+
+
+class TestGitDiffXIdentical:
+    """Test skipping pipelines for identical sides."""
+
+    def test_same_blob(self, git_repo, monkeypatch):
+        """Test a path whose blob is the same at both commits doesn't run any pipelines."""
+        monkeypatch.chdir(git_repo)
+        (git_repo / 'other.txt').write_text('x\n')
+        subprocess.run(['git', 'add', 'other.txt'], check=True, capture_output=True)
+        subprocess.run(['git', 'commit', '-m', 'Add other.txt'], check=True, capture_output=True)
+        runner = CliRunner()
+        with patch('dffs.git_diff_x.join_pipelines') as join:
+            result = runner.invoke(main, ['-r', 'HEAD^..HEAD', 'cat', 'test.txt'])
+        assert result.exit_code == 0
+        assert result.output == ''
+        join.assert_not_called()
+
+    def test_skip_identical_worktree(self, git_repo, monkeypatch):
+        """Test --skip-identical skips pipelines when the worktree file matches the committed blob."""
+        monkeypatch.chdir(git_repo)
+        runner = CliRunner()
+        with patch('dffs.git_diff_x.join_pipelines') as join:
+            result = runner.invoke(main, ['--skip-identical', 'cat', 'test.txt'])
+        assert result.exit_code == 0
+        join.assert_not_called()
+
+        (git_repo / 'test.txt').write_text('foo\nqux\n')
+        result = runner.invoke(main, ['--skip-identical', 'cat', 'test.txt'])
+        assert result.exit_code == 1
@@ -0,0 +1,73 @@
+"""Tests for git-log-x CLI."""
+import subprocess
+
+import pytest
+from click.testing import CliRunner
+
+from dffs.blobs import file_history
+from dffs.git_log_x import main
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    """Repository whose `f.txt` is added, reordered, changed, then reverted; yields its commit SHAs (oldest first)."""
+    monkeypatch.chdir(tmp_path)
+    for cmd in (['init'], ['config', 'user.email', 'test@example.com'], ['config', 'user.name', 'Test User']):
+        subprocess.run(['git', *cmd], check=True, capture_output=True)
+    shas = []
+    for text, msg in [
+        ('b\na\n', 'Add f.txt'),
+        ('a\nb\n', 'Sort f.txt'),
+        ('c\na\n', 'Change f.txt'),
+        ('b\na\n', 'Revert f.txt'),
+    ]:
+        (tmp_path / 'f.txt').write_text(text)
+        (tmp_path / 'g.txt').write_text(msg)
+        subprocess.run(['git', 'add', '.'], check=True, capture_output=True)
+        subprocess.run(['git', 'commit', '-m', msg], check=True, capture_output=True)
+        shas.append(subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True).strip())
+    # A commit not touching f.txt
+    (tmp_path / 'g.txt').write_text('other')
+    subprocess.run(['git', 'commit', '-am', 'Change g.txt'], check=True, capture_output=True)
+    return shas
+
+
+def test_file_history(repo):
+    commits = file_history('f.txt')
+    assert [ c.sha for c in commits ] == repo[::-1]
+    assert [ c.subject for c in commits ] == ['Revert f.txt', 'Change f.txt', 'Sort f.txt', 'Add f.txt']
+    assert commits[-1].old is None
+    assert commits[0].new == commits[-1].new
+    assert [ c.sha for c in file_history('f.txt', revs=[f'{repo[1]}..HEAD'], max_count=1) ] == [repo[3]]
+
+
+@pytest.mark.parametrize('jobs', ['1', '4'])
+def test_log(repo, tmp_path, jobs):
+    log = tmp_path.parent / f'runs-{jobs}.log'
+    runner = CliRunner()
+    result = runner.invoke(main, ['-j', jobs, '--no-color', f"sh -c 'echo run >> {log}; sort'", 'f.txt'])
+    assert result.exit_code == 0
+    # Three distinct blobs, plus the empty file before `f.txt` was added, are each transformed once
+    assert log.read_text() == 'run\n' * 4
+    entries = result.output.split('commit ')[1:]
+    # "Sort f.txt" didn't change the sorted contents
+    assert [ entry.split('\n')[0] for entry in entries ] == [repo[3], repo[2], repo[0]]
+    assert entries[0].endswith('    Revert f.txt\n\n2c2\n< c\n---\n> b\n')
+    assert entries[2].endswith('    Add f.txt\n\n0a1,2\n> a\n> b\n')
+
+
+def test_brief(repo):
+    runner = CliRunner()
+    result = runner.invoke(main, ['--no-color', '-q', '-n', '1', 'f.txt'])
+    assert result.exit_code == 0
+    short = repo[3][:12]
+    assert result.output.endswith(f'{short}^:f.txt {short}:f.txt differ: byte 1, line 1\n')
+
+
+def test_failures(repo):
+    runner = CliRunner()
+    result = runner.invoke(main, ['--no-color', 'grep -v c', 'f.txt'])
+    # The empty file's transform fails (`grep` matched nothing), so "Add f.txt" is skipped; later commits are shown
+    assert result.exit_code == 1
+    assert result.output.count('commit ') == 3
+    assert 'Add f.txt' not in result.output
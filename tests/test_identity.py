@@ -0,0 +1,48 @@
+"""Tests for identical-input checks."""
+import os
+import subprocess
+from dffs.blobs import Blob
+from dffs.identity import CHUNK_SIZE, git_blob_sha, matches_blob, same_contents
+
+
+class TestSameContents:
+    """Test chunked file comparison."""
+
+    def test_identical(self, tmp_path):
+        """Test files with equal contents (spanning several chunks) match."""
+        data = b'x' * (2 * CHUNK_SIZE + 5)
+        (tmp_path / 'a').write_bytes(data)
+        (tmp_path / 'b').write_bytes(data)
+        assert same_contents(str(tmp_path / 'a'), str(tmp_path / 'b'))
+
+    def test_different(self, tmp_path):
+        """Test files differing in size, or only in a late chunk, don't match."""
+        data = b'x' * (2 * CHUNK_SIZE)
+        (tmp_path / 'a').write_bytes(data)
+        (tmp_path / 'b').write_bytes(data[:-1] + b'y')
+        (tmp_path / 'c').write_bytes(data[:-1])
+        assert not same_contents(str(tmp_path / 'a'), str(tmp_path / 'b'))
+        assert not same_contents(str(tmp_path / 'a'), str(tmp_path / 'c'))
+
+    def test_non_regular(self, tmp_path):
+        """Test missing files and named pipes never match."""
+        (tmp_path / 'a').write_text('a\n')
+        assert not same_contents(str(tmp_path / 'a'), str(tmp_path / 'missing'))
+        fifo = tmp_path / 'fifo'
+        fifo_path = str(fifo)
+        os.mkfifo(fifo_path)
+        assert not same_contents(fifo_path, fifo_path)
+
+
+class TestGitBlobSha:
+    """Test in-process Git blob hashing."""
+
+    def test_matches_git_hash_object(self, tmp_path):
+        """Test hashes agree with `git hash-object`."""
+        path = tmp_path / 'a'
+        path.write_bytes(b'foo\nbar\n' * 1000)
+        expected = subprocess.check_output(['git', 'hash-object', str(path)], text=True).strip()
+        assert git_blob_sha(str(path)) == expected
+        assert matches_blob(str(path), Blob(expected, size=8000))
+        assert not matches_blob(str(path), Blob(expected, size=7999))
+        assert not matches_blob(str(path), Blob('0' * 40))
@@ -1,5 +1,8 @@
 """Tests for join_pipelines function."""
 import pytest
+from io import BytesIO
+from dffs.cache import PipelineCache
+from dffs.timings import Timings
 from dffs.utils import join_pipelines
 
 
@@ -190,3 +193,192 @@ class TestJoinPipelinesShellModes:
             shell=False,
         )
         assert returncode == 0
+
+
+class TestJoinPipelinesOutput:
+    """Test cases for streaming ``base_cmd`` output."""
+
+    def test_output_written_to_out(self):
+        """Test that ``base_cmd`` output is written to the ``out`` stream as bytes."""
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['echo foo'],
+            cmds2=['echo bar'],
+            shell=True,
+            out=out,
+        )
+        assert returncode == 1
+        assert out.getvalue() == b'1c1\n< foo\n---\n> bar\n'
+
+    def test_output_suppressed_on_failure(self):
+        """Test that ``base_cmd`` output is discarded when a pipeline fails."""
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['echo foo; exit 3'],
+            cmds2=['echo bar'],
+            shell=True,
+            out=out,
+        )
+        assert returncode == 3
+        assert out.getvalue() == b''
+
+    def test_output_spills_past_spool_size(self):
+        """Test that output larger than ``spool_size`` is passed through intact."""
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['seq 1 20000'],
+            cmds2=['seq 2 20001'],
+            shell=True,
+            out=out,
+            spool_size=1024,
+        )
+        assert returncode == 1
+        assert out.getvalue() == b'1d0\n< 1\n20000a20000\n> 20001\n'
+
+    def test_large_streaming_output(self):
+        """Test that ``base_cmd`` output larger than a pipe buffer doesn't stall the pipelines."""
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['comm', '-3'],
+            cmds1=['seq 1 200000 | LC_ALL=C sort'],
+            cmds2=['seq 200001 400000 | LC_ALL=C sort'],
+            shell=True,
+            out=out,
+            spool_size=4096,
+        )
+        assert returncode == 0
+        assert len(out.getvalue().splitlines()) == 400000
+
+
+class TestJoinPipelinesComparator:
+    """Test cases for in-process comparators."""
+
+    def test_comparator_reads_pipelines(self):
+        """Test a callable ``base_cmd`` is passed both pipelines' outputs, and its exit code is returned."""
+        seen = []
+
+        def compare(in1, in2, out):
+            seen.append((in1.read(), in2.read()))
+            out.write(b'compared\n')
+            return 7
+
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=compare,
+            cmds1=['echo foo'],
+            cmds2=['echo bar', 'tr a-z A-Z'],
+            shell=True,
+            out=out,
+        )
+        assert returncode == 7
+        assert seen == [(b'foo\n', b'BAR\n')]
+        assert out.getvalue() == b'compared\n'
+
+    def test_diff_engine(self):
+        """Test ``DiffEngine`` output matches ``diff``'s."""
+        from dffs.engine import DiffEngine
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=DiffEngine(),
+            cmds1=['seq 1 20000'],
+            cmds2=['seq 2 20001'],
+            shell=True,
+            out=out,
+        )
+        assert returncode == 1
+        assert out.getvalue() == b'1d0\n< 1\n20000a20000\n> 20001\n'
+
+    def test_comparator_output_suppressed_on_failure(self):
+        """Test an in-process comparator's output is discarded when a pipeline fails."""
+        from dffs.engine import DiffEngine
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=DiffEngine(),
+            cmds1=['echo foo; exit 3'],
+            cmds2=['echo bar'],
+            shell=True,
+            out=out,
+        )
+        assert returncode == 3
+        assert out.getvalue() == b''
+
+    @pytest.mark.parametrize('pipefail', [False, True])
+    def test_stops_early(self, pipefail):
+        """Test an early-stopping comparator's pipelines are terminated, without that counting as a failure."""
+        from dffs.cmp import Cmp
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=Cmp(labels=('1', '2')),
+            # Endless, after a differing first line
+            cmds1=['echo a; exec yes', 'cat'],
+            cmds2=['sh -c "echo b; exec sleep 60"'],
+            shell=True,
+            pipefail=pipefail,
+            out=out,
+        )
+        assert returncode == 1
+        assert out.getvalue() == b'1 2 differ: byte 1, line 1\n'
+
+    def test_stops_early_real_failures(self):
+        """Test pipelines that fail on their own are still reported, with an early-stopping comparator."""
+        from dffs.cmp import Cmp
+        logs = []
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=Cmp(),
+            cmds1=['echo a; exit 3'],
+            cmds2=['echo a'],
+            shell=True,
+            out=out,
+            log=logs.append,
+        )
+        assert returncode == 3
+        assert out.getvalue() == b''
+        assert logs == ['Pipeline command failed: `echo a; exit 3` (exit 3)']
+
+
+class TestJoinPipelinesTimings:
+    """Test per-stage resource usage collection."""
+
+    def test_timings(self):
+        timings = Timings()
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['printf "a\\nb\\n"', 'sort -r'],
+            cmds2=['printf "a\\n"'],
+            out=out,
+            timings=timings,
+        )
+        assert returncode == 1
+        assert out.getvalue() == b'1d0\n< b\n'
+        assert [ (s.side, s.cmd, s.returncode) for s in timings.stages ] == [
+            (None, 'diff', 1),
+            (1, 'printf "a\\nb\\n"', 0),
+            (1, 'sort -r', 0),
+            (2, 'printf "a\\n"', 0),
+        ]
+        for stage in timings.stages:
+            assert stage.wall >= 0 and stage.user >= 0 and stage.sys >= 0
+            assert stage.max_rss_kb > 0
+        assert [ (p.side, p.bytes, p.lines) for p in timings.pipes ] == [ (1, 4, 2), (2, 2, 1) ]
+
+    def test_timings_cached(self, tmp_path):
+        """Outputs being cached are also counted."""
+        cache = PipelineCache(root=str(tmp_path))
+        timings = Timings()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['echo foo'],
+            cmds2=['echo foo'],
+            out=BytesIO(),
+            cache=cache,
+            cache_keys=('k1', None),
+            timings=timings,
+        )
+        assert returncode == 0
+        assert [ (p.side, p.bytes, p.lines) for p in timings.pipes ] == [ (1, 4, 1), (2, 4, 1) ]
+        assert cache.get('k1').read_bytes() == b'foo\n'
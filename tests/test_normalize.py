@@ -0,0 +1,74 @@
+"""Tests for built-in normalizing transforms."""
+import pytest
+
+from dffs.transforms import fuse
+
+
+def run(cmd, data: bytes) -> bytes:
+    return b''.join(fuse([cmd])(data.splitlines(keepends=True)))
+
+
+class TestJson:
+    def test_json_canon(self):
+        """Test keys are sorted (recursively), numbers normalized, and output indented like ``jq -S .``."""
+        data = b'{"b": [1.0, 2.5, 1e2], "a": {"y": "\xc3\xa9", "x": null}}'
+        assert run('@json-canon', data) == (
+            '{\n'
+            '  "a": {\n'
+            '    "x": null,\n'
+            '    "y": "é"\n'
+            '  },\n'
+            '  "b": [\n'
+            '    1,\n'
+            '    2.5,\n'
+            '    100\n'
+            '  ]\n'
+            '}\n'
+        ).encode()
+
+    def test_json_canon_stream(self):
+        """Test multiple (multi-line) top-level values, and compact output."""
+        data = b'{"b": 1,\n "a": 2}\n[\n3\n] 4\n'
+        assert run('@json-canon:0', data) == b'{"a":2,"b":1}\n[3]\n4\n'
+
+    def test_json_canon_numbers(self):
+        """Test numbers a float can't hold exactly keep their digits (rather than rounding, or overflowing to
+        ``Infinity``), and big integers stay exact."""
+        data = b'[1.50, 1E300, 1e400, -1e400, 0.1000000000000000000001, 12345678901234567890123, 1e-400]'
+        assert run('@json-canon:0', data) == (
+            b'[1.5,1e+300,1e+400,-1e+400,0.1000000000000000000001,12345678901234567890123,1e-400]\n'
+        )
+
+    @pytest.mark.parametrize('value', ['NaN', 'Infinity', '-Infinity'])
+    def test_json_canon_non_finite(self, value):
+        with pytest.raises(ValueError, match=f'Non-finite number {value}'):
+            run('@json-canon', f'[{value}]'.encode())
+        with pytest.raises(ValueError, match='Non-finite'):
+            run('@ndjson-canon', f'{{"a": {value}}}\n'.encode())
+
+    def test_ndjson_canon(self):
+        data = b'{"b": 1, "a": 2.0}\n\n{"c": [1, {"z": 0, "y": 1}]}\n'
+        assert run('@ndjson-canon', data) == b'{"a":2,"b":1}\n{"c":[1,{"y":1,"z":0}]}\n'
+
+
+class TestCsv:
+    data = b'name,city,role\nalice,"Portland, OR",eng\nbob,NYC,"multi\nline"\n'
+
+    def test_csv_cols(self):
+        """Test columns are projected and reordered, with quoting (incl. multi-line fields) preserved."""
+        assert run('@csv-cols:role,name', self.data) == b'role,name\neng,alice\n"multi\nline",bob\n'
+
+    def test_csv_cols_missing(self):
+        with pytest.raises(ValueError, match='column.*not found: age'):
+            run('@csv-cols:name,age', self.data)
+
+    def test_csv_header(self):
+        assert run('@csv-header', self.data) == b'name\ncity\nrole\n'
+
+
+class TestSort:
+    def test_sort(self):
+        """Test byte-order sorting, with and without ``u``nique-ing, of input without a trailing newline."""
+        data = b'b\nB\na\nb'
+        assert run('@sort', data) == b'B\na\nb\nb\n'
+        assert run('@sort:u', data) == b'B\na\nb\n'
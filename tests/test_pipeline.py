@@ -0,0 +1,172 @@
+"""Tests for starting pipelines."""
+from io import BytesIO
+from subprocess import Popen
+
+import pytest
+
+from dffs.pipeline import direct_args, needs_shell, spawn, stderr_output
+from dffs.utils import join_pipelines
+
+
+def run(cmds, tmp_path, **kwargs):
+    path = tmp_path / 'out'
+    procs = spawn(cmds, str(path), **kwargs)
+    for p in procs:
+        p.wait()
+    return procs, path.read_bytes()
+
+
+class TestSpawn:
+    """Test ``spawn``."""
+
+    def test_multi_stage(self, tmp_path):
+        """Test piping commands together into an output file."""
+        procs, out = run(['printf "b\\na\\n"', 'sort'], tmp_path)
+        assert out == b'a\nb\n'
+        assert [p.returncode for p in procs] == [0, 0]
+
+    def test_stdin(self, tmp_path):
+        """Test feeding bytes to the first command."""
+        _, out = run(['sort', 'head -1'], tmp_path, stdin=b'b\na\n')
+        assert out == b'a\n'
+
+    def test_no_shell_splits_strings(self, tmp_path):
+        """Test that ``str`` commands are ``shlex``-split when ``shell=False``."""
+        _, out = run(['printf "%s\\n" "a b"', ['tr', ' ', '-']], tmp_path, shell=False)
+        assert out == b'a-b\n'
+
+    def test_stderr_output(self, tmp_path):
+        """Test that each command's stderr is captured."""
+        procs, _ = run(['echo oops >&2; exit 3'], tmp_path)
+        assert procs[0].returncode == 3
+        assert stderr_output(procs[0]) == b'oops\n'
+
+
+class TestDirect:
+    """Test running commands that don't need a shell directly."""
+
+    @pytest.mark.parametrize('cmd', [
+        'sort -u',
+        "jq -S '.[] | {a: $x}'",
+        'cut -d= -f2',
+        'grep "a b"',
+        'tr a\\ b',
+    ])
+    def test_simple(self, cmd):
+        assert not needs_shell(cmd)
+
+    @pytest.mark.parametrize('cmd', [
+        'sort | uniq',
+        'cat > out',
+        'cat *.txt',
+        'echo $HOME',
+        'echo "$HOME"',
+        'echo `date`',
+        'a && b',
+        'cat ~/x',
+        "unterminated 'quote",
+        'echo "a\\nb"',
+    ])
+    def test_needs_shell(self, cmd):
+        assert needs_shell(cmd)
+
+    def test_direct_args(self):
+        exe, args = direct_args("sort -k 2 'a b'")
+        assert exe.endswith('/sort')
+        assert args == ['sort', '-k', '2', 'a b']
+        # Builtins, variable assignments, and missing commands are left to the shell
+        assert direct_args('echo a') is None
+        assert direct_args('LC_ALL=C sort') is None
+        assert direct_args('no-such-command-dffs') is None
+
+    def test_spawn(self, tmp_path, monkeypatch):
+        """Test that simple stages run without a shell, but are reported as written."""
+        shells = []
+
+        def popen(args, **kwargs):
+            shells.append(kwargs['shell'])
+            return Popen(args, **kwargs)
+
+        monkeypatch.setattr('dffs.pipeline.Popen', popen)
+        procs, out = run(['sort -r', 'head -n 1', 'tr a-z A-Z | cat'], tmp_path, stdin=b'a\nb\n')
+        assert out == b'B\n'
+        assert [ p.args for p in procs ] == ['sort -r', 'head -n 1', 'tr a-z A-Z | cat']
+        assert shells == [False, False, True]
+        run(['sort -r'], tmp_path, stdin=b'', direct=False)
+        assert shells[-1] is True
+
+    def test_missing_command(self, tmp_path):
+        """Test that a missing command fails the same way with and without the shell."""
+        procs, _ = run(['no-such-command-dffs'], tmp_path, stdin=b'')
+        assert procs[0].returncode == 127
+        assert b'not found' in stderr_output(procs[0])
+
+
+class TestSpawnPyStages:
+    """Test Python stages in ``spawn``ed pipelines."""
+
+    def test_mixed(self, tmp_path):
+        """Test Python stages between shell commands, with consecutive ones fused into one stage."""
+        procs, out = run(
+            ['printf "> b\\n\\n> a\\n"', 'py:tests.test_transforms:strip_prefix "> "', 'py:drop-blank', 'sort', 'py:tests.test_transforms:upper'],
+            tmp_path,
+        )
+        assert out == b'A\nB\n'
+        assert len(procs) == 4
+        assert [p.returncode for p in procs] == [0, 0, 0, 0]
+
+    def test_first_stage_stdin(self, tmp_path):
+        """Test a leading Python stage reads ``stdin``."""
+        _, out = run(['py:tests.test_transforms:upper', 'sort'], tmp_path, stdin=b'b\na\n')
+        assert out == b'A\nB\n'
+
+    def test_no_shell(self, tmp_path):
+        """Test Python stages (with args) when commands are ``shlex``-split."""
+        _, out = run(['py:tests.test_transforms:strip_prefix x'], tmp_path, stdin=b'xa\nb\n', shell=False)
+        assert out == b'a\nb\n'
+
+    def test_error(self, tmp_path):
+        """Test an exception in a Python stage fails it, saving the traceback."""
+        procs, out = run(['echo a', 'py:tests.test_transforms:fail'], tmp_path)
+        assert procs[-1].returncode == 1
+        assert b"ValueError: bad line: b'a\\n'" in stderr_output(procs[-1])
+
+
+class TestJoinPipelinesInputs:
+    """Test feeding data to ``join_pipelines``' pipelines."""
+
+    def test_inputs(self):
+        """Test that ``inputs`` (bytes, or callables returning them) are fed to each pipeline."""
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['sort'],
+            cmds2=['sort'],
+            shell=True,
+            out=out,
+            inputs=(b'b\na\n', lambda: b'a\nc\n'),
+        )
+        assert returncode == 1
+        assert out.getvalue() == b'2c2\n< b\n---\n> c\n'
+
+    def test_py_stages(self):
+        """Test pipelines with Python stages, including one failing (whose output is then suppressed)."""
+        out = BytesIO()
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['echo a', 'py:tests.test_transforms:upper'],
+            cmds2=['echo A'],
+            shell=True,
+            out=out,
+        )
+        assert returncode == 0
+        returncode = join_pipelines(
+            base_cmd=['diff'],
+            cmds1=['echo a', 'py:tests.test_transforms:fail'],
+            cmds2=['echo A'],
+            shell=True,
+            out=out,
+            log=lambda msg: None,
+        )
+        assert returncode == 1
+        assert out.getvalue() == b''
@@ -0,0 +1,45 @@
+"""Tests for the in-process external-merge sort."""
+import random
+from io import BytesIO
+
+from dffs.sort import ExternalSort
+
+
+def lines(n: int, seed: int = 0) -> list[bytes]:
+    rng = random.Random(seed)
+    return [ b'%d' % rng.randrange(10 ** 6) for _ in range(n) ]
+
+
+class TestExternalSort:
+    """Test in-memory, spilled, and already-sorted inputs."""
+
+    def test_in_memory(self):
+        """Test inputs within the memory budget are sorted without spilling (in byte order)."""
+        data = b'b\nB\na\n\xc3\xa9\nab'
+        with ExternalSort() as sort:
+            result = sort.read(BytesIO(data))
+            assert result.spilled == 0
+            assert list(result) == [b'B', b'a', b'ab', b'b', b'\xc3\xa9']
+
+    def test_spilled(self, tmp_path):
+        """Test inputs beyond the memory budget are sorted in runs (by worker processes), then merged."""
+        unsorted = lines(20000)
+        with ExternalSort(memory=20000, jobs=2, spill_dir=str(tmp_path)) as sort:
+            result = sort.read(b'%s\n' % line for line in unsorted)
+            assert result.spilled > 1
+            assert not result.in_order
+            assert list(result) == sorted(unsorted)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_already_sorted(self):
+        """Test sorted inputs are passed through without sorting."""
+        with ExternalSort(memory=20000) as sort:
+            result = sort.read(b'%s\n' % line for line in sorted(lines(20000)))
+            assert result.spilled > 1
+            assert result.in_order
+            assert list(result) == sorted(lines(20000))
+            assert sort.pool is None
+
+    def test_case_insensitive(self):
+        with ExternalSort(case_insensitive=True) as sort:
+            assert list(sort.sort(BytesIO(b'b\nA\nC\n'))) == [b'A', b'b', b'C']
@@ -0,0 +1,32 @@
+"""Import-time budget for the CLI entry points (called from editor hooks and git aliases, so startup cost adds up)."""
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time (µs) allowed per entry point; well under the ~550ms they took when importing `utz`
+BUDGET_US = 300_000
+# Modules that should only be imported by the code paths that need them
+DEFERRED = ('utz', 'IPython', 'dffs.cache', 'dffs.chunked', 'dffs.csv_diff', 'dffs.comm', 'dffs.timings', 'dffs.trace', 'concurrent.futures')
+
+
+def import_times(module: str) -> dict[str, int]:
+    """Cumulative import time (µs) of each module imported by ``import {module}``, from ``python -X importtime``."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize('module', ['dffs.diff_x', 'dffs.comm_x', 'dffs.git_diff_x', 'dffs.git_log_x'])
+def test_import_time(module):
+    times = import_times(module)
+    assert not [ name for name in DEFERRED if name in times ]
+    assert times[module] < BUDGET_US
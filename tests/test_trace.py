@@ -0,0 +1,39 @@
+"""Tests for Chrome trace-event export."""
+import json
+from io import BytesIO
+
+from dffs.timings import Timings
+from dffs.trace import Trace
+from dffs.utils import join_pipelines
+
+
+def test_trace(tmp_path):
+    trace = Trace()
+    timings = Timings(label='a.txt')
+    returncode = join_pipelines(
+        base_cmd=['diff'],
+        cmds1=['printf "a\\nb\\n"', 'py:dffs.normalize:sort'],
+        cmds2=['printf "a\\n"'],
+        out=BytesIO(),
+        timings=timings,
+    )
+    assert returncode == 1
+    trace.add(timings)
+    path = tmp_path / 'trace.json'
+    trace.write(str(path))
+
+    events = json.loads(path.read_text())['traceEvents']
+    tracks = { e['tid']: e['args']['name'] for e in events if e['name'] == 'thread_name' }
+    spans = [ (e['name'], e['cat'], tracks[e['tid']]) for e in events if e['ph'] == 'X' ]
+    assert spans == [
+        ('a.txt', 'comparison', 'main'),
+        ('diff', 'comparator', 'main'),
+        ('printf "a\\nb\\n"', 'stage', 'main · side 1 · stage 1'),
+        ('py:dffs.normalize:sort', 'stage', 'main · side 1 · stage 2'),
+        ('printf "a\\n"', 'stage', 'main · side 2 · stage 1'),
+    ]
+    comparison, diff, printf, sort, _ = [ e for e in events if e['ph'] == 'X' ]
+    assert comparison['ts'] <= diff['ts'] and diff['ts'] + diff['dur'] <= comparison['ts'] + comparison['dur']
+    assert printf['args']['pid'] and printf['args']['exit'] == 0 and 'bytes' not in printf['args']
+    # Python stages have no process, but the pipeline's last stage reports the bytes it sent the comparator
+    assert 'pid' not in sort['args'] and sort['args']['bytes'] == 4 and sort['args']['lines'] == 2
@@ -0,0 +1,56 @@
+"""Tests for Python transform stages."""
+import pytest
+
+from dffs.transforms import fuse, is_py_stage, register, resolve
+
+
+def upper(lines):
+    for line in lines:
+        yield line.upper()
+
+
+def strip_prefix(lines, prefix):
+    prefix = prefix.encode()
+    for line in lines:
+        yield line[len(prefix):] if line.startswith(prefix) else line
+
+
+def fail(lines):
+    for line in lines:
+        raise ValueError(f"bad line: {line!r}")
+        yield line
+
+
+@register('drop-blank')
+def drop_blank(lines):
+    return (line for line in lines if line.strip())
+
+
+class TestResolve:
+    """Test parsing and looking up Python stages."""
+
+    def test_is_py_stage(self):
+        assert is_py_stage('py:mod:func')
+        assert is_py_stage(['py:mod:func', 'arg'])
+        assert is_py_stage(upper)
+        assert not is_py_stage('sort')
+        assert not is_py_stage(['python', '-c', 'pass'])
+
+    def test_resolve(self):
+        """Test transforms are found by module path or registered name."""
+        assert resolve('tests.test_transforms:upper') is upper
+        assert resolve('drop-blank') is drop_blank
+        with pytest.raises(ValueError):
+            resolve('no-such-transform')
+
+    def test_fuse(self):
+        """Test stages (with args) are composed into one function, applied in order."""
+        fn = fuse(['py:drop-blank', 'py:tests.test_transforms:strip_prefix "> "', upper])
+        assert list(fn([b'> a\n', b'\n', b'b\n'])) == [b'A\n', b'B\n']
+
+    def test_builtin(self):
+        """Test ``@<name>:<arg>`` stages resolve to built-in transforms, passing the argument."""
+        assert is_py_stage('@sort')
+        assert is_py_stage(['@csv-cols:a,b'])
+        fn = fuse(['@csv-cols:b', '@sort'])
+        assert list(fn([b'a,b\n', b'1,z\n', b'2,y\n'])) == [b'b\n', b'y\n', b'z\n']
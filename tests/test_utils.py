@@ -1,7 +1,7 @@
 """Tests for utility functions."""
 import pytest
 from pathlib import Path
-from dffs.utils import get_git_root, get_dir_path, _format_exit_code
+from dffs.utils import aggregate_returncodes, get_git_root, get_dir_path, _format_exit_code
 
 
 class TestGitHelpers:
@@ -64,3 +64,15 @@ class TestFormatExitCode:
         assert _format_exit_code(143) == "143 (SIGTERM)"
         # Unknown signal
         assert _format_exit_code(227) == "227 (signal 99)"
+
+
+class TestAggregateReturncodes:
+    """Test cases for combining per-comparison exit codes."""
+
+    def test_aggregate(self):
+        """Test errors take precedence over differences, which take precedence over matches."""
+        assert aggregate_returncodes([]) == 0
+        assert aggregate_returncodes([0, 0]) == 0
+        assert aggregate_returncodes([0, 1, 0]) == 1
+        assert aggregate_returncodes([1, 2, 128]) == 2
+        assert aggregate_returncodes([0, -9]) == -9